@@ -1,7 +1,10 @@
 
+import json
 from core.config.setting import static_setting
+from core.result.reporter import ResultNode, StepResult
 from core.testengine.testlist import TestList
 from core.testengine.caserunner import CaseRunner
+from core.testengine.shard import load_weights, merge_result_trees
 
 runner = None
 
@@ -32,12 +35,60 @@ def init_engine():
     runner = CaseRunner()
 
 
-def load_resource(resource_file, username):
+def load_resource(resource_file, username, broker=None):
     """
     装载测试资源
+    :param broker: 资源预约服务的socket路径，指定时从预约服务获取资源
     """
     global runner
-    runner.load_resource(resource_file, username)
+    runner.load_resource(resource_file, username, broker)
+
+
+def filter_failed_test(result_file):
+    """
+    根据之前的测试结果文件，只执行失败(FAIL/EXCEPTION)的测试用例以及它们的前置测试用例
+    """
+    global runner
+    with open(result_file) as file:
+        result = ResultNode.from_dict(json.load(file))
+    failed_cases = [node.header for node in
+                    result.get_case_nodes([StepResult.FAIL, StepResult.EXCEPTION])]
+    runner.filter_test_cases(failed_cases)
+
+
+def select_shard(shard_index, shard_count, weight_file=None):
+    """
+    只执行测试列表中属于当前分片的测试用例
+    """
+    global runner
+    weights = load_weights(weight_file) if weight_file else None
+    runner.select_shard(shard_index, shard_count, weights)
+
+
+def merge_results(result_files, output_file, testlist=None):
+    """
+    合并多个分片的测试结果文件，返回合并后的结果节点
+    :param testlist: 测试列表文件，指定时合并后的测试用例按照测试列表中的顺序排列
+    """
+    roots = list()
+    for result_file in result_files:
+        with open(result_file) as file:
+            roots.append(ResultNode.from_dict(json.load(file)))
+    test_list = None
+    if testlist is not None:
+        test_list = TestList(testlist)
+    merged = merge_result_trees(roots, test_list)
+    with open(output_file, "w") as file:
+        json.dump(merged.to_dict(), file, indent=4)
+    return merged
+
+
+def save_result(result_file):
+    """
+    将测试结果保存为json格式的文件
+    """
+    with open(result_file, "w") as file:
+        json.dump(runner.result_report.root.to_dict(), file, indent=4)
 
 
 def get_test_list():
@@ -49,12 +100,21 @@ def get_test_list():
     return rv
 
 
-def run_test():
+def get_progress():
+    """
+    获取执行进度以及预计剩余时间
+    """
+    if runner is None:
+        return {}
+    return runner.get_progress()
+
+
+def run_test(checkpoint_file=None):
     """
     执行测试用例
     """
     global runner
-    runner.start()
+    runner.start(checkpoint_file)
     runner.wait_for_test_done()
     print(runner.result_report.root.to_text())
     tp_stats = runner.result_report.root.get_test_point_stats()
@@ -62,6 +122,13 @@ def run_test():
     print(f"ERROR: {tp_stats[2]}, WARNING: {tp_stats[3]}, EXCEPTION: {tp_stats[4]}")
 
 
+def resume_test(checkpoint_file):
+    """
+    从断点记录恢复执行测试用例，跳过已经执行完毕的测试用例
+    """
+    run_test(checkpoint_file)
+
+
 if __name__ =="__main__":
     load_settings()
     init_engine()
@@ -30,6 +30,8 @@ class TestCaseBase(metaclass=ABCMeta):
         self.logger = reporter.case_logger
         self.test_data_var = dict()
         self.result = None
+        # The fixture shared by the cases in the same resource group
+        self.shared = dict()
 
     @abstractmethod
     def collect_resource(self, pool):
@@ -50,6 +52,20 @@ class TestCaseBase(metaclass=ABCMeta):
     def cleanup(self, *args):
         pass
 
+    def setup_shared(self):
+        """
+        Setup the shareable fixture, called once for consecutive cases
+        with the same shared_fixture and the same collected resources,
+        the fixture should be saved in self.shared
+        """
+        pass
+
+    def cleanup_shared(self):
+        """
+        Cleanup the shareable fixture at the group boundary
+        """
+        pass
+
     @property
     def output_var(self):
         """
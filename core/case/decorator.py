@@ -27,9 +27,17 @@ def case(priority =0,
          feature_name=None,
          testcase_id=None,
          pre_tests = None,
-         skip_if_high_priority_failed=False):
+         skip_if_high_priority_failed=False,
+         timeouts=None,
+         shared_fixture=None):
     """
     The Decorator for the test cases
+    :param timeouts: the timeout(seconds) of each phase,
+                     e.g. {"collect_resource": 60, "setup": 300, "test": 3600, "cleanup": 300}
+    :param shared_fixture: the name of the shareable fixture created by setup_shared,
+                           consecutive cases with the same fixture name and the same collected
+                           resources share one setup_shared/cleanup_shared when
+                           CaseRunnerSetting.group_by_resource is enabled
     """
     def decorator(cls):
         setattr(cls, "priority", priority)  # 测试用例的优先级
@@ -38,6 +46,8 @@ def case(priority =0,
         setattr(cls, "testcase_id", testcase_id)  # 测试用例对应的测试用例ID
         setattr(cls, "pre_tests", pre_tests if pre_tests else list())
         setattr(cls, "skip_if_high_priority_failed", skip_if_high_priority_failed)
+        setattr(cls, "timeouts", timeouts if timeouts else dict())  # 测试用例各个阶段的超时时间
+        setattr(cls, "shared_fixture", shared_fixture)  # 可以在相同资源的测试用例之间共享的测试环境
         return cls
     return decorator
 
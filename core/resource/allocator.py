@@ -0,0 +1,239 @@
+"""
+测试资源分配器
+
+将测试用例需要的所有设备作为一个整体求解：每个设备需求有类型、数量以及限制条件，
+连接限制条件的方案(比如STA、测试仪表端口)在整个分配中不能重复使用。
+使用带剪枝的回溯搜索，找到一致的分配方案，或者给出无法分配的原因
+"""
+from core.resource.pool import ResourceError, ResourceDevice, DevicePort, ConnectionConstraint
+
+
+class AllocationError(ResourceError):
+    """
+    无法找到满足所有设备需求的分配方案
+    :param reasons: 无法分配的原因列表
+    """
+    def __init__(self, reasons):
+        super().__init__("Cannot allocate resource:\n" + "\n".join(reasons))
+        self.reasons = reasons
+
+
+class DeviceRequest:
+    """
+    一个设备需求
+    :param role: 设备在测试用例中的角色名称，用于获取分配结果
+    :param device_type: 设备类型
+    :param count: 设备数量
+    :param constraints: 限制条件，ConnectionConstraint的连接方案由分配器统一选择
+    """
+    def __init__(self, role, device_type, count=1, constraints=list()):
+        self.role = role
+        self.device_type = device_type
+        self.count = count
+        self.constraints = [c for c in constraints if not isinstance(c, ConnectionConstraint)]
+        self.connection_constraints = [c for c in constraints if isinstance(c, ConnectionConstraint)]
+
+
+class Allocation(dict):
+    """
+    分配结果，角色名称到设备列表的映射，
+    设备的连接方案通过get_connection获取
+    """
+    def __init__(self):
+        super().__init__()
+        self.connections = dict()
+        # 分配方案占用的所有设备和端口
+        self.used = set()
+
+    def get_connection(self, device, constraint):
+        """
+        获取分配给设备的连接方案，格式和constraint.get_connection的返回值相同
+        """
+        return self.connections[(device.name, id(constraint))]
+
+
+class _Slot:
+    """
+    搜索变量：一个设备需求中的一个设备
+    """
+    def __init__(self, request, index, domain):
+        self.request = request
+        self.index = index
+        self.domain = domain
+
+
+class ResourceAllocator:
+    """
+    资源分配器
+    :param max_steps: 搜索的最大步数，超过后停止搜索，避免资源池过大时搜索时间过长
+    """
+    def __init__(self, pool, max_steps=100000):
+        self.pool = pool
+        self.max_steps = max_steps
+        self.steps = 0
+
+    def solve(self, requests):
+        """
+        求解所有设备需求
+        :return: Allocation
+        :raise AllocationError: 没有满足条件的分配方案
+        """
+        requests = list(requests)
+        allocation = self.__solve(requests)
+        if allocation is not None:
+            return allocation
+        if self.steps >= self.max_steps:
+            raise AllocationError([f"Search aborted after {self.max_steps} steps"])
+        raise AllocationError(self.__explain_conflict(requests))
+
+    def allocate(self, requests):
+        """
+        求解并占用分配方案中的设备(包括连接方案用到的设备)，并行执行时其他测试用例不能再收集这些设备，
+        和collect_device相同，需要时预约这些设备
+        :return: Allocation
+        """
+        with self.pool._occupy_lock:
+            self.pool._refresh_leases()
+            allocation = self.solve(requests)
+            devices = [item for item in allocation.used if isinstance(item, ResourceDevice)]
+            self.pool._reserve_collected(devices)
+            self.pool._occupy(devices)
+            return allocation
+
+    def __solve(self, requests):
+        """
+        回溯搜索分配方案，没有方案时返回None
+        :raise AllocationError: 有设备需求单独无法满足
+        """
+        domains = dict()
+        reasons = list()
+        for request in requests:
+            domains[request.role], reason = self.__get_domain(request)
+            if reason:
+                reasons.append(reason)
+        if any(reasons):
+            raise AllocationError(reasons)
+
+        slots = list()
+        for request in requests:
+            for index in range(request.count):
+                slots.append(_Slot(request, index, domains[request.role]))
+        # 候选设备少的需求优先搜索，尽早发现冲突
+        slots.sort(key=lambda slot: (len(slot.domain), requests.index(slot.request), slot.index))
+
+        self.steps = 0
+        assignment = dict()
+        allocation = Allocation()
+        if self.__search(slots, 0, assignment, allocation):
+            for request in requests:
+                allocation[request.role] = [assignment[(request.role, index)]
+                                            for index in range(request.count)]
+            return allocation
+        return None
+
+    def __get_domain(self, request):
+        """
+        获取设备需求的候选设备，候选设备必须满足所有非连接限制条件，并且每个连接限制条件至少有一个方案
+        :return: (候选设备列表, 不满足条件的原因)
+        """
+        devices = [device for device in
+                   self.pool.get_candidates(request.device_type,
+                                            request.constraints + request.connection_constraints)
+                   if self.pool._is_available(device)]
+        if not any(devices):
+            return list(), f"{request.role}: no available device of type {request.device_type}"
+        domain = list()
+        failed = dict()
+        for device in devices:
+            for constraint in request.constraints + request.connection_constraints:
+                if isinstance(constraint, ConnectionConstraint):
+                    meet = next(self.__get_options(constraint, device), None) is not None
+                else:
+                    meet = constraint.is_meet(device)
+                if not meet:
+                    failed[constraint.description] = failed.get(constraint.description, 0) + 1
+                    break
+            else:
+                domain.append(device)
+        if len(domain) < request.count:
+            reason = f"{request.role}: need {request.count} {request.device_type}, " \
+                     f"only {len(domain)} of {len(devices)} meet the constraints"
+            for description, count in failed.items():
+                reason += f"\n    {count} device(s) failed: {description}"
+            return domain, reason
+        return domain, None
+
+    def __search(self, slots, position, assignment, allocation):
+        if position == len(slots):
+            return True
+        slot = slots[position]
+        request = slot.request
+        # 同一需求中的设备按照候选顺序选择，避免搜索相同组合的不同排列
+        start = 0
+        if slot.index > 0 and (request.role, slot.index - 1) in assignment:
+            start = slot.domain.index(assignment[(request.role, slot.index - 1)]) + 1
+        for device in slot.domain[start:]:
+            if device in allocation.used:
+                continue
+            self.steps += 1
+            if self.steps >= self.max_steps:
+                return False
+            allocation.used.add(device)
+            assignment[(request.role, slot.index)] = device
+            if self.__search_connection(slots, position, device, 0, assignment, allocation):
+                return True
+            assignment.pop((request.role, slot.index))
+            allocation.used.discard(device)
+        return False
+
+    def __search_connection(self, slots, position, device, constraint_index, assignment, allocation):
+        """
+        依次为设备的每一个连接限制条件选择方案，全部选择后继续搜索下一个设备
+        """
+        constraints = slots[position].request.connection_constraints
+        if constraint_index == len(constraints):
+            return self.__search(slots, position + 1, assignment, allocation)
+        constraint = constraints[constraint_index]
+        for option in self.__get_options(constraint, device):
+            if option.used & allocation.used:
+                continue
+            self.steps += 1
+            if self.steps >= self.max_steps:
+                return False
+            allocation.used.update(option.used)
+            allocation.connections[(device.name, id(constraint))] = option.value
+            if self.__search_connection(slots, position, device, constraint_index + 1,
+                                        assignment, allocation):
+                return True
+            allocation.connections.pop((device.name, id(constraint)))
+            allocation.used.difference_update(option.used)
+        return False
+
+    def __get_options(self, constraint, device):
+        """
+        连接方案用到的设备也会被占用，跳过用到其他占用者或者其他执行器的设备的方案
+        """
+        for option in constraint.get_options(device):
+            if all(self.pool._is_available(item.parent if isinstance(item, DevicePort) else item)
+                   for item in option.used if isinstance(item, (ResourceDevice, DevicePort))):
+                yield option
+
+    def __explain_conflict(self, requests):
+        """
+        每个需求单独可以满足，但是无法同时满足时，找出互相冲突的需求
+        """
+        reasons = list()
+        for request in requests:
+            if ResourceAllocator(self.pool, self.max_steps).__solve([request]) is None:
+                reasons.append(f"{request.role}: cannot find {request.count} {request.device_type} "
+                               f"with disjoint connections")
+        if any(reasons):
+            return reasons
+        for index, request in enumerate(requests):
+            for other in requests[index + 1:]:
+                if ResourceAllocator(self.pool, self.max_steps).__solve([request, other]) is None:
+                    reasons.append(f"{request.role} and {other.role} compete for the same devices or ports")
+        if not any(reasons):
+            reasons.append("The requests cannot be satisfied at the same time: "
+                           + ", ".join(request.role for request in requests))
+        return reasons
@@ -0,0 +1,284 @@
+"""
+本地资源预约服务
+
+预约服务进程在内存中持有资源文件的设备清单以及每个设备的租约，
+通过UNIX socket为多个执行器提供设备清单查询、收集、预约、续约以及释放服务，
+执行器不再需要反复读写资源文件。
+
+协议为每行一个json对象：
+请求: {"op": "acquire", "holder": "...", "owner": "...", "devices": [...]}
+响应: {"ok": true, "result": ...} 或者 {"ok": false, "error": "...", "conflicts": {...}}
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from core.resource.pool import ResourcePool, Constraint, IndexPredicate, ResourceSetting
+from core.resource.reservation import LeaseManager, ReservationError
+
+
+class BrokerError(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+class _PredicateConstraint(Constraint):
+    """
+    只包含索引谓词的限制条件，用于处理客户端发送的收集请求
+    """
+    def __init__(self, predicates):
+        super().__init__()
+        self.predicates = predicates
+
+    def is_meet(self, resource, *args, **kwargs):
+        return True
+
+    def get_index_predicates(self):
+        return self.predicates
+
+
+class _BrokerRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                response = {"ok": True, "result": self.server.broker.handle(request)}
+            except ReservationError as re:
+                response = {"ok": False, "error": str(re), "conflicts": re.conflicts}
+            except Exception as ex:
+                response = {"ok": False, "error": str(ex)}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+
+class _BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ResourceBroker:
+    """
+    资源预约服务
+    :param resource_file: 资源文件
+    :param socket_path: UNIX socket路径
+    :param owner: 读取资源文件使用的用户名
+    :param lease_time: 租约时间(秒)，默认使用ResourceSetting.lease_time
+    """
+    def __init__(self, resource_file, socket_path, owner, lease_time=None):
+        self.pool = ResourcePool()
+        self.pool.load(resource_file, owner)
+        self.socket_path = socket_path
+        self.lease_time = lease_time or ResourceSetting.lease_time
+        # 设备名称 -> {"owner", "holder", "date", "expires"}
+        self.leases = dict()
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def handle(self, request):
+        op = request.get("op", None)
+        handler = getattr(self, f"_op_{op}", None)
+        if handler is None:
+            raise BrokerError(f"Unknown operation {op}")
+        with self.lock:
+            self.__drop_expired()
+            return handler(request)
+
+    def __drop_expired(self):
+        now = time.time()
+        for name in [name for name, lease in self.leases.items() if lease['expires'] <= now]:
+            self.leases.pop(name)
+
+    def __is_available(self, name, holder):
+        lease = self.leases.get(name, None)
+        return lease is None or lease['holder'] == holder
+
+    def __lease(self, names, request):
+        now = time.time()
+        for name in names:
+            self.leases[name] = {
+                "owner": request['owner'],
+                "holder": request['holder'],
+                "date": time.strftime("%Y/%m/%d %H:%M:%S", time.localtime(now)),
+                "expires": now + self.lease_time
+            }
+
+    def _op_inventory(self, request):
+        return self.pool.to_dict()
+
+    def _op_leases(self, request):
+        return self.leases
+
+    def _op_acquire(self, request):
+        conflicts = {name: self.leases[name]['owner'] for name in request['devices']
+                     if not self.__is_available(name, request['holder'])}
+        if any(conflicts):
+            raise ReservationError(conflicts)
+        unknown = [name for name in request['devices'] if name not in self.pool.topology]
+        if any(unknown):
+            raise BrokerError(f"Unknown device {', '.join(unknown)}")
+        self.__lease(request['devices'], request)
+        return request['devices']
+
+    def _op_collect(self, request):
+        """
+        按照设备类型以及索引谓词收集并预约设备，count为None时收集所有可用设备，
+        candidates为客户端判断过限制条件的设备名称，指定时只在这些设备中选择
+        """
+        predicates = [IndexPredicate(*predicate) for predicate in request.get("predicates", list())]
+        count = request.get("count", None)
+        candidates = request.get("candidates", None)
+        candidates = None if candidates is None else set(candidates)
+        ret = list()
+        for device in self.pool.get_candidates(request['type'], [_PredicateConstraint(predicates)]):
+            if candidates is not None and device.name not in candidates:
+                continue
+            if self.__is_available(device.name, request['holder']):
+                ret.append(device.name)
+            if count is not None and len(ret) >= count:
+                break
+        if count is not None and len(ret) < count:
+            return list()
+        self.__lease(ret, request)
+        return ret
+
+    def _op_renew(self, request):
+        expires = time.time() + self.lease_time
+        count = 0
+        for lease in self.leases.values():
+            if lease['holder'] == request['holder']:
+                lease['expires'] = expires
+                count += 1
+        return count
+
+    def _op_release(self, request):
+        devices = request.get("devices", None)
+        for name in [name for name, lease in self.leases.items() if lease['holder'] == request['holder']]:
+            if devices is None or name in devices:
+                self.leases.pop(name)
+        return True
+
+    def serve_forever(self):
+        self.__create_server()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.__remove_socket()
+
+    def start(self):
+        """
+        在后台线程中启动服务，用于本地测试
+        """
+        self.__create_server()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.server = None
+        self.__remove_socket()
+
+    def __create_server(self):
+        self.__remove_socket()
+        self.server = _BrokerServer(self.socket_path, _BrokerRequestHandler)
+        self.server.broker = self
+
+    def __remove_socket(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class BrokerClient:
+    """
+    预约服务的客户端，每个请求使用一个新的连接，可以在多个线程中使用
+    """
+    def __init__(self, socket_path, timeout=10):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def request(self, op, **kwargs):
+        kwargs['op'] = op
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall((json.dumps(kwargs) + "\n").encode())
+            with sock.makefile("rb") as file:
+                line = file.readline()
+        if not line:
+            raise BrokerError("Broker closed the connection")
+        response = json.loads(line)
+        if response['ok']:
+            return response['result']
+        if "conflicts" in response:
+            raise ReservationError(response['conflicts'])
+        raise BrokerError(response['error'])
+
+
+class BrokerLeases(LeaseManager):
+    """
+    客户端模式下的设备租约，和LeaseManager接口相同，租约由预约服务管理
+    """
+    def __init__(self, client, owner):
+        super().__init__(client.socket_path, owner)
+        self.client = client
+
+    def refresh(self):
+        self._leases = self.client.request("leases")
+
+    def acquire(self, device_names):
+        self.client.request("acquire", holder=self.holder, owner=self.owner, devices=list(device_names))
+        self.refresh()
+
+    def collect(self, device_type, count=None, predicates=list(), candidates=None):
+        """
+        由预约服务收集并预约设备，预约服务只判断索引谓词，其他限制条件由客户端判断后通过candidates传入
+        :param candidates: 可以选择的设备名称，None表示所有设备
+        :return: 设备名称列表，设备不足时为空
+        """
+        predicates = [[p.attribute, p.op, p.value, p.target] for p in predicates]
+        ret = self.client.request("collect", holder=self.holder, owner=self.owner, type=device_type,
+                                  count=count, predicates=predicates,
+                                  candidates=None if candidates is None else list(candidates))
+        self.refresh()
+        return ret
+
+    def renew(self):
+        return self.client.request("renew", holder=self.holder)
+
+    def release(self, device_names=None):
+        self.client.request("release", holder=self.holder,
+                            devices=None if device_names is None else list(device_names))
+        self.refresh()
+
+
+if __name__ == "__main__":
+    # 使用示例资源文件在后台线程中启动预约服务，两个执行器通过预约服务收集设备
+    import tempfile
+    resource_file = os.path.join(os.path.dirname(__file__), "..", "..", "example", "resource.json")
+    socket_path = os.path.join(tempfile.gettempdir(), "ats_broker_demo.sock")
+    broker = ResourceBroker(resource_file, socket_path, "demo")
+    broker.start()
+    try:
+        runner1 = ResourcePool()
+        runner1.connect_broker(socket_path, "runner1")
+        runner2 = ResourcePool()
+        runner2.connect_broker(socket_path, "runner2")
+        print("runner1 STA:", [device.name for device in runner1.collect_device("STA", 2)])
+        # 预约服务只剩下一个空闲的STA
+        print("runner2 STA x2:", [device.name for device in runner2.collect_device("STA", 2)])
+        print("runner2 STA:", [device.name for device in runner2.collect_all_device("STA")])
+        print("leases:", {name: lease['owner'] for name, lease in broker.leases.items()})
+        runner1.release()
+        print("runner2 STA after release:", [device.name for device in runner2.collect_all_device("STA")])
+    finally:
+        broker.stop()
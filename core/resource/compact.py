@@ -0,0 +1,282 @@
+"""
+紧凑的资源文件格式
+
+第一行是json格式的文件头，包括info、reserved以及需要预连接的设备名称，
+之后每一行是一个设备: 设备名称\\t设备类型\\t设备的json对象(和to_dict的格式相同)。
+读取时只建立设备名称到文件位置的索引，设备在第一次访问时才被解析和实例化
+
+增量保存时只把修改过的设备追加到资源文件旁边的日志文件(<资源文件>.journal)中，
+每行一条记录，读取资源文件时按顺序应用，日志过大时把日志合并到资源文件中
+"""
+import json
+import os
+import sys
+import threading
+from collections.abc import MutableMapping
+from core.resource.reservation import atomic_write
+
+COMPACT_SUFFIX = ".jsonl"
+COMPACT_FORMAT = "ats-resource-jsonl"
+JOURNAL_SUFFIX = ".journal"
+
+
+class CompactFormatError(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+def is_compact_file(filename):
+    return filename.endswith(COMPACT_SUFFIX)
+
+
+def read_compact_index(filename):
+    """
+    读取文件头并建立设备索引，不解析设备内容
+    :return: (文件头, {设备名称: (偏移, 长度)}, {设备名称: 设备类型})
+    """
+    index = dict()
+    types = dict()
+    with open(filename, "rb") as file:
+        header_line = file.readline()
+        try:
+            header = json.loads(header_line)
+        except ValueError:
+            raise CompactFormatError(f"Invalid header in {filename}")
+        if header.get("format", None) != COMPACT_FORMAT:
+            raise CompactFormatError(f"{filename} is not a compact resource file")
+        offset = len(header_line)
+        for line in file:
+            if line.strip():
+                fields = line.split(b"\t", 2)
+                if len(fields) != 3:
+                    raise CompactFormatError(f"Invalid device line at offset {offset} in {filename}")
+                name = sys.intern(fields[0].decode())
+                index[name] = (offset, len(line))
+                types[name] = sys.intern(fields[1].decode())
+            offset += len(line)
+    return header, index, types
+
+
+def format_device_line(name, device_type, device_dict):
+    return f"{name}\t{device_type}\t{json.dumps(device_dict, separators=(',', ':'))}\n"
+
+
+def format_header(information, reserved, pre_connect):
+    return json.dumps({
+        "format": COMPACT_FORMAT,
+        "info": information,
+        "reserved": reserved,
+        "pre_connect": pre_connect
+    }) + "\n"
+
+
+def read_journal(filename):
+    """
+    读取日志文件中的所有记录，忽略最后一条写了一半的记录
+    :return: [{"devices": {设备名称: 设备的json对象或者None}, "info": ..., "reserved": ...}, ...]
+    """
+    entries = list()
+    if not os.path.exists(filename):
+        return entries
+    with open(filename) as file:
+        for line in file:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+    return entries
+
+
+def append_journal(filename, entry):
+    """
+    追加一条日志记录，调用者需要持有资源文件的文件锁
+    """
+    with open(filename, "a") as file:
+        file.write(json.dumps(entry, separators=(',', ':')) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def merge_journal(entries):
+    """
+    合并日志记录
+    :return: ({设备名称: 设备的json对象, 删除的设备为None}, 最后修改的{"info", "reserved"})
+    """
+    devices = dict()
+    header = dict()
+    for entry in entries:
+        devices.update(entry['devices'])
+        header.update({key: entry[key] for key in ("info", "reserved") if key in entry})
+    return devices, header
+
+
+def compact_journal(filename):
+    """
+    把日志文件中的修改合并到资源文件中并删除日志文件，调用者需要持有资源文件的文件锁。
+    只依据磁盘上的资源文件和日志合并，其他执行器追加到日志中的修改不会丢失
+    """
+    journal = filename + JOURNAL_SUFFIX
+    changes, header = merge_journal(read_journal(journal))
+    if is_compact_file(filename):
+        content = _merge_compact(filename, changes, header)
+    else:
+        with open(filename) as file:
+            json_object = json.load(file)
+        json_object.update(header)
+        devices = json_object.setdefault('devices', dict())
+        for name, device_dict in changes.items():
+            if device_dict is None:
+                devices.pop(name, None)
+            else:
+                devices[name] = device_dict
+        content = json.dumps(json_object, indent=4)
+    atomic_write(filename, content)
+    if os.path.exists(journal):
+        os.remove(journal)
+
+
+def _merge_compact(filename, changes, header):
+    """
+    修改过的设备替换原来的行，新增的设备追加在最后，没有修改的设备直接复制原始内容
+    """
+    file_header, index, _ = read_compact_index(filename)
+    information = header.get("info", file_header.get("info", None))
+    reserved = header.get("reserved", file_header.get("reserved", None))
+    pre_connect = list(file_header.get("pre_connect", None) or list())
+    with open(filename, "rb") as file:
+        data = file.read()
+    lines = list()
+    for name, (offset, length) in index.items():
+        if name not in changes:
+            lines.append(data[offset: offset + length].decode().rstrip("\n") + "\n")
+        elif changes[name] is not None:
+            lines.append(format_device_line(name, changes[name].get("type", None), changes[name]))
+    for name, device_dict in changes.items():
+        if name in pre_connect:
+            pre_connect.remove(name)
+        if device_dict is None:
+            continue
+        if name not in index:
+            lines.append(format_device_line(name, device_dict.get("type", None), device_dict))
+        if device_dict.get("pre_connect", False):
+            pre_connect.append(name)
+    return format_header(information, reserved or None, pre_connect) + "".join(lines)
+
+
+class LazyTopology(MutableMapping):
+    """
+    延迟实例化设备的topology字典
+    :param materialize: 将设备的json对象转换为设备实例的方法
+    """
+    def __init__(self, filename, index, types, materialize):
+        self.filename = filename
+        self._index = index
+        self._types = types
+        self._materialize = materialize
+        # 已经实例化或者新增加的设备
+        self._devices = dict()
+        # 日志文件中修改过的设备的json对象，优先于资源文件中的内容
+        self._patches = dict()
+        # 保持文件中的设备顺序
+        self._order = dict.fromkeys(index)
+        self._lock = threading.RLock()
+
+    def __getitem__(self, name):
+        device = self._devices.get(name, None)
+        if device is not None:
+            return device
+        with self._lock:
+            if name in self._devices:
+                return self._devices[name]
+            if name in self._patches:
+                device_dict = self._patches.pop(name)
+            elif name in self._index:
+                device_dict = json.loads(self.get_raw_line(name).split(b"\t", 2)[2])
+            else:
+                raise KeyError(name)
+            device = self._materialize(device_dict)
+            self._devices[name] = device
+            return device
+
+    def __setitem__(self, name, device):
+        with self._lock:
+            self._devices[name] = device
+            self._types[name] = device.type
+            self._index.pop(name, None)
+            self._patches.pop(name, None)
+            self._order[name] = None
+
+    def patch(self, name, device_dict):
+        """
+        使用日志文件中的json对象替换设备，同样在第一次访问时实例化
+        """
+        with self._lock:
+            self._devices.pop(name, None)
+            self._index.pop(name, None)
+            self._patches[name] = device_dict
+            self._types[name] = sys.intern(device_dict['type']) \
+                if isinstance(device_dict.get('type', None), str) else device_dict.get('type', None)
+            self._order[name] = None
+
+    def __delitem__(self, name):
+        with self._lock:
+            if name not in self._order:
+                raise KeyError(name)
+            self._devices.pop(name, None)
+            self._index.pop(name, None)
+            self._patches.pop(name, None)
+            self._types.pop(name, None)
+            self._order.pop(name)
+
+    def __iter__(self):
+        return iter(list(self._order))
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, name):
+        return name in self._order
+
+    def clear(self):
+        with self._lock:
+            self._devices.clear()
+            self._index.clear()
+            self._patches.clear()
+            self._types.clear()
+            self._order.clear()
+
+    def reindex(self, index, types):
+        """
+        资源文件重新写入后更新设备在文件中的位置
+        """
+        with self._lock:
+            self._patches.clear()
+            self._index = {name: value for name, value in index.items() if name not in self._devices}
+            self._types.update(types)
+
+    def is_materialized(self, name):
+        return name in self._devices
+
+    def get_materialized(self):
+        """
+        获取已经实例化的设备名称
+        """
+        return list(self._devices)
+
+    def get_types(self):
+        """
+        不实例化设备，获取所有设备的名称和类型，已经实例化的设备使用设备当前的类型
+        """
+        return [(name, self._devices[name].type if name in self._devices else self._types[name])
+                for name in self._order]
+
+    def get_raw_line(self, name):
+        """
+        读取还没有实例化的设备在文件中的原始内容
+        """
+        if name in self._patches:
+            return format_device_line(name, self._types[name], self._patches[name]).encode()
+        offset, length = self._index[name]
+        with open(self.filename, "rb") as file:
+            file.seek(offset)
+            return file.read(length)
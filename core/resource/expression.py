@@ -0,0 +1,331 @@
+"""
+可组合的限制条件表达式
+
+使用属性比较以及与、或、非组合限制条件，表达式在第一次使用时编译为闭包，
+is_meet的结果按照(表达式, 设备或端口)缓存在资源池中，资源池版本改变时失效，
+不同测试用例创建的相同表达式共享缓存：
+
+    expr = (Attr("type") == "Android") & (Attr("version") >= "8.0") & ~(Attr("brand") == "X")
+    pool.collect_device("Android", 1, [expr])
+
+与运算中的属性比较会转换为IndexPredicate，资源池通过索引缩小候选设备的范围
+"""
+from abc import abstractmethod
+from core.resource.pool import Constraint, ResourceDevice, DevicePort, IndexPredicate, \
+    ResourceError, _INDEX_OPERATORS
+
+
+def _resource_key(resource):
+    if isinstance(resource, ResourceDevice):
+        return resource.name
+    if isinstance(resource, DevicePort) and resource.parent is not None:
+        return resource.parent.name, resource.name
+    return None
+
+
+def _get_memo(resource):
+    device = resource.parent if isinstance(resource, DevicePort) else resource
+    pool = getattr(device, "_pool", None)
+    if pool is None:
+        return None
+    return pool.get_memo()
+
+
+def _has_wrap(expression):
+    """
+    表达式中是否包含普通的限制条件
+    """
+    if isinstance(expression, Wrap):
+        return True
+    children = getattr(expression, "expressions", None) or [getattr(expression, "expression", None)]
+    return any(_has_wrap(child) for child in children if isinstance(child, Expression))
+
+
+def _to_expression(value):
+    if isinstance(value, Expression):
+        return value
+    if isinstance(value, Constraint):
+        return Wrap(value)
+    raise ResourceError(f"{value} is not a constraint")
+
+
+class Expression(Constraint):
+    """
+    限制条件表达式的基类，子类实现compile返回判断函数
+    """
+    def __init__(self):
+        super().__init__()
+        self._predicate = None
+        self._key = None
+
+    @abstractmethod
+    def compile(self):
+        """
+        编译为判断函数 predicate(resource) -> bool
+        """
+        pass
+
+    @property
+    def key(self):
+        """
+        表达式的结构，用作缓存的键，无法缓存时为None
+        """
+        return None
+
+    def is_meet(self, resource, *args, **kwargs):
+        if self._predicate is None:
+            self._predicate = self.compile()
+            self._key = self.key
+        key = self._key
+        memo = _get_memo(resource) if key is not None else None
+        if memo is None:
+            return self._predicate(resource)
+        memo_key = (key, _resource_key(resource))
+        ret = memo.get(memo_key, None)
+        if ret is None:
+            ret = bool(self._predicate(resource))
+            memo[memo_key] = ret
+        return ret
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __rand__(self, other):
+        return And(other, self)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __ror__(self, other):
+        return Or(other, self)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Attr:
+    """
+    属性比较表达式的构造器，Attr("speed") >= 1000 返回Compare表达式
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def compare(self, op, value):
+        return Compare(self.name, op, value)
+
+    def __eq__(self, value):
+        return Compare(self.name, "=", value)
+
+    def __ne__(self, value):
+        return Compare(self.name, "!=", value)
+
+    def __gt__(self, value):
+        return Compare(self.name, ">", value)
+
+    def __ge__(self, value):
+        return Compare(self.name, ">=", value)
+
+    def __lt__(self, value):
+        return Compare(self.name, "<", value)
+
+    def __le__(self, value):
+        return Compare(self.name, "<=", value)
+
+    __hash__ = None
+
+
+class Compare(Expression):
+    """
+    属性比较，资源没有该属性、属性值为None或者无法比较时不满足条件
+    :param op: 比较操作符，=, !=, >, >=, <, <=
+    """
+    def __init__(self, attribute, op, value):
+        super().__init__()
+        if op not in _INDEX_OPERATORS:
+            raise ResourceError(f"Unsupported operator {op}")
+        self.attribute = attribute
+        self.op = op
+        self.value = value
+        self.description = f"{attribute} {op} {value}"
+
+    @property
+    def key(self):
+        try:
+            hash(self.value)
+        except TypeError:
+            return None
+        # 1 == 1.0 == True，键中包含值的类型
+        return "cmp", self.attribute, self.op, type(self.value).__name__, self.value
+
+    def compile(self):
+        attribute = self.attribute
+        value = self.value
+        compare = _INDEX_OPERATORS[self.op]
+
+        def predicate(resource):
+            attr_value = getattr(resource, attribute, None)
+            if attr_value is None:
+                return False
+            try:
+                return compare(attr_value, value)
+            except TypeError:
+                return False
+        return predicate
+
+    def get_index_predicates(self):
+        return [IndexPredicate(self.attribute, self.op, self.value)]
+
+
+class And(Expression):
+    def __init__(self, *expressions):
+        super().__init__()
+        self.expressions = list()
+        for expression in map(_to_expression, expressions):
+            # 展开嵌套的与运算，减少函数调用
+            if isinstance(expression, And):
+                self.expressions.extend(expression.expressions)
+            else:
+                self.expressions.append(expression)
+        self.description = "(" + " and ".join(str(e.description) for e in self.expressions) + ")"
+
+    @property
+    def key(self):
+        keys = tuple(e.key for e in self.expressions)
+        return None if None in keys else ("and", ) + keys
+
+    def compile(self):
+        predicates = tuple(e.compile() for e in self.expressions)
+        if len(predicates) == 2:
+            first, second = predicates
+            return lambda resource: first(resource) and second(resource)
+        return lambda resource: all(predicate(resource) for predicate in predicates)
+
+    def get_index_predicates(self):
+        ret = list()
+        for expression in self.expressions:
+            ret.extend(expression.get_index_predicates())
+        return ret
+
+
+class Or(Expression):
+    def __init__(self, *expressions):
+        super().__init__()
+        self.expressions = list()
+        for expression in map(_to_expression, expressions):
+            if isinstance(expression, Or):
+                self.expressions.extend(expression.expressions)
+            else:
+                self.expressions.append(expression)
+        self.description = "(" + " or ".join(str(e.description) for e in self.expressions) + ")"
+
+    @property
+    def key(self):
+        keys = tuple(e.key for e in self.expressions)
+        return None if None in keys else ("or", ) + keys
+
+    def compile(self):
+        predicates = tuple(e.compile() for e in self.expressions)
+        if len(predicates) == 2:
+            first, second = predicates
+            return lambda resource: first(resource) or second(resource)
+        return lambda resource: any(predicate(resource) for predicate in predicates)
+
+
+class Not(Expression):
+    def __init__(self, expression):
+        super().__init__()
+        self.expression = _to_expression(expression)
+        self.description = f"not {self.expression.description}"
+
+    @property
+    def key(self):
+        key = self.expression.key
+        return None if key is None else ("not", key)
+
+    def compile(self):
+        predicate = self.expression.compile()
+        return lambda resource: not predicate(resource)
+
+
+class IsDevice(Expression):
+    """
+    资源是设备
+    """
+    def __init__(self):
+        super().__init__()
+        self.description = "resource is a device"
+
+    @property
+    def key(self):
+        return "device",
+
+    def compile(self):
+        return lambda resource: isinstance(resource, ResourceDevice)
+
+
+class AnyPort(Expression):
+    """
+    设备至少有一个端口满足表达式
+    """
+    def __init__(self, expression):
+        super().__init__()
+        self.expression = _to_expression(expression)
+        self.description = f"any port ({self.expression.description})"
+
+    @property
+    def key(self):
+        key = self.expression.key
+        return None if key is None else ("port", key)
+
+    def compile(self):
+        predicate = self.expression.compile()
+
+        def any_port(resource):
+            if not isinstance(resource, ResourceDevice):
+                return False
+            return any(predicate(port) for port in resource.ports.values())
+        return any_port
+
+    def get_index_predicates(self):
+        # 端口表达式的必要条件对应设备任意一个端口的索引，普通限制条件的谓词是针对设备的，不能转换
+        if self.expression.key is None or _has_wrap(self.expression):
+            return list()
+        return [IndexPredicate(p.attribute, p.op, p.value, target="port")
+                for p in self.expression.get_index_predicates() if p.target == "device"]
+
+
+class _Identity:
+    """
+    按照对象本身(id)比较的键，键中保存对象的引用，缓存存在期间id不会被其他对象重用
+    """
+    __slots__ = ("obj", )
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, _Identity) and other.obj is self.obj
+
+
+class Wrap(Expression):
+    """
+    在表达式中使用普通的限制条件，普通限制条件的结构未知，
+    结果按照限制条件实例缓存，同一个实例在资源池版本不变时结果相同
+    """
+    def __init__(self, constraint):
+        super().__init__()
+        self.constraint = constraint
+        self.description = constraint.description
+
+    @property
+    def key(self):
+        return "wrap", _Identity(self.constraint)
+
+    def compile(self):
+        return self.constraint.is_meet
+
+    def get_index_predicates(self):
+        return self.constraint.get_index_predicates()
@@ -1,11 +1,20 @@
 """
 资源池对象，包括了资源池、资源以及资源端口的定义，序列化以及反序列化的方法
 """
+import bisect
 import json
+import operator
 import os
-import time
+import sys
+import threading
 from abc import ABCMeta, abstractmethod
+from enum import Enum
 from core.config.setting import static_setting, SettingBase
+from core.resource.topology import TopologyGraph
+from core.resource.reservation import LeaseManager, ReservationError, file_lock, atomic_write
+from core.resource.compact import LazyTopology, is_compact_file, read_compact_index, \
+    format_header, format_device_line, read_journal, append_journal, merge_journal, compact_journal, \
+    JOURNAL_SUFFIX
 
 
 # 存放用户注册的配置接口对象类型
@@ -36,22 +45,106 @@ def register_resource(category, resource_type, comm_callback):
         _resource_port_mapping[resource_type] = comm_callback
 
 
+# 保护设备连接状态的更新，被放弃的连接线程不能覆盖已经标记的失败状态
+_connection_lock = threading.Lock()
+
+
+class ConnectionState(Enum):
+    """
+    设备通信实例的连接状态
+    """
+    NotConnected = 1
+    Connecting = 2
+    Connected = 3
+    Failed = 4
+
+
 class ResourceDevice:
     """
     代表所有测试资源设备的配置类，字段动态定义
     """
     def __init__(self, name="", **kwargs):
         self.name = name
-        self.type = kwargs.get("type", None)
+        self.type = _intern(kwargs.get("type", None))
         self.description = kwargs.get("description", None)
         self.pre_connect = False
         self.ports = dict()
         self._instance = None
+        self._connection_state = ConnectionState.NotConnected
+        # 连接失败的原因
+        self._connection_error = None
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if not name.startswith("_"):
+            self._mark_dirty()
+
+    def _mark_dirty(self):
+        """
+        通知所属的资源池设备被修改，增量保存时只写入修改过的设备
+        """
+        pool = self.__dict__.get("_pool", None)
+        if pool is not None:
+            pool.mark_dirty(self.name)
+
+    @property
+    def connection_state(self):
+        """
+        通信实例的连接状态，通信实例支持is_alive时，已经断开的连接返回NotConnected
+        """
+        if self._connection_state == ConnectionState.Connected:
+            is_alive = getattr(self._instance, "is_alive", None)
+            if is_alive is not None and not is_alive():
+                return ConnectionState.NotConnected
+        return self._connection_state
+
+    @connection_state.setter
+    def connection_state(self, value):
+        self._connection_state = value
+
+    @property
+    def connection_error(self):
+        return self._connection_error
+
+    @property
+    def is_ready(self):
+        return self.connection_state == ConnectionState.Connected
+
+    def connect(self, cancelled=None):
+        """
+        连接设备的通信实例，更新连接状态
+        :param cancelled: threading.Event，连接超时被放弃时设置，之后不再更新连接状态
+        :return: 是否连接成功
+        """
+        self.__set_state(ConnectionState.Connecting, None, cancelled)
+        try:
+            instance = self.get_comm_instance()
+            if hasattr(instance, "connect"):
+                instance.connect()
+            is_alive = getattr(instance, "is_alive", None)
+            if is_alive is not None and not is_alive():
+                raise ResourceError(f"{self.name} is not connected")
+            self.__set_state(ConnectionState.Connected, None, cancelled)
+            return True
+        except Exception as ex:
+            self.__set_state(ConnectionState.Failed, str(ex), cancelled)
+            raise
+
+    def mark_failed(self, error):
+        self.__set_state(ConnectionState.Failed, error)
+
+    def __set_state(self, state, error, cancelled=None):
+        with _connection_lock:
+            if cancelled is not None and cancelled.is_set():
+                return
+            self._connection_state = state
+            self._connection_error = error
 
     def add_port(self, name, *args, **kwargs):
         if name in self.ports:
             raise ResourceError(f"Port Name {name} already exists")
         self.ports[f"{name}"] = DevicePort(self, name, **kwargs)
+        self._mark_dirty()
 
     def get_port_count(self, **kwargs):
         return len(self.ports)
@@ -59,7 +152,8 @@ class ResourceDevice:
     def to_dict(self):
         ret = dict()
         for key, value in self.__dict__.items():
-            if key == "__instance":
+            # 通信实例、所属资源池等内部属性不需要序列化
+            if key.startswith("_"):
                 continue
             if key == "ports":
                 ret[key] = dict()
@@ -70,13 +164,21 @@ class ResourceDevice:
         return ret
 
     def get_comm_instance(self, new=False):
+        """
+        共享的通信实例，由会话池创建和管理
+        :param new: 重新创建通信实例
+        """
+        from core.resource.session import session_pool
+        self._instance = session_pool.get_shared(self, new)
+        return self._instance
+
+    def create_comm_instance(self):
+        """
+        使用注册的实例化方法创建新的通信实例，不会缓存
+        """
         if self.type not in _resource_device_mapping:
             raise ResourceError(f"type {self.type} is not registered")
-        if not new and self._instance:
-            return self._instance
-        else:
-            self._instance = _resource_device_mapping[self.type](self)
-        return self._instance
+        return _resource_device_mapping[self.type](self)
 
     @staticmethod
     def from_dict(dict_obj):
@@ -89,59 +191,207 @@ class ResourceDevice:
                 setattr(ret, "ports", ports)
             else:
                 setattr(ret, key, value)
+        ret.type = _intern(ret.type)
         return ret
 
 
 class DevicePort:
     """
     代表设备的连接端口
+    端口数量很多，使用__slots__减少内存，动态定义的字段(比如speed)保存在attributes中
     """
+    __slots__ = ("parent", "type", "name", "description", "attributes",
+                 "_remote_ports", "_remote_refs", "_instance")
+
     def __init__(self, parent_device=None, name="", **kwargs):
+        object.__setattr__(self, "attributes", dict())
         self.parent = parent_device
-        self.type = kwargs.get("type", None)
+        self.type = _intern(kwargs.get("type", None))
         self.name = name
         self.description = kwargs.get("description", None)
-        self.remote_ports = list()
+        self._remote_ports = list()
+        # 延迟装载时，对端端口以{"device", "port"}的形式保存，第一次访问时才查找对象
+        self._remote_refs = None
         self._instance = None
 
+    def __getattr__(self, name):
+        # 只有在slots中找不到时才会调用
+        try:
+            return object.__getattribute__(self, "attributes")[name]
+        except KeyError:
+            raise AttributeError(f"'DevicePort' object has no attribute '{name}'")
+
+    def __setattr__(self, name, value):
+        if name in DevicePort.__slots__ or name == "remote_ports":
+            object.__setattr__(self, name, value)
+        else:
+            self.attributes[name] = value
+        if not name.startswith("_"):
+            parent = self.parent if name != "parent" else value
+            if parent is not None:
+                parent._mark_dirty()
+
+    def __delattr__(self, name):
+        if name in self.attributes:
+            del self.attributes[name]
+        else:
+            object.__delattr__(self, name)
+
+    @property
+    def remote_ports(self):
+        if self._remote_refs is not None:
+            refs = self._remote_refs
+            self._remote_refs = None
+            topology = self.parent._pool.topology
+            self._remote_ports = [topology[ref["device"]].ports[ref["port"]] for ref in refs]
+        return self._remote_ports
+
+    @remote_ports.setter
+    def remote_ports(self, value):
+        self._remote_refs = None
+        self._remote_ports = value
+
     def get_comm_instance(self, new=False):
+        """
+        共享的通信实例，由会话池创建和管理
+        :param new: 重新创建通信实例
+        """
+        from core.resource.session import session_pool
+        self._instance = session_pool.get_shared(self, new)
+        return self._instance
+
+    def create_comm_instance(self):
+        """
+        使用注册的实例化方法创建新的通信实例，不会缓存
+        """
         if self.type not in _resource_port_mapping:
             raise ResourceError(f"type {self.type} is not registered")
-        if not new and self._instance:
-            return self._instance
-        else:
-            self._instance = _resource_port_mapping[self.type](self)
-        return self._instance
+        return _resource_port_mapping[self.type](self)
 
     def to_dict(self):
         ret = dict()
-        for key, value in self.__dict__.items():
-            if key == "__instance":
-                continue
-            if key == "parent":
-                ret[key] = value.name
-            elif key == "remote_ports":
-                ret[key] = list()
-                for remote_port in value:
-                    #使用device的名称和port的名称来表示远端的端口
-                    #在反序列化的时候可以方便地找到相应的对象实例
-                    ret[key].append(
-                        {
-                            "device": remote_port.parent.name,
-                            "port": remote_port.name
-                        }
-                    )
-            else:
-                ret[key] = value
+        ret['parent'] = self.parent.name
+        ret['type'] = self.type
+        ret['name'] = self.name
+        ret['description'] = self.description
+        if self._remote_refs is not None:
+            # 还没有查找对端端口对象，直接使用原来的引用
+            ret['remote_ports'] = [dict(ref) for ref in self._remote_refs]
+        else:
+            #使用device的名称和port的名称来表示远端的端口
+            #在反序列化的时候可以方便地找到相应的对象实例
+            ret['remote_ports'] = [
+                {
+                    "device": remote_port.parent.name,
+                    "port": remote_port.name
+                } for remote_port in self._remote_ports
+            ]
+        ret.update(self.attributes)
         return ret
 
     @staticmethod
     def from_dict(dict_obj, parent):
         ret = DevicePort(parent)
         for key, value in dict_obj.items():
-            if key == "remote_ports" or key == "parent":
+            if key == "remote_ports" or key == "parent" or key.startswith("_"):
                 continue
             setattr(ret, key, value)
+        ret.type = _intern(ret.type)
+        return ret
+
+
+def _intern(value):
+    """
+    设备和端口的类型字符串大量重复，使用sys.intern共享同一个对象
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+# 索引谓词支持的比较操作符
+_INDEX_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le
+}
+
+
+class IndexPredicate:
+    """
+    可以通过资源池索引计算的谓词，用于在调用Constraint.is_meet之前缩小候选设备的范围
+    :param attribute: 属性名称
+    :param op: 比较操作符，=, !=, >, >=, <, <=
+    :param target: device表示设备的属性，port表示设备任意一个端口的属性
+    """
+    def __init__(self, attribute, op, value, target="device"):
+        if op not in _INDEX_OPERATORS:
+            raise ResourceError(f"Unsupported index operator {op}")
+        if target not in ("device", "port"):
+            raise ResourceError(f"Unsupported index target {target}")
+        self.attribute = attribute
+        self.op = op
+        self.value = value
+        self.target = target
+
+
+class _AttributeIndex:
+    """
+    一种设备类型的一个属性的索引，属性值到设备名称集合的映射
+    """
+    def __init__(self, devices, attribute, target):
+        self.values = dict()
+        for device in devices:
+            if target == "device":
+                items = [device]
+            else:
+                items = device.ports.values()
+            for item in items:
+                value = getattr(item, attribute, None)
+                if value is None:
+                    continue
+                try:
+                    self.values.setdefault(value, set()).add(device.name)
+                except TypeError:
+                    # 不能作为字典键的属性值不建立索引
+                    continue
+        try:
+            self.sorted_keys = sorted(self.values.keys())
+        except TypeError:
+            # 属性值的类型不一致，无法排序，范围查询时逐个比较
+            self.sorted_keys = None
+
+    def lookup(self, op, value):
+        """
+        获取属性值满足条件的设备名称集合
+        """
+        if op == "=":
+            try:
+                return set(self.values.get(value, set()))
+            except TypeError:
+                return set()
+        if op in (">", ">=", "<", "<=") and self.sorted_keys is not None:
+            try:
+                if op == ">":
+                    keys = self.sorted_keys[bisect.bisect_right(self.sorted_keys, value):]
+                elif op == ">=":
+                    keys = self.sorted_keys[bisect.bisect_left(self.sorted_keys, value):]
+                elif op == "<":
+                    keys = self.sorted_keys[:bisect.bisect_left(self.sorted_keys, value)]
+                else:
+                    keys = self.sorted_keys[:bisect.bisect_right(self.sorted_keys, value)]
+                return set().union(*[self.values[key] for key in keys])
+            except TypeError:
+                pass
+        ret = set()
+        compare = _INDEX_OPERATORS[op]
+        for key, names in self.values.items():
+            try:
+                if compare(key, value):
+                    ret.update(names)
+            except TypeError:
+                continue
         return ret
 
 
@@ -151,54 +401,306 @@ class ResourcePool:
     """
     def __init__(self):
         self.topology = dict()
+        # 设备类型索引，设备类型到{设备名称: None}的映射，保持资源文件中的设备顺序，
+        # 只保存设备名称，延迟装载时不需要实例化设备
+        self._type_index = dict()
+        # 属性索引，(设备类型, 属性名称, 目标)到_AttributeIndex的映射，在第一次查询时建立
+        self._attribute_index = dict()
+        # 资源池的版本，设备增加、修改或者重新读取时增加
+        self.version = 0
+        # 按照资源池版本缓存的计算结果，版本改变时清空
+        self._memo = dict()
+        self._memo_version = 0
+        # 拓扑图，在第一次查询连接时建立，设备在第一次查询时加入
+        self._graph = None
+        # 设备租约，读取资源文件后创建
+        self.leases = None
+        # 客户端模式下预约服务的socket路径
+        self.broker = None
         self.reserved = None
         self.information = dict()
         self.file_name = None
         self.owner = None
+        # 紧凑格式文件头中记录的预连接设备
+        self._pre_connect = None
+        # 增量保存: 上次读取或者保存后修改过的设备，以及当时的设备名称和文件头
+        self._dirty = set()
+        self._saved_names = None
+        self._saved_header = None
+        # 并行执行时记录设备被哪一个占用者（测试用例）使用
+        self._occupied = dict()
+        self._occupy_lock = threading.RLock()
+        self._holder = threading.local()
+        # 资源分配器为设备选择的连接方案，(设备名称, id(连接限制条件)) -> (连接限制条件, 连接方案)
+        self._connections = dict()
+
+    def set_holder(self, holder):
+        """
+        设置当前线程的资源占用者，之后通过collect方法获取的设备会被该占用者独占，
+        其他占用者收集资源时会跳过这些设备
+        """
+        self._holder.name = holder
+
+    def get_holder(self):
+        """
+        获取当前线程的资源占用者
+        """
+        return getattr(self._holder, "name", None)
+
+    def release_holder(self, holder):
+        """
+        释放占用者占用的所有设备
+        """
+        with self._occupy_lock:
+            device_names = [k for k, v in self._occupied.items() if v == holder]
+            for device_name in device_names:
+                self._occupied.pop(device_name)
+            for key in [key for key in self._connections if key[0] in device_names]:
+                self._connections.pop(key)
+            if self.auto_reserve and any(device_names):
+                self.leases.release(device_names)
+        if getattr(self._holder, "name", None) == holder:
+            self._holder.name = None
+
+    def has_other_holder(self):
+        """
+        判断是否有当前线程以外的占用者正在占用设备
+        """
+        holder = getattr(self._holder, "name", None)
+        with self._occupy_lock:
+            return any(v != holder for v in self._occupied.values())
+
+    def _is_available(self, device):
+        if device._connection_state == ConnectionState.Failed:
+            # 预连接失败的设备不能被收集
+            return False
+        if self.leases is not None and not self.leases.is_available(device.name):
+            # 设备被其他执行器预约
+            return False
+        holder = getattr(self._holder, "name", None)
+        if holder is None:
+            return True
+        occupant = self._occupied.get(device.name, None)
+        return occupant is None or occupant == holder
+
+    def _occupy(self, devices):
+        holder = getattr(self._holder, "name", None)
+        if holder is None:
+            return
+        for device in devices:
+            self._occupied[device.name] = holder
+
+    def mark_dirty(self, device_name):
+        """
+        标记设备被修改，直接修改设备属性中的字典或者端口连接列表时需要调用
+        """
+        self._dirty.add(device_name)
+        self.version += 1
+
+    def get_memo(self):
+        """
+        获取当前版本的缓存，设备增加、修改或者重新读取以后缓存被清空，
+        用于缓存限制条件等只依赖设备属性的计算结果
+        """
+        if self._memo_version != self.version:
+            self._memo = dict()
+            self._memo_version = self.version
+        return self._memo
 
     def add_device(self, device_name, **kwargs):
         if device_name in self.topology:
             raise ResourceError(f"device {device_name} already exists")
         self.topology[device_name] = ResourceDevice(device_name, **kwargs)
+        self._index_device(self.topology[device_name])
+
+    def rebuild_index(self):
+        """
+        重新建立设备索引，直接修改topology或者设备属性后需要调用
+        """
+        self._type_index.clear()
+        self._attribute_index.clear()
+        self._graph = None
+        if isinstance(self.topology, LazyTopology):
+            # 延迟装载的设备在实例化时设置_pool
+            for name, device_type in self.topology.get_types():
+                self._type_index.setdefault(device_type, dict())[name] = None
+            for name in self.topology.get_materialized():
+                self.topology[name]._pool = self
+        else:
+            for device in self.topology.values():
+                self._type_index.setdefault(device.type, dict())[device.name] = None
+                device._pool = self
+        self.version += 1
+
+    def _index_device(self, device):
+        self._type_index.setdefault(device.type, dict())[device.name] = None
+        for key in [key for key in self._attribute_index if key[0] == device.type]:
+            self._attribute_index.pop(key)
+        self._graph = None
+        device._pool = self
+        self.version += 1
+
+    @property
+    def graph(self):
+        """
+        设备连接关系的拓扑图，修改端口连接后需要调用rebuild_index，
+        拓扑图在设备第一次查询连接时加入该设备，不会实例化延迟装载的所有设备
+        """
+        if self._graph is None:
+            self._graph = TopologyGraph()
+        return self._graph
+
+    def _get_attribute_index(self, device_type, attribute, target):
+        key = (device_type, attribute, target)
+        if key not in self._attribute_index:
+            self._attribute_index[key] = _AttributeIndex(
+                (self.topology[name] for name in self._type_index.get(device_type, dict())), attribute, target)
+        return self._attribute_index[key]
 
-    def reserve(self):
-        if self.file_name is None:
+    def get_candidates(self, device_type, constraints=list()):
+        """
+        通过索引获取可能满足限制条件的设备，结果保持资源文件中的设备顺序，
+        返回的设备仍然需要调用限制条件的is_meet判断
+        """
+        devices = self._type_index.get(device_type, dict())
+        names = None
+        for constraint in constraints:
+            for predicate in constraint.get_index_predicates():
+                index = self._get_attribute_index(device_type, predicate.attribute, predicate.target)
+                matched = index.lookup(predicate.op, predicate.value)
+                names = matched if names is None else names & matched
+                if not any(names):
+                    return list()
+        if names is None:
+            return [self.topology[name] for name in devices]
+        return [self.topology[name] for name in devices if name in names]
+
+    def reserve(self, device_names=None):
+        """
+        预约设备，预约的设备不能被其他执行器收集，租约需要通过心跳续约
+        :param device_names: 预约的设备名称，None表示所有设备
+        """
+        if self.leases is None:
             raise ResourceError("load a resource file first")
-        self.load(self.file_name, self.owner)
-        self.reserved = {"owner": self.owner, "date": time.strftime("%Y/%m/%d %H:%M:%S", time.localtime())}
-        self.save(self.file_name)
-
-    def release(self):
-        if self.file_name is None:
-            raise  ResourceError("load a resource file first")
-        self.load(self.file_name)
-        self.reserved = None
-        self.save(self.file_name)
+        try:
+            self.leases.acquire(list(self.topology.keys()) if device_names is None else device_names)
+        except ReservationError as re:
+            raise ResourceError(str(re))
+
+    def release(self, device_names=None):
+        """
+        释放预约的设备
+        :param device_names: 释放的设备名称，None表示当前执行器预约的所有设备
+        """
+        if self.leases is None:
+            raise ResourceError("load a resource file first")
+        self.leases.release(device_names)
+
+    def start_heartbeat(self):
+        if self.leases is not None:
+            self.leases.start_heartbeat(ResourceSetting.heartbeat_interval)
+
+    def stop_heartbeat(self):
+        if self.leases is not None:
+            self.leases.stop_heartbeat()
+
+    def _refresh_leases(self):
+        if self.leases is not None:
+            self.leases.refresh()
+
+    def _reserve_collected(self, devices):
+        """
+        设置了reserve_on_collect或者客户端模式时，预约收集到的设备
+        """
+        if self.auto_reserve and any(devices):
+            try:
+                self.leases.acquire([device.name for device in devices])
+            except ReservationError as re:
+                raise ResourceError(str(re))
 
     def collect_device(self, device_type, count, constraints=list()):
-        ret = list()
-        for key, value in self.topology.items():
-            if value.type == device_type:
-                for constraint in constraints:
-                    if not constraint.is_meet(value):
-                        break
-                else:
-                    ret.append(value)
-            if len(ret) >= count:
-                return ret
-        else:
-            return list()
+        if count > 1 and any(isinstance(constraint, ConnectionConstraint) for constraint in constraints):
+            return self.__collect_by_allocator(device_type, count, constraints)
+        if self.broker is not None:
+            return self.__collect_by_broker(device_type, count, constraints)
+        with self._occupy_lock:
+            self._refresh_leases()
+            ret = list()
+            for value in self.get_candidates(device_type, constraints):
+                if self._is_available(value):
+                    for constraint in constraints:
+                        if not constraint.is_meet(value):
+                            break
+                    else:
+                        ret.append(value)
+                if len(ret) >= count:
+                    self._reserve_collected(ret)
+                    self._occupy(ret)
+                    return ret
+            else:
+                return list()
 
     def collect_all_device(self, device_type, constraints=list()):
-        ret = list()
-        for key, value in self.topology.items():
-            if value.type == device_type:
-                for constraint in constraints:
-                    if not constraint.is_meet(value):
-                        break
-                else:
-                    ret.append(value)
-        return ret
+        if self.broker is not None:
+            return self.__collect_by_broker(device_type, None, constraints)
+        with self._occupy_lock:
+            self._refresh_leases()
+            ret = list()
+            for value in self.get_candidates(device_type, constraints):
+                if self._is_available(value):
+                    for constraint in constraints:
+                        if not constraint.is_meet(value):
+                            break
+                    else:
+                        ret.append(value)
+            self._reserve_collected(ret)
+            self._occupy(ret)
+            return ret
+
+    def __collect_by_allocator(self, device_type, count, constraints):
+        """
+        多个设备都有连接限制条件时，逐个选择可能让前面的设备用掉后面的设备唯一可用的连接(比如同一个STA)，
+        由资源分配器整体求解，设备之间的连接方案互不重叠，之后collect_connection_route返回分配的连接方案。
+        客户端模式下同样在本地求解，然后一次向预约服务预约整个方案中的设备(包括连接方案用到的设备)，
+        其中有设备已经被其他执行器预约时整体失败，不会只预约一部分
+        """
+        # 资源分配器依赖资源池，在这里导入避免循环导入
+        from core.resource.allocator import ResourceAllocator, DeviceRequest, AllocationError
+        request = DeviceRequest(device_type, device_type, count, constraints)
+        try:
+            allocation = ResourceAllocator(self).allocate([request])
+        except AllocationError:
+            return list()
+        for device in allocation[device_type]:
+            for constraint in request.connection_constraints:
+                self._connections[(device.name, id(constraint))] = \
+                    (constraint, allocation.get_connection(device, constraint))
+        return allocation[device_type]
+
+    def __collect_by_broker(self, device_type, count, constraints):
+        """
+        客户端模式：在本地判断限制条件，由预约服务在满足条件的设备中选择空闲的设备并预约，
+        选择和预约在预约服务中一次完成，不会和其他执行器冲突
+        :param count: None表示收集所有可用设备
+        """
+        with self._occupy_lock:
+            self._refresh_leases()
+            predicates = list()
+            for constraint in constraints:
+                predicates.extend(constraint.get_index_predicates())
+            names = list()
+            for value in self.get_candidates(device_type, constraints):
+                if self._is_available(value) and all(constraint.is_meet(value) for constraint in constraints):
+                    names.append(value.name)
+            if count is not None and len(names) < count:
+                return list()
+            try:
+                collected = self.leases.collect(device_type, count, predicates, names)
+            except ReservationError as re:
+                raise ResourceError(str(re))
+            ret = [self.topology[name] for name in collected]
+            self._occupy(ret)
+            return ret
 
     def collect_connection_route(self, resource, constraints=list()):
         """
@@ -211,7 +713,11 @@ class ResourcePool:
                     "collect_connection_route only accept ConnectionConstraints type")
         ret = list()
         for constraint in constraints:
-            conns = constraint.get_connection(resource)
+            allocated = self._connections.get((resource.name, id(constraint)), None)
+            if allocated is not None and allocated[0] is constraint:
+                conns = allocated[1]
+            else:
+                conns = constraint.get_connection(resource)
             if not any(conns):
                 raise ResourceNotMeetConstraint([constraint])
             for conn in conns:
@@ -225,22 +731,88 @@ class ResourcePool:
         self.file_name = filename
 
         # 初始化
-        self.topology.clear()
+        self._close_sessions()
+        self.topology = dict()
+        self._pre_connect = None
+        self._connections = dict()
+        self.rebuild_index()
         self.reserved = False
         self.information = dict()
 
-        #读取资源配置的json字符串
-        with open(filename) as file:
-            json_object = json.load(file)
+        if is_compact_file(filename):
+            # 紧凑格式只读取文件头和设备索引，设备在第一次访问时实例化
+            json_object, index, types = read_compact_index(filename)
+        else:
+            #读取资源配置的json字符串
+            with open(filename) as file:
+                json_object = json.load(file)
+
+        # 应用增量保存的日志
+        changes, header = merge_journal(read_journal(filename + JOURNAL_SUFFIX))
+        json_object.update(header)
+        if not is_compact_file(filename):
+            for name, device_dict in changes.items():
+                if device_dict is None:
+                    json_object['devices'].pop(name, None)
+                else:
+                    json_object['devices'][name] = device_dict
 
         #判断是否被占用
         if "reserved" in json_object and \
-            json_object['reserved'] is not None and \
+            json_object['reserved'] and \
                 json_object['reserved']['owner'] != owner:
             raise ResourceError(f"Resource is reserved by {json_object['reserved']['owner']}")
 
         self.owner = owner
+        self.leases = LeaseManager(filename + ".lease", owner, ResourceSetting.lease_time)
+        self.leases.refresh()
+        if is_compact_file(filename):
+            self._load_compact(filename, json_object, index, types, changes)
+        else:
+            self._load_object(json_object)
+        self.__reset_tracking()
+
+    def connect_broker(self, socket_path, owner):
+        """
+        客户端模式：从资源预约服务获取资源，设备的预约和释放都由预约服务处理，不再读写资源文件
+        :param socket_path: 预约服务的UNIX socket路径
+        """
+        # 预约服务依赖资源池，在这里导入避免循环导入
+        from core.resource.broker import BrokerClient, BrokerLeases
+        client = BrokerClient(socket_path)
+        json_object = client.request("inventory")
+        self._close_sessions()
+        self.topology = dict()
+        self._saved_names = None
+        self.rebuild_index()
+        self.reserved = None
+        self.information = dict()
+        self.file_name = None
+        self.owner = owner
+        self._connections = dict()
+        self.broker = socket_path
+        self.leases = BrokerLeases(client, owner)
+        self.leases.refresh()
+        self._load_object(json_object)
+
+    def _close_sessions(self):
+        """
+        重新读取拓扑之前关闭原来的设备的会话，新的设备即使同名也会建立新的通信实例
+        """
+        from core.resource.session import session_pool
+        session_pool.close_pool(self)
+
+    @property
+    def auto_reserve(self):
+        """
+        收集设备时是否自动预约设备，客户端模式下总是自动预约
+        """
+        return (ResourceSetting.reserve_on_collect or self.broker is not None) and self.leases is not None
 
+    def _load_object(self, json_object):
+        """
+        从资源文件的json对象中读取设备以及连接关系
+        """
         if "info" in json_object:
             self.information = json_object['info']
         for key, value in json_object['devices'].items():
@@ -256,19 +828,133 @@ class ResourcePool:
                             ports[remote_port["port"]]
                     self.topology[key].ports[port_name].\
                         remote_ports.append(remote_port_obj)
+        self.rebuild_index()
 
-    def save(self, filename):
+    def _load_compact(self, filename, header, index, types, changes):
         """
+        延迟装载紧凑格式的资源文件
+        :param changes: 日志文件中修改过的设备
+        """
+        self.information = header.get("info", None) or dict()
+        self._pre_connect = header.get("pre_connect", None)
+        self.topology = LazyTopology(filename, index, types, self._materialize)
+        for name, device_dict in changes.items():
+            if self._pre_connect is not None and name in self._pre_connect:
+                self._pre_connect.remove(name)
+            if device_dict is None:
+                if name in self.topology:
+                    del self.topology[name]
+            else:
+                self.topology.patch(name, device_dict)
+                if self._pre_connect is not None and device_dict.get("pre_connect", False):
+                    self._pre_connect.append(name)
+        self.rebuild_index()
+
+    def _materialize(self, device_dict):
+        device = ResourceDevice.from_dict(device_dict)
+        for port_name, port in device_dict['ports'].items():
+            if any(port['remote_ports']):
+                device.ports[port_name]._remote_refs = port['remote_ports']
+        device._pool = self
+        return device
 
+    def get_pre_connect_devices(self):
         """
-        with open(filename, mode="w") as file:
-            root_object = dict()
-            root_object['devices'] = dict()
-            root_object['info'] = self.information
-            root_object['reserved'] = self.reserved
-            for device_key, device in self.topology.items():
-                root_object['devices'][device_key] = device.to_dict()
-            json.dump(root_object, file, indent=4)
+        获取需要预连接的设备，紧凑格式的文件头中记录了这些设备，不需要实例化所有设备
+        """
+        if isinstance(self.topology, LazyTopology) and self._pre_connect is not None:
+            return [self.topology[name] for name in self._pre_connect if name in self.topology]
+        return [device for device in self.topology.values() if device.pre_connect]
+
+    def save(self, filename, full=False):
+        """
+        保存资源文件，加文件锁并且先写临时文件再重命名，其他执行器不会读到写了一半的文件。
+        保存到读取的资源文件时，只把修改过的设备追加到日志文件中，日志文件过大时把日志合并到资源文件中，
+        合并时以磁盘上的资源文件和日志为准，其他执行器追加的修改不会丢失
+        :param full: 总是合并日志，写入完整的资源文件
+        """
+        journal = filename + JOURNAL_SUFFIX
+        with file_lock(filename + ".lock"):
+            if filename == self.file_name and self._saved_names is not None and os.path.exists(filename):
+                entry = self.__get_changes()
+                if entry is not None:
+                    append_journal(journal, entry)
+                elif not full:
+                    return
+                journal_size = os.path.getsize(journal) if os.path.exists(journal) else 0
+                if not full and journal_size <= os.path.getsize(filename) * ResourceSetting.journal_compact_ratio:
+                    self.__reset_tracking()
+                    return
+                compact_journal(filename)
+            else:
+                if is_compact_file(filename):
+                    atomic_write(filename, self.to_compact())
+                else:
+                    atomic_write(filename, json.dumps(self.to_dict(), indent=4))
+                # 完整的资源文件已经包含了所有修改
+                if os.path.exists(journal):
+                    os.remove(journal)
+            if isinstance(self.topology, LazyTopology) and filename == self.topology.filename:
+                # 文件中的位置已经改变，重新建立索引，已经实例化的设备保持不变
+                header, index, types = read_compact_index(filename)
+                self._pre_connect = header.get("pre_connect", None)
+                self.topology.reindex(index, types)
+        if filename == self.file_name:
+            self.__reset_tracking()
+
+    def __get_changes(self):
+        """
+        获取上次读取或者保存以后的修改，没有修改时返回None
+        """
+        names = set(self.topology)
+        devices = dict()
+        for name in names - self._saved_names:
+            devices[name] = self.topology[name].to_dict()
+        for name in self._dirty & names:
+            devices[name] = self.topology[name].to_dict()
+        for name in self._saved_names - names:
+            devices[name] = None
+        entry = {"devices": devices}
+        header = json.dumps([self.information, self.reserved])
+        if header != self._saved_header:
+            entry['info'] = self.information
+            entry['reserved'] = self.reserved
+        if not any(devices) and len(entry) == 1:
+            return None
+        return entry
+
+    def __reset_tracking(self):
+        self._dirty = set()
+        self._saved_names = set(self.topology)
+        self._saved_header = json.dumps([self.information, self.reserved])
+
+    def to_compact(self):
+        """
+        转换为紧凑格式，延迟装载时还没有实例化的设备直接使用文件中的原始内容
+        """
+        lazy = isinstance(self.topology, LazyTopology)
+        pre_connect = list()
+        lines = list()
+        for name in self.topology:
+            if lazy and not self.topology.is_materialized(name):
+                lines.append(self.topology.get_raw_line(name).decode().rstrip("\n") + "\n")
+                if self._pre_connect is not None and name in self._pre_connect:
+                    pre_connect.append(name)
+            else:
+                device = self.topology[name]
+                lines.append(format_device_line(name, device.type, device.to_dict()))
+                if device.pre_connect:
+                    pre_connect.append(name)
+        return format_header(self.information, self.reserved or None, pre_connect) + "".join(lines)
+
+    def to_dict(self):
+        root_object = dict()
+        root_object['devices'] = dict()
+        root_object['info'] = self.information
+        root_object['reserved'] = self.reserved
+        for device_key, device in self.topology.items():
+            root_object['devices'][device_key] = device.to_dict()
+        return root_object
 
 
 class Constraint(metaclass=ABCMeta):
@@ -282,6 +968,13 @@ class Constraint(metaclass=ABCMeta):
     def is_meet(self, resource, *args, **kwargs):
         pass
 
+    def get_index_predicates(self):
+        """
+        返回可以通过资源池索引计算的谓词列表(IndexPredicate)，
+        谓词只用于缩小候选设备范围，必须是is_meet的必要条件
+        """
+        return list()
+
 
 class ConnectionConstraint(Constraint, metaclass=ABCMeta):
     """
@@ -291,6 +984,56 @@ class ConnectionConstraint(Constraint, metaclass=ABCMeta):
     def get_connection(self, resource, *args, **kwargs):
         pass
 
+    def get_options(self, resource):
+        """
+        枚举资源所有满足条件的连接方案(ConnectionOption)，供资源分配器回溯搜索使用。
+        默认只返回get_connection的结果，子类可以重写以枚举所有可能的方案
+        """
+        conns = self.get_connection(resource)
+        if conns:
+            yield ConnectionOption(conns, get_used_resources(conns))
+
+
+class ConnectionOption:
+    """
+    连接限制条件的一个连接方案
+    :param value: 方案的值，和get_connection的返回值格式相同
+    :param used: 方案占用的资源(设备或者端口)集合，同一次分配中不同方案占用的资源不能重叠
+    """
+    def __init__(self, value, used):
+        self.value = value
+        self.used = frozenset(used)
+
+
+def get_used_resources(value):
+    """
+    获取连接结果中包含的所有设备和端口
+    """
+    ret = set()
+    if isinstance(value, (ResourceDevice, DevicePort)):
+        ret.add(value)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            ret.update(get_used_resources(item))
+    return ret
+
+
+def iter_disjoint_options(candidates, count, used=frozenset()):
+    """
+    从候选对象中选择count个，每个候选对象有多个可选方案，所选方案占用的资源互不重叠
+    :param candidates: 候选对象的方案列表，[[ConnectionOption, ...], ...]
+    :return: 生成器，每次返回所选方案的列表
+    """
+    if count == 0:
+        yield list()
+        return
+    for index in range(len(candidates) - count + 1):
+        for option in candidates[index]:
+            if option.used & used:
+                continue
+            for rest in iter_disjoint_options(candidates[index + 1:], count - 1, used | option.used):
+                yield [option] + rest
+
 
 @static_setting.setting("ResourceSetting")
 class ResourceSetting(SettingBase):
@@ -298,6 +1041,43 @@ class ResourceSetting(SettingBase):
 
     resource_path = os.path.join(os.environ['HOME'], "test_resource")
     auto_connect = False
+    # 设备租约时间(秒)以及心跳续约的间隔(秒)
+    lease_time = 600
+    heartbeat_interval = 60
+    # 收集设备时自动预约设备，多个执行器共享同一个资源文件时使用
+    reserve_on_collect = False
+    # 增量保存的日志文件超过资源文件大小的该比例时，重新写入完整的资源文件
+    journal_compact_ratio = 0.5
+
+
+def to_resource_reference(value):
+    """
+    将设备、端口或者由它们组成的列表转换为可以序列化的引用，
+    不是测试资源的值返回None
+    """
+    if isinstance(value, ResourceDevice):
+        return {"device": value.name}
+    if isinstance(value, DevicePort):
+        return {"device": value.parent.name, "port": value.name}
+    if isinstance(value, (list, tuple)) and any(value):
+        items = [to_resource_reference(item) for item in value]
+        if any(item is None for item in items):
+            return None
+        return {"items": items, "tuple": isinstance(value, tuple)}
+    return None
+
+
+def from_resource_reference(pool, reference):
+    """
+    根据资源引用从资源池中找到对应的设备或者端口对象
+    """
+    if "items" in reference:
+        items = [from_resource_reference(pool, item) for item in reference['items']]
+        return tuple(items) if reference['tuple'] else items
+    device = pool.topology[reference['device']]
+    if "port" in reference:
+        return device.ports[reference['port']]
+    return device
 
 
 def get_resource_pool(filename, owner):
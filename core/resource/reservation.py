@@ -0,0 +1,188 @@
+"""
+资源文件的设备预约
+
+多个执行器共享同一个资源文件时，每个设备单独预约，预约记录保存在资源文件旁边的租约文件中。
+租约文件的读写通过操作系统的文件锁(fcntl)互斥，写入时先写临时文件再重命名，
+租约有过期时间，执行器通过心跳线程定期续约，执行器异常退出后租约自动过期
+"""
+import fcntl
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ReservationError(Exception):
+    """
+    设备已经被其他执行器预约
+    :param conflicts: 设备名称到预约者的映射
+    """
+    def __init__(self, conflicts):
+        super().__init__("Device reserved by others: " +
+                         ", ".join(f"{name}({owner})" for name, owner in conflicts.items()))
+        self.conflicts = conflicts
+
+
+@contextmanager
+def file_lock(filename):
+    """
+    使用fcntl对锁文件加排他锁
+    """
+    with open(filename, "a") as file:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write(filename, content):
+    """
+    先写入同一目录下的临时文件，再重命名为目标文件，其他进程不会读到写了一半的文件
+    """
+    dir_name = os.path.dirname(os.path.abspath(filename))
+    fd, temp_file = tempfile.mkstemp(dir=dir_name, prefix=os.path.basename(filename) + ".")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, filename)
+    except Exception:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+class LeaseManager:
+    """
+    设备租约管理
+    :param filename: 租约文件
+    :param owner: 预约者名称
+    :param lease_time: 租约时间(秒)
+    """
+    def __init__(self, filename, owner, lease_time=600):
+        self.filename = filename
+        self.lock_file = filename + ".lock"
+        self.owner = owner
+        # 同一个用户可能同时运行多个执行器，用主机名和进程号区分
+        self.holder = f"{owner}@{socket.gethostname()}:{os.getpid()}"
+        self.lease_time = lease_time
+        self._leases = dict()
+        self._heartbeat_thread = None
+        self._heartbeat_stop = threading.Event()
+
+    def _read(self):
+        if not os.path.exists(self.filename):
+            return dict()
+        with open(self.filename) as file:
+            try:
+                return json.load(file)
+            except ValueError:
+                return dict()
+
+    def _write(self, leases):
+        atomic_write(self.filename, json.dumps(leases, indent=4))
+        self._leases = leases
+
+    @staticmethod
+    def _drop_expired(leases):
+        now = time.time()
+        return {name: lease for name, lease in leases.items() if lease['expires'] > now}
+
+    def refresh(self):
+        """
+        重新读取租约文件，查询设备是否可用之前调用
+        """
+        self._leases = self._read()
+
+    def get_leases(self):
+        """
+        获取所有没有过期的租约
+        """
+        return self._drop_expired(self._leases)
+
+    def is_available(self, device_name):
+        """
+        设备没有被其他执行器预约
+        """
+        lease = self._leases.get(device_name, None)
+        return lease is None or lease['holder'] == self.holder or lease['expires'] <= time.time()
+
+    def acquire(self, device_names):
+        """
+        预约设备，所有设备都预约成功，或者都不预约
+        :raise ReservationError: 有设备已经被其他执行器预约
+        """
+        with file_lock(self.lock_file):
+            leases = self._drop_expired(self._read())
+            conflicts = {name: leases[name]['owner'] for name in device_names
+                         if name in leases and leases[name]['holder'] != self.holder}
+            if any(conflicts):
+                self._leases = leases
+                raise ReservationError(conflicts)
+            now = time.time()
+            for name in device_names:
+                leases[name] = {
+                    "owner": self.owner,
+                    "holder": self.holder,
+                    "date": time.strftime("%Y/%m/%d %H:%M:%S", time.localtime(now)),
+                    "expires": now + self.lease_time
+                }
+            self._write(leases)
+
+    def renew(self):
+        """
+        续约当前执行器预约的所有设备
+        :return: 续约的设备数量
+        """
+        with file_lock(self.lock_file):
+            leases = self._drop_expired(self._read())
+            expires = time.time() + self.lease_time
+            count = 0
+            for lease in leases.values():
+                if lease['holder'] == self.holder:
+                    lease['expires'] = expires
+                    count += 1
+            self._write(leases)
+            return count
+
+    def release(self, device_names=None):
+        """
+        释放预约
+        :param device_names: 释放的设备，None表示当前执行器预约的所有设备
+        """
+        with file_lock(self.lock_file):
+            leases = self._drop_expired(self._read())
+            for name in [name for name, lease in leases.items() if lease['holder'] == self.holder]:
+                if device_names is None or name in device_names:
+                    leases.pop(name)
+            self._write(leases)
+
+    def start_heartbeat(self, interval):
+        """
+        启动心跳线程，定期续约
+        """
+        if self._heartbeat_thread is not None:
+            return
+        self._heartbeat_stop.clear()
+        self._heartbeat_thread = threading.Thread(target=self.__heartbeat, args=(interval, ), daemon=True)
+        self._heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        if self._heartbeat_thread is None:
+            return
+        self._heartbeat_stop.set()
+        self._heartbeat_thread.join()
+        self._heartbeat_thread = None
+
+    def __heartbeat(self, interval):
+        while not self._heartbeat_stop.wait(interval):
+            try:
+                self.renew()
+            except Exception:
+                # 续约失败时等待下一次心跳重试，租约时间应该大于若干个心跳周期
+                continue
@@ -0,0 +1,292 @@
+"""
+设备通信实例的会话池
+
+会话池位于register_resource注册的实例化方法和测试用例之间，以设备或者端口为键缓存通信实例，
+get_comm_instance返回的共享实例也由会话池管理，acquire得到的是独占的会话，两者合计不超过最大会话数，
+一个设备可以同时有多个会话，会话在交给测试用例之前进行健康检查，连接断开时自动重连，
+空闲的会话定期保活，超过空闲时间后关闭，整个测试执行过程中的测试用例共享这些连接
+"""
+import threading
+import time
+from contextlib import contextmanager
+from core.config.setting import static_setting, SettingBase
+from core.resource.pool import ResourceDevice, ResourceError
+
+
+@static_setting.setting("SessionSetting")
+class SessionSetting(SettingBase):
+    file_name = "session_setting.setting"
+
+    # 每个设备或者端口的最大会话数
+    max_sessions = 4
+    # 获取会话的等待时间(秒)
+    acquire_timeout = 60
+    # 空闲会话的保活间隔(秒)
+    keepalive_interval = 60
+    # 空闲超过该时间(秒)的会话被关闭
+    idle_timeout = 600
+    # 健康检查失败时的重连次数
+    reconnect_retries = 2
+
+
+class SessionPoolError(ResourceError):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+class _Session:
+    def __init__(self, instance, resource=None):
+        self.instance = instance
+        self.last_used = time.time()
+        self.in_use = False
+        # 共享会话记录所属的设备或者端口，关闭时清除其缓存的实例
+        self.resource = resource
+
+    @property
+    def shared(self):
+        return self.resource is not None
+
+
+def _get_key(resource):
+    """
+    会话以设备或者端口对象本身为键，不同资源池或者重新读取的拓扑中同名的设备不会共享通信实例
+    """
+    return resource
+
+
+def _get_name(resource):
+    if isinstance(resource, ResourceDevice):
+        return resource.name
+    return f"{resource.parent.name}/{resource.name}"
+
+
+def _get_device(resource):
+    return resource if isinstance(resource, ResourceDevice) else resource.parent
+
+
+def _is_healthy(instance):
+    is_alive = getattr(instance, "is_alive", None)
+    return is_alive is None or is_alive()
+
+
+class SessionPool:
+    """
+    通信实例的会话池
+    """
+    def __init__(self):
+        # 设备或者端口的键 -> 会话列表
+        self.sessions = dict()
+        self.condition = threading.Condition()
+        self._keepalive_thread = None
+        self._keepalive_stop = threading.Event()
+
+    def acquire(self, resource, timeout=None):
+        """
+        获取设备或者端口的一个可用会话，没有空闲会话时创建新的会话，
+        会话数达到上限时等待其他测试用例释放
+        :raise SessionPoolError: 等待超时或者无法建立连接
+        """
+        key = _get_key(resource)
+        timeout = SessionSetting.acquire_timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        with self.condition:
+            sessions = self.sessions.setdefault(key, list())
+            while True:
+                # 共享会话可能同时被多个测试用例使用，不作为独占的会话
+                session = next((item for item in sessions if not item.in_use and not item.shared), None)
+                if session is not None or len(sessions) < SessionSetting.max_sessions:
+                    if session is None:
+                        session = _Session(None)
+                        sessions.append(session)
+                    session.in_use = True
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise SessionPoolError(f"Timeout waiting for a session of {_get_name(resource)}")
+                self.condition.wait(remaining)
+        # 建立连接以及健康检查可能耗时较长，不占用锁
+        try:
+            if session.instance is None:
+                session.instance = resource.create_comm_instance()
+                self.__connect(session.instance)
+            elif not _is_healthy(session.instance):
+                self.__reconnect(session.instance)
+        except Exception as ex:
+            self.__discard(key, session)
+            raise SessionPoolError(f"Cannot connect to {_get_name(resource)}: {ex}")
+        session.last_used = time.time()
+        return session.instance
+
+    def get_shared(self, resource, new=False):
+        """
+        获取设备或者端口的共享通信实例，即get_comm_instance返回的实例，不负责连接
+        :param new: 重新创建共享实例，原来的实例被断开
+        """
+        key = _get_key(resource)
+        with self.condition:
+            session = next((item for item in self.sessions.get(key, list()) if item.shared), None)
+            if session is not None and not new:
+                session.last_used = time.time()
+                return session.instance
+        # 创建通信实例可能耗时较长，不占用锁
+        instance = resource.create_comm_instance()
+        old = None
+        with self.condition:
+            sessions = self.sessions.setdefault(key, list())
+            session = next((item for item in sessions if item.shared), None)
+            if session is not None and not new:
+                # 其他线程已经创建了共享实例，丢弃刚刚创建的实例
+                old, session = _Session(instance), session
+            else:
+                if session is not None:
+                    sessions.remove(session)
+                old, session = session, _Session(instance, resource)
+                sessions.append(session)
+            session.last_used = time.time()
+        if old is not None:
+            self.__disconnect(old.instance)
+        return session.instance
+
+    def release(self, resource, instance):
+        """
+        归还会话
+        """
+        key = _get_key(resource)
+        with self.condition:
+            for session in self.sessions.get(key, list()):
+                if session.instance is instance:
+                    session.in_use = False
+                    session.last_used = time.time()
+                    break
+            self.condition.notify_all()
+
+    @contextmanager
+    def session(self, resource, timeout=None):
+        """
+        with session_pool.session(device) as cli:
+            cli.send_and_wait(...)
+        """
+        instance = self.acquire(resource, timeout)
+        try:
+            yield instance
+        finally:
+            self.release(resource, instance)
+
+    def close_all(self):
+        """
+        关闭所有空闲的会话以及共享会话
+        """
+        with self.condition:
+            for key, sessions in self.sessions.items():
+                for session in [item for item in sessions if not item.in_use]:
+                    self.__disconnect(session.instance)
+                    sessions.remove(session)
+                    if session.shared and session.resource._instance is session.instance:
+                        session.resource._instance = None
+
+    def invalidate(self, resource):
+        """
+        断开并且丢弃设备或者端口的所有会话，包括正在使用的会话，
+        用于阶段超时时使阻塞在通信中的调用返回，之后获取会话时重新建立连接
+        """
+        key = _get_key(resource)
+        with self.condition:
+            sessions = self.sessions.pop(key, list())
+            self.condition.notify_all()
+        for session in sessions:
+            self.__disconnect(session.instance)
+            if session.shared and session.resource._instance is session.instance:
+                session.resource._instance = None
+
+    def close_pool(self, pool):
+        """
+        断开并且丢弃资源池中所有设备和端口的会话，资源池重新读取拓扑之前调用
+        """
+        with self.condition:
+            resources = [key for key in self.sessions if getattr(_get_device(key), "_pool", None) is pool]
+        for resource in resources:
+            self.invalidate(resource)
+
+    def keepalive(self):
+        """
+        关闭空闲超时的会话，对其他空闲会话进行保活和健康检查
+        """
+        now = time.time()
+        checks = list()
+        with self.condition:
+            for key, sessions in self.sessions.items():
+                for session in [item for item in sessions if not item.in_use]:
+                    # 测试用例可能一直持有共享实例，共享会话只保活不关闭
+                    if not session.shared and now - session.last_used > SessionSetting.idle_timeout:
+                        self.__disconnect(session.instance)
+                        sessions.remove(session)
+                    else:
+                        # 检查期间不能被其他测试用例获取
+                        session.in_use = True
+                        checks.append((key, session))
+        for key, session in checks:
+            try:
+                keepalive = getattr(session.instance, "keepalive", None)
+                if keepalive is not None:
+                    keepalive()
+                if not _is_healthy(session.instance):
+                    self.__reconnect(session.instance)
+                with self.condition:
+                    session.in_use = False
+                    self.condition.notify_all()
+            except Exception:
+                self.__discard(key, session)
+
+    def start_keepalive(self):
+        if self._keepalive_thread is not None:
+            return
+        self._keepalive_stop.clear()
+        self._keepalive_thread = threading.Thread(target=self.__keepalive_loop, daemon=True)
+        self._keepalive_thread.start()
+
+    def stop_keepalive(self):
+        if self._keepalive_thread is None:
+            return
+        self._keepalive_stop.set()
+        self._keepalive_thread.join()
+        self._keepalive_thread = None
+
+    def __keepalive_loop(self):
+        while not self._keepalive_stop.wait(SessionSetting.keepalive_interval):
+            self.keepalive()
+
+    @staticmethod
+    def __connect(instance):
+        if hasattr(instance, "connect"):
+            instance.connect()
+        if not _is_healthy(instance):
+            raise SessionPoolError("connection is not alive")
+
+    def __reconnect(self, instance):
+        error = None
+        for _ in range(SessionSetting.reconnect_retries):
+            try:
+                self.__disconnect(instance)
+                self.__connect(instance)
+                return
+            except Exception as ex:
+                error = ex
+        raise SessionPoolError(f"reconnect failed: {error}")
+
+    @staticmethod
+    def __disconnect(instance):
+        try:
+            if hasattr(instance, "disconnect"):
+                instance.disconnect()
+        except Exception:
+            pass
+
+    def __discard(self, key, session):
+        self.__disconnect(session.instance)
+        with self.condition:
+            if session in self.sessions.get(key, list()):
+                self.sessions[key].remove(session)
+            self.condition.notify_all()
+
+
+session_pool = SessionPool()
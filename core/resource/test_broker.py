@@ -0,0 +1,92 @@
+"""
+预约服务的测试，在后台线程中启动预约服务，两个执行器通过预约服务收集设备
+"""
+import json
+import os
+import tempfile
+import unittest
+from core.resource.pool import ResourcePool, ResourceDevice, ConnectionConstraint, ConnectionOption
+from core.resource.broker import ResourceBroker
+
+
+def _device(name, device_type, remotes=()):
+    return {
+        "name": name, "type": device_type, "description": None, "pre_connect": False,
+        "ports": {"WIFI": {"parent": name, "type": "WIFI", "name": "WIFI", "description": None,
+                           "remote_ports": [{"device": remote, "port": "WIFI"} for remote in remotes]}}
+    }
+
+
+class _StaConnected(ConnectionConstraint):
+    """
+    AP必须有一个STA连接，每个连接的STA是一个方案
+    """
+    def __init__(self):
+        super().__init__()
+        self.description = "AP Must have a STA Connected"
+
+    def is_meet(self, resource, *args, **kwargs):
+        return next(iter(self.get_options(resource)), None) is not None
+
+    def get_connection(self, resource, *args, **kwargs):
+        option = next(iter(self.get_options(resource)), None)
+        return list() if option is None else option.value
+
+    def get_options(self, resource):
+        if not isinstance(resource, ResourceDevice):
+            return
+        for remote_port in resource.ports["WIFI"].remote_ports:
+            if remote_port.parent.type == "STA":
+                yield ConnectionOption([remote_port.parent], [remote_port.parent])
+
+
+class TestBrokerCollect(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # ap2只连接sta1，逐个选择时ap1会用掉sta1
+        devices = [_device("ap1", "AP", ["sta1", "sta2"]), _device("ap2", "AP", ["sta1"]),
+                   _device("sta1", "STA", ["ap1", "ap2"]), _device("sta2", "STA", ["ap1"])]
+        resource_file = os.path.join(self.directory.name, "resource.json")
+        with open(resource_file, "w") as file:
+            json.dump({"info": {}, "reserved": None,
+                       "devices": {device["name"]: device for device in devices}}, file)
+        self.socket_path = os.path.join(self.directory.name, "broker.sock")
+        self.broker = ResourceBroker(resource_file, self.socket_path, "test")
+        self.broker.start()
+
+    def tearDown(self):
+        self.broker.stop()
+        self.directory.cleanup()
+
+    def connect(self, owner):
+        pool = ResourcePool()
+        pool.connect_broker(self.socket_path, owner)
+        return pool
+
+    def test_collect_with_connection_constraint(self):
+        runner1 = self.connect("runner1")
+        constraint = _StaConnected()
+        aps = runner1.collect_device("AP", 2, [constraint])
+        self.assertEqual([device.name for device in aps], ["ap1", "ap2"])
+        routes = [runner1.collect_connection_route(device, [constraint])[0].name for device in aps]
+        self.assertEqual(routes, ["sta2", "sta1"])
+        # 连接方案用到的STA和AP一起被预约
+        self.assertEqual({name: lease["owner"] for name, lease in self.broker.leases.items()},
+                         {"ap1": "runner1", "ap2": "runner1", "sta1": "runner1", "sta2": "runner1"})
+        runner2 = self.connect("runner2")
+        self.assertEqual(runner2.collect_all_device("STA"), list())
+        runner1.release()
+        self.assertEqual(len(runner2.collect_all_device("STA")), 2)
+
+    def test_collect_all_or_nothing(self):
+        runner1 = self.connect("runner1")
+        self.assertEqual(len(runner1.collect_device("STA", 1)), 1)
+        self.assertEqual(self.broker.leases["sta1"]["owner"], "runner1")
+        # sta1被占用，ap2没有可用的连接，不能只预约一部分设备
+        runner2 = self.connect("runner2")
+        self.assertEqual(runner2.collect_device("AP", 2, [_StaConnected()]), list())
+        self.assertEqual(set(self.broker.leases), {"sta1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
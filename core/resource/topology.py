@@ -0,0 +1,100 @@
+"""
+资源池的拓扑图
+
+按照(本端端口类型, 对端设备类型)建立每个设备的连接邻接表，设备在第一次查询连接时加入，
+并缓存多跳路径的查询结果(比如 AP -> STA -> TrafficGen)，
+连接限制条件通过查表获取连接，不需要每次遍历ports和remote_ports
+"""
+
+
+class TopologyGraph:
+    """
+    设备连接关系的邻接表
+    """
+    def __init__(self, devices=()):
+        # 设备名称 -> {(本端端口类型, 对端设备类型): [(本端端口, 对端端口), ...]}
+        self.adjacency = dict()
+        self._path_cache = dict()
+        for device in devices:
+            self.add_device(device)
+
+    def add_device(self, device):
+        # 新加入的设备不影响已经缓存的路径，重新加入的设备连接可能改变
+        if device.name in self.adjacency:
+            self._path_cache.clear()
+        links = dict()
+        for port in device.ports.values():
+            for remote_port in port.remote_ports:
+                key = (port.type, remote_port.parent.type)
+                links.setdefault(key, list()).append((port, remote_port))
+        self.adjacency[device.name] = links
+
+    def get_links(self, device, port_type=None, remote_type=None):
+        """
+        获取设备的连接
+        :param port_type: 本端端口类型，None表示任意类型
+        :param remote_type: 对端设备类型，None表示任意类型
+        :return: [(本端端口, 对端端口), ...]
+        """
+        links = self.adjacency.get(device.name, None)
+        if links is None:
+            # 延迟加载的资源池在设备第一次被访问时才建立邻接表
+            self.add_device(device)
+            links = self.adjacency[device.name]
+        if port_type is not None and remote_type is not None:
+            return links.get((port_type, remote_type), list())
+        ret = list()
+        for (link_port_type, link_remote_type), items in links.items():
+            if port_type is not None and link_port_type != port_type:
+                continue
+            if remote_type is not None and link_remote_type != remote_type:
+                continue
+            ret.extend(items)
+        return ret
+
+    def get_paths(self, device, hops):
+        """
+        获取从设备出发的多跳路径，结果会被缓存
+        :param hops: 每一跳的(本端端口类型, 对端设备类型)，
+                     比如 (("WIFI", "STA"), ("ETH", "TrafficGen"))
+        :return: 路径列表，每条路径是每一跳对端端口组成的元组
+        """
+        hops = tuple(tuple(hop) for hop in hops)
+        key = (device.name, hops)
+        if key not in self._path_cache:
+            if not any(hops):
+                self._path_cache[key] = [tuple()]
+            else:
+                paths = list()
+                for _, remote_port in self.get_links(device, *hops[0]):
+                    for path in self.get_paths(remote_port.parent, hops[1:]):
+                        paths.append((remote_port, ) + path)
+                self._path_cache[key] = paths
+        return self._path_cache[key]
+
+
+def get_links(resource, port_type=None, remote_type=None):
+    """
+    获取设备的连接，设备属于资源池时使用资源池的拓扑图，否则遍历设备的端口
+    """
+    pool = getattr(resource, "_pool", None)
+    if pool is not None:
+        return pool.graph.get_links(resource, port_type, remote_type)
+    ret = list()
+    for port in resource.ports.values():
+        if port_type is not None and port.type != port_type:
+            continue
+        for remote_port in port.remote_ports:
+            if remote_type is None or remote_port.parent.type == remote_type:
+                ret.append((port, remote_port))
+    return ret
+
+
+def get_paths(resource, hops):
+    """
+    获取设备出发的多跳路径，设备属于资源池时使用资源池的拓扑图缓存查询结果
+    :param hops: 每一跳的(本端端口类型, 对端设备类型)
+    """
+    pool = getattr(resource, "_pool", None)
+    graph = pool.graph if pool is not None else TopologyGraph()
+    return graph.get_paths(resource, hops)
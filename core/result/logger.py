@@ -1,6 +1,7 @@
 import logging
 import logging.handlers
 import os
+import threading
 import zipfile
 import time
 
@@ -39,11 +40,40 @@ def _check_and_create_directory(filename):
         os.makedirs(dir_name)
 
 
+class _CaseFilter(logging.Filter):
+    """
+    只输出绑定到指定测试用例的线程中产生的日志，并行执行时模块日志不会写入其他测试用例的日志文件
+    """
+    def __init__(self, manager, case_logger):
+        super().__init__()
+        self.manager = manager
+        self.case_logger = case_logger
+
+    def filter(self, record):
+        return self.manager.get_case() == self.case_logger
+
+
 class LoggerManager:
 
     def __init__(self):
         # 用于记录logger的配置信息
         self.logger_info = dict()
+        # 当前线程绑定的测试用例logger名称
+        self._context = threading.local()
+        self._lock = threading.RLock()
+
+    def bind_case(self, logger_name):
+        """
+        将当前线程绑定到测试用例的logger，模块日志输出到该测试用例的日志目录，
+        测试用例的阶段在其他线程中执行时，需要在该线程中重新绑定
+        """
+        self._context.case = logger_name
+
+    def get_case(self):
+        """
+        获取当前线程绑定的测试用例logger名称
+        """
+        return getattr(self._context, "case", None)
 
     def register(self, logger_name, filename=None, console=True,
                  default_level=logging.INFO, **kwargs):
@@ -65,16 +95,16 @@ class LoggerManager:
         # 获取新的logger 实例
         logger = logging.getLogger(logger_name)
 
-        self.logger_info[logger_name] = dict()
-        self.logger_info[logger_name]['timestamp'] = time.localtime()
-        self.logger_info[logger_name]['for_test'] = for_test
-        self.logger_info[logger_name]['is_test'] = is_test
+        info = dict()
+        info['timestamp'] = time.localtime()
+        info['for_test'] = for_test
+        info['is_test'] = is_test
 
         if filename:
             _check_and_create_directory(filename)
-            self.logger_info[logger_name]['file_path'] = os.path.dirname(filename)
-            self.logger_info[logger_name]['file_name'] = os.path.basename(filename)
-            self.logger_info[logger_name]['zip'] = zip_logger
+            info['file_path'] = os.path.dirname(filename)
+            info['file_name'] = os.path.basename(filename)
+            info['zip'] = zip_logger
             if max_files:
                 file_handler = \
                     logging.handlers.RotatingFileHandler(
@@ -86,16 +116,6 @@ class LoggerManager:
                 file_handler = logging.FileHandler(filename, mode=file_mode)
             file_handler.setFormatter(logging.Formatter(fmt=log_format))
             logger.addHandler(file_handler)
-            if is_test:
-                for llogger, lvalue in self.logger_info.items():
-                    # 需要是一个注册了日志文件的模块才能向测试用例输出日志
-                    if lvalue['for_test'] and "file_name" in lvalue:
-                        logger_filename = os.path.join(
-                            os.path.dirname(filename), f"{llogger}.log")
-                        case_handler = logging.FileHandler(logger_filename, mode="w")
-                        case_handler.setFormatter(logging.Formatter(fmt=log_format))
-                        lvalue['case_handler'] = case_handler
-                        lvalue['logger'].addHandler(case_handler)
 
         if console:
             stream_handler = logging.StreamHandler()
@@ -103,7 +123,23 @@ class LoggerManager:
             logger.addHandler(stream_handler)
 
         logger.setLevel(default_level)
-        self.logger_info[logger_name]['logger'] = logger
+        info['logger'] = logger
+        with self._lock:
+            self.logger_info[logger_name] = info
+            if is_test and filename:
+                # 每个测试用例有自己的模块日志handler，文件名以测试用例日志文件名为前缀，
+                # 同一目录下的测试用例不会互相覆盖，handler只输出绑定到该测试用例的线程中的日志
+                info['case_handlers'] = list()
+                prefix = os.path.splitext(filename)[0]
+                for llogger, lvalue in self.logger_info.items():
+                    # 需要是一个注册了日志文件的模块才能向测试用例输出日志
+                    if lvalue['for_test'] and "file_name" in lvalue:
+                        case_handler = logging.FileHandler(f"{prefix}.{llogger}.log", mode="w")
+                        case_handler.setFormatter(logging.Formatter(fmt=log_format))
+                        case_handler.addFilter(_CaseFilter(self, logger_name))
+                        lvalue['logger'].addHandler(case_handler)
+                        info['case_handlers'].append((lvalue['logger'], case_handler))
+                self.bind_case(logger_name)
         return logger
 
     def unregister(self, logger_name):
@@ -112,14 +148,21 @@ class LoggerManager:
         """
         if logger_name in logging.Logger.manager.loggerDict:
             logging.Logger.manager.loggerDict.pop(logger_name)
-            # 如果注册了测试用例的handler，则移除
-            if self.logger_info[logger_name]['is_test']:
-                for llogger, lvalue in self.logger_info.items():
-                    if 'case_handler' in lvalue:
-                        lvalue['logger'].removeHandler(lvalue['case_handler'])
-                        lvalue.pop("case_handler")
+            with self._lock:
+                info = self.logger_info[logger_name]
+                # 只移除该测试用例自己的模块日志handler
+                for module_logger, case_handler in info.get('case_handlers', list()):
+                    module_logger.removeHandler(case_handler)
+                    case_handler.close()
+                if info['is_test']:
+                    for handler in list(info['logger'].handlers):
+                        info['logger'].removeHandler(handler)
+                        handler.close()
+                    if self.get_case() == logger_name:
+                        self.bind_case(None)
             self._achieve_files(logger_name)
-            self.logger_info.pop(logger_name)
+            with self._lock:
+                self.logger_info.pop(logger_name)
 
     def _achieve_files(self, logger_name):
         if self.logger_info[logger_name]['zip']:
@@ -133,6 +176,15 @@ class LoggerManager:
                 self.logger_info[logger_name]['file_path'],
                 os.path.join(self.logger_info[logger_name]['file_path'], output_file))
 
+    def get_log_file(self, logger_name):
+        """
+        获取logger输出的日志文件路径，没有日志文件时返回None
+        """
+        if logger_name not in self.logger_info or "file_name" not in self.logger_info[logger_name]:
+            return None
+        return os.path.join(self.logger_info[logger_name]['file_path'],
+                            self.logger_info[logger_name]['file_name'])
+
     def get_logger(self, logger_name):
         if logger_name in self.logger_info:
             return self.logger_info[logger_name]["logger"]
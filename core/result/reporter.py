@@ -1,9 +1,26 @@
 import os
+import weakref
 from enum import IntEnum
-from threading import Event, Lock
+from threading import Event, Lock, current_thread
 from functools import wraps
 from core.utilities.time import get_local_time
 
+# 可以在进程之间传递并且重放的结果报告操作
+_STREAM_EVENTS = ("add_node", "pop", "add_step_group", "end_step_group", "add")
+# 阶段超时后被放弃的线程，这些线程对结果报告的操作被忽略
+_muted_threads = weakref.WeakSet()
+
+
+def mute_thread(thread):
+    """
+    忽略指定线程之后对结果报告的所有操作，用于被看门狗放弃的测试用例阶段线程
+    """
+    _muted_threads.add(thread)
+
+
+def is_muted():
+    return current_thread() in _muted_threads
+
 
 class StepResult(IntEnum):
     """
@@ -69,6 +86,15 @@ class ResultNode:
             self.status = status
         self.parent.set_status(status)
 
+    def append_node(self, node):
+        """
+        挂载一个已经生成的结果节点，并且更新当前节点的状态
+        """
+        node.parent = self
+        self.children.append(node)
+        self.set_status(node.status)
+        return node
+
     def add(self, status, header, message=""):
         """
         简化的add方法，提供给事件驱动
@@ -130,6 +156,20 @@ class ResultNode:
                 stats_exception += child_stats[4]
         return stats_pass, stats_fail, stats_error, stats_warning, stats_exception
 
+    def get_case_nodes(self, status_list=None):
+        """
+        获取所有测试用例节点
+        :param status_list: 只返回状态在列表中的测试用例节点，为None时返回全部
+        """
+        rv = list()
+        if self.type == NodeType.Case:
+            if status_list is None or self.status in status_list:
+                rv.append(self)
+            return rv
+        for child in self.children:
+            rv.extend(child.get_case_nodes(status_list))
+        return rv
+
     @property
     def is_leaf(self):
         return any(self.children)
@@ -149,6 +189,19 @@ class ResultNode:
             rv["children"].append(child.to_dict())
         return rv
 
+    @staticmethod
+    def from_dict(dict_obj, parent=None):
+        """
+        从to_dict输出的字典结构还原结果节点
+        """
+        node = ResultNode(dict_obj['header'], status=StepResult(dict_obj['status']),
+                          message=dict_obj['message'], parent=parent,
+                          node_type=NodeType(dict_obj['type']))
+        node.timestamp = dict_obj['timestamp']
+        for child in dict_obj['children']:
+            node.children.append(ResultNode.from_dict(child, node))
+        return node
+
     def to_text(self, indent=0):
         """
         将结果生成文本类型的结构
@@ -184,6 +237,8 @@ def locker(lock):
     def outer(func):
         @wraps(func)
         def inner(*args, **kwargs):
+            if is_muted():
+                return None
             try:
                 lock.acquire()
                 return func(*args, **kwargs)
@@ -269,6 +324,13 @@ class ResultReporter:
         self.recent_node = self.recent_list.parent
         self.recent_list = None
 
+    @locker(my_lock)
+    def add_result_node(self, node):
+        """
+        将其他结果报告中生成的节点挂载到当前节点下，用于合并并行执行的结果
+        """
+        self.recent_node.append_node(node)
+
     @locker(my_lock)
     def add_step_group(self, group_name):
         self.recent_node = self.recent_node.add_child(header=group_name,
@@ -308,12 +370,56 @@ class ResultReporter:
         elif status == StepResult.EXCEPTION and self.halt_on_exception:
             self.halt_event.wait()
 
+    def apply_event(self, event):
+        """
+        重放StreamReporter发送的结果报告事件
+        """
+        method, args = event
+        if method not in _STREAM_EVENTS:
+            raise ValueError(f"Unknown reporter event {method}")
+        getattr(self, method)(*args)
+
     def _log_info(self, message):
         if self.case_logger:
             self.case_logger.info(message)
         else:
             self.logger.info(message)
 
+
+class StreamReporter(ResultReporter):
+    """
+    将结果报告的操作以事件的形式放入队列，
+    用于在子进程中执行测试用例，父进程的结果报告通过apply_event重放这些事件
+    """
+    def __init__(self, logger, queue):
+        super().__init__(logger)
+        self.queue = queue
+
+    def _emit(self, method, args):
+        if not is_muted():
+            self.queue.put((method, args))
+
+    def add_node(self, header, message="", status=StepResult.INFO, node_type=NodeType.Other):
+        self._emit("add_node", (header, message, status, node_type))
+        return super().add_node(header, message, status, node_type)
+
+    def pop(self):
+        self._emit("pop", ())
+        super().pop()
+
+    def add_step_group(self, group_name):
+        self._emit("add_step_group", (group_name, ))
+        super().add_step_group(group_name)
+
+    def end_step_group(self):
+        self._emit("end_step_group", ())
+        super().end_step_group()
+
+    def add(self, status: StepResult, headline, message=""):
+        self._emit("add", (status, headline, message))
+        super().add(status, headline, message)
+
+
 if __name__ == "__main__":
     import logging
     rr = ResultReporter(logging)
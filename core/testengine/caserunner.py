@@ -2,16 +2,28 @@
 Test Engine
 """
 import importlib
+import json
+import logging
+import multiprocessing
 import threading
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from enum import Enum
+from queue import Empty
 from core.case.precondition import IsTestCaseType, IsTestCasePriority, IsPreCasePassed, IsHigherPriorityPassed
 from core.config.setting import static_setting, SettingBase
-from core.result.reporter import ResultReporter, StepResult
+from core.result.reporter import ResultReporter, StreamReporter, StepResult, mute_thread
 from core.case.base import TestCaseBase
 from core.resource.error import ResourceNotMeetConstraintError, ResourceLoadError, ResourceNotRelease
-from core.resource.pool import ResourcePool
+from core.resource.pool import ResourcePool, ResourceDevice, DevicePort, ResourceError, \
+    to_resource_reference, from_resource_reference
+from core.resource.session import session_pool
 from core.testengine.testlist import TestList
+from core.testengine.checkpoint import CheckpointJournal
+from core.testengine.shard import get_case_groups, assign_shards
+from core.testengine.history import DurationHistory
+from core.testengine.watchdog import PhaseTimeoutError, run_with_timeout
 from core.config.logicmodule import ModuleManager, ModuleType
 from core.result.logger import logger
 from core.utilities.time import get_time_stamp
@@ -26,6 +38,26 @@ class CaseRunnerSetting(SettingBase):
     log_path = os.path.join(os.environ['HOME'], "ats_logs")
     case_log = os.path.join(os.environ['HOME'], "case_logs")
     log_level = "INFO"
+    # 并行执行的工作线程数，1表示串行执行
+    worker_count = 1
+    # 测试用例SETUP、TEST、CLEANUP阶段的执行后端: thread 或者 process
+    backend = "thread"
+    # 延迟导入测试用例，测试用例在执行前才实例化，执行完毕后释放
+    lazy_import = False
+    # 测试用例执行时间的历史记录文件
+    history_file = os.path.join(os.environ['HOME'], "ats_logs", "duration_history.json")
+    # 同一优先级内，历史执行时间长的测试用例先执行
+    longest_first = False
+    # 并行预连接设备的线程数以及每个设备的连接超时时间(秒)
+    pre_connect_workers = 8
+    pre_connect_timeout = 60
+    # 有设备预连接失败时，继续使用其他设备执行测试，失败的设备不会被收集
+    allow_partial_resource = False
+    # 测试用例各个阶段的默认超时时间(秒)，比如{"setup": 300, "test": 3600}，没有设置的阶段不限制
+    phase_timeouts = dict()
+    # 串行执行时，连续的、共享测试环境名称(@case shared_fixture)和收集到的资源都相同的测试用例
+    # 只执行一次setup_shared，在分组边界执行cleanup_shared
+    group_by_resource = False
 
 
 class CaseImportError(Exception):
@@ -39,11 +71,180 @@ class TestEngineNotReadyError(Exception):
         super().__init__(msg)
 
 
+class CaseDeferred(Exception):
+    """
+    并行执行时测试资源被其他测试用例占用，测试用例需要等待之后重新执行
+    """
+    pass
+
+
 class RunningStatus(Enum):
     Idle = 1
     Running = 3
 
 
+def get_phase_timeouts(test: TestCaseBase):
+    """
+    获取测试用例各个阶段的超时时间(秒)，
+    优先级: 测试用例配置 > @case装饰器 > CaseRunnerSetting.phase_timeouts
+    """
+    timeouts = dict(CaseRunnerSetting.phase_timeouts)
+    timeouts.update(getattr(test, "timeouts", None) or dict())
+    if test.setting is not None:
+        timeouts.update(getattr(test.setting, "timeouts", None) or dict())
+    return timeouts
+
+
+def get_resource_signature(test: TestCaseBase):
+    """
+    获取测试用例收集到的资源的签名，和属性名称无关
+    """
+    references = list()
+    for value in test.__dict__.values():
+        reference = to_resource_reference(value)
+        if reference is not None:
+            references.append(json.dumps(reference, sort_keys=True))
+    return tuple(sorted(references))
+
+
+def _unwind_reporter(reporter, node):
+    """
+    阶段超时后，被放弃的阶段可能没有结束它添加的节点，将结果报告的当前节点回退到指定节点
+    """
+    while reporter.recent_node is not node and reporter.recent_node.parent:
+        reporter.pop()
+
+
+def _get_case_resources(test: TestCaseBase):
+    """
+    获取测试用例属性中的设备和端口，设备包含其所有端口
+    """
+    resources = list()
+    for value in test.__dict__.values():
+        for item in (value if isinstance(value, (list, tuple)) else (value, )):
+            if isinstance(item, ResourceDevice):
+                resources.append(item)
+                resources.extend(item.ports.values())
+            elif isinstance(item, DevicePort):
+                resources.append(item)
+    return resources
+
+
+def abandon_phase(test: TestCaseBase):
+    """
+    返回看门狗的超时回调: 忽略被放弃线程之后的结果报告，
+    并且断开测试用例使用的设备和端口的连接，使阻塞在通信中的调用返回
+    """
+    def on_timeout(worker):
+        mute_thread(worker)
+        for resource in _get_case_resources(test):
+            session_pool.invalidate(resource)
+    return on_timeout
+
+
+def run_test_phases(test: TestCaseBase, reporter, timeouts=None, initializer=None):
+    """
+    执行测试用例的SETUP、TEST以及CLEANUP阶段
+    :param timeouts: 各个阶段的超时时间，超时的阶段被标记为EXCEPTION，然后执行清除操作
+    :param initializer: 在阶段的工作线程中首先调用，比如设置资源占用者
+    :return: 各个阶段的执行时间
+    """
+    timeouts = get_phase_timeouts(test) if timeouts is None else timeouts
+    timings = dict()
+    for phase, method in (("setup", test.setup), ("test", test.test)):
+        start_time = time.time()
+        reporter.add_step_group(phase.upper())
+        group = reporter.recent_node
+        try:
+            run_with_timeout(phase, timeouts.get(phase, None), method,
+                             initializer=initializer, on_timeout=abandon_phase(test))
+            reporter.end_step_group()
+        except PhaseTimeoutError as pte:
+            _unwind_reporter(reporter, group)
+            reporter.add(StepResult.EXCEPTION, "执行超时!", str(pte))
+            reporter.end_step_group()
+            _call_cleanup(test, reporter, timings, timeouts, initializer)
+            return timings
+        except Exception as e:
+            reporter.add(StepResult.EXCEPTION, "捕获异常!", str(e))
+            reporter.end_step_group()
+            _call_cleanup(test, reporter, timings, timeouts, initializer)
+            return timings
+        finally:
+            timings[phase] = time.time() - start_time
+    _call_cleanup(test, reporter, timings, timeouts, initializer)
+    return timings
+
+
+def _call_cleanup(test: TestCaseBase, reporter, timings, timeouts, initializer=None):
+    """
+    执行清除操作
+    """
+    start_time = time.time()
+    node = reporter.recent_node
+    try:
+        reporter.add(StepResult.INFO, "CLEANUP")
+        run_with_timeout("cleanup", timeouts.get("cleanup", None), test.cleanup,
+                         initializer=initializer, on_timeout=abandon_phase(test))
+    except PhaseTimeoutError as pte:
+        _unwind_reporter(reporter, node)
+        reporter.add(StepResult.EXCEPTION, "清除操作超时!", str(pte))
+    except Exception as e:
+        reporter.add(StepResult.EXCEPTION, "EXCEPTION!", str(e))
+    finally:
+        reporter.pop()
+        timings['cleanup'] = time.time() - start_time
+
+
+# 子进程中缓存的配置路径以及资源池，同一个进程只装载一次
+_process_context = dict()
+
+
+def _run_case_in_process(context, case_path, setting, selection, log_file, queue):
+    """
+    在子进程中执行测试用例的SETUP、TEST以及CLEANUP阶段，
+    结果报告的操作通过队列发送回父进程
+    :param context: 配置路径、资源文件以及资源使用者
+    :param case_path: 测试用例的完整名称 package.module.class
+    :param setting: 测试用例配置的路径和文件名，没有配置时为None
+    :param selection: 测试用例在collect_resource中选择的测试资源引用
+    """
+    try:
+        if _process_context.get("setting_path") != context['setting_path']:
+            static_setting.setting_path = context['setting_path']
+            static_setting.load_all()
+            _process_context['setting_path'] = context['setting_path']
+        resource_key = (context['resource_file'], context['broker'], context['owner'])
+        if _process_context.get("resource_key") != resource_key:
+            pool = ResourcePool()
+            if context['broker']:
+                pool.connect_broker(context['broker'], context['owner'])
+            else:
+                pool.load(context['resource_file'], context['owner'])
+            _process_context['resource_key'] = resource_key
+            _process_context['resource_pool'] = pool
+        pool = _process_context['resource_pool']
+
+        case_module = importlib.import_module(".".join(case_path.split(".")[0: -1]))
+        case_name = case_path.split(".")[-1]
+        # 执行结果由父进程记录到测试用例日志中，子进程的结果报告不输出日志
+        reporter_log = logging.getLogger("ProcessCaseReporter")
+        reporter_log.propagate = False
+        reporter = StreamReporter(reporter_log, queue)
+        test = getattr(case_module, case_name)(reporter)
+        test.logger = logger.register(case_name, filename=log_file, console=False, mode="a")
+        try:
+            if setting is not None:
+                test.get_setting(setting[0], setting[1])
+            for name, reference in selection.items():
+                setattr(test, name, from_resource_reference(pool, reference))
+            return run_test_phases(test, reporter)
+        finally:
+            logger.unregister(case_name)
+    finally:
+        queue.put(None)
+
+
 class CaseRunner():
     """
     测试用例执行器
@@ -54,7 +255,6 @@ class CaseRunner():
         self.test_list = None
         self.case_tree = dict()
         self.priority_list = list()
-        self.pre_conditions = list()
         self.status = RunningStatus.Idle
         self.module_manager = ModuleManager()
         self.running_thread = None
@@ -65,16 +265,38 @@ class CaseRunner():
         self.logger.info("执行器装载完毕")
         self.case_log_folder = None
         self.case_result = dict()
+        self.case_result_lock = threading.RLock()
+        self.case_log_lock = threading.Lock()
+        self.process_executor = None
+        self.process_manager = None
+        # 已经导入的测试用例模块，同一个模块只导入一次
+        self.module_cache = dict()
+        self.checkpoint = None
+        self.history = None
+        # 预连接失败的设备名称以及失败原因
+        self.pre_connect_failures = dict()
+        # 执行进度：测试用例总数、已经执行完毕的测试用例、正在执行的测试用例的开始时间
+        self.progress_lock = threading.Lock()
+        self.progress_total = 0
+        self.progress_finished = set()
+        self.progress_running = dict()
+        self.start_time = None
+        # 当前的资源分组: 分组的键、共享的测试环境、最近使用该环境的测试用例及其结果节点
+        self.shared_group = None
+        self.shared_group_warned = False
 
-    def load_resource(self, file_name, username):
+    def load_resource(self, file_name, username, broker=None):
+        """
+        装载测试资源
+        :param broker: 资源预约服务的socket路径，指定时从预约服务获取资源
+        """
         self.resource_pool = ResourcePool()
         try:
-            self.resource_pool.load(file_name, username)
-            for key, device in self.resource_pool.topology.items():
-                if device.pre_connect:
-                    device_instance = device.get_comm_instance()
-                    if hasattr(device_instance, "connect"):
-                        device_instance.connect()
+            if broker:
+                self.resource_pool.connect_broker(broker, username)
+            else:
+                self.resource_pool.load(file_name, username)
+            self.__pre_connect_devices()
         except ResourceLoadError as rle:
             #资源文件读取错误
             self.logger.exception(rle)
@@ -88,6 +310,45 @@ class CaseRunner():
             self.resource_pool = None
         self.logger.info("测试资源装载完毕")
 
+    def __pre_connect_devices(self):
+        """
+        在线程池中并行连接需要预连接的设备，每个设备有独立的连接超时时间
+        :raise ResourceLoadError: 有设备连接失败并且不允许部分资源执行
+        """
+        devices = self.resource_pool.get_pre_connect_devices()
+        if not any(devices):
+            return
+        self.pre_connect_failures = dict()
+        with ThreadPoolExecutor(max_workers=CaseRunnerSetting.pre_connect_workers) as executor:
+            futures = {executor.submit(self.__pre_connect_device, device): device for device in devices}
+            for future, device in futures.items():
+                try:
+                    future.result()
+                except Exception as ex:
+                    device.mark_failed(str(ex))
+                    self.pre_connect_failures[device.name] = str(ex)
+        self.logger.info(f"设备预连接完毕，成功{len(devices) - len(self.pre_connect_failures)}个，"
+                         f"失败{len(self.pre_connect_failures)}个")
+        for name, error in self.pre_connect_failures.items():
+            self.logger.error(f"设备{name}连接失败: {error}")
+        if any(self.pre_connect_failures) and not CaseRunnerSetting.allow_partial_resource:
+            raise ResourceLoadError(self.resource_pool.file_name,
+                                    ResourceError("Failed to connect " + ", ".join(self.pre_connect_failures)))
+
+    @staticmethod
+    def __pre_connect_device(device):
+        """
+        在超时时间内连接设备，超时时断开设备的会话使阻塞的连接尽快返回，
+        被放弃的连接线程之后不再更新设备的连接状态
+        """
+        cancelled = threading.Event()
+
+        def on_timeout(worker):
+            cancelled.set()
+            session_pool.invalidate(device)
+        run_with_timeout("connect", CaseRunnerSetting.pre_connect_timeout, device.connect, cancelled,
+                         on_timeout=on_timeout, grace_period=0)
+
     @property
     def resource_ready(self):
         return self.resource_pool is not None
@@ -96,20 +357,31 @@ class CaseRunner():
     def test_list_ready(self):
         return self.test_list is not None
 
-    def load_test(self, test_name) -> TestCaseBase:
+    def get_case_class(self, test_name):
         """
-        实例化测试用例
+        获取测试用例类，测试用例模块通过缓存只导入一次
         """
         #获取测试用例的模块名和类名
         case_module_name = ".".join(test_name.split(".")[0: -1])
         case_name = test_name.split(".")[-1]
         try:
-            case_module = importlib.import_module(case_module_name)
-            return getattr(case_module, case_name)(self.result_report)
+            if case_module_name not in self.module_cache:
+                self.module_cache[case_module_name] = importlib.import_module(case_module_name)
+            return getattr(self.module_cache[case_module_name], case_name)
         except Exception as ex:
             # 导入测试用例失败，抛出异常
             raise CaseImportError("Failed to Import Test Case %s" % test_name, ex)
 
+    def load_test(self, test_name, reporter=None) -> TestCaseBase:
+        """
+        实例化测试用例
+        """
+        case_class = self.get_case_class(test_name)
+        try:
+            return case_class(self.result_report if reporter is None else reporter)
+        except Exception as ex:
+            raise CaseImportError("Failed to Import Test Case %s" % test_name, ex)
+
     def set_test_list(self, test_list: TestList):
         """
         #装载测试列表
@@ -122,9 +394,56 @@ class CaseRunner():
             self.priority_list = self.test_list.setting.priority_to_run
         self.logger.info("测试列表装载完毕")
 
-    def start(self):
+    def filter_test_cases(self, case_names):
+        """
+        只保留指定的测试用例以及它们依赖的前置测试用例(包括间接依赖)
+        :param case_names: 测试用例名称，即测试用例的类名
+        """
+        tests = list()
+        self.__flatten_case_tree(self.case_tree, tests)
+        tests_by_name = dict()
+        for test in tests:
+            tests_by_name.setdefault(test['case_name'], list()).append(test)
+        keep = set()
+        names = list(case_names)
+        while any(names):
+            name = names.pop()
+            if name in keep:
+                continue
+            keep.add(name)
+            for test in tests_by_name.get(name, []):
+                names.extend(self.__get_case_attr(test, "pre_tests", []))
+        self.__prune_case_tree(self.case_tree, lambda test: test['case_name'] in keep)
+        self.logger.info(f"测试列表筛选完毕，需要执行{len([t for t in tests if t['case_name'] in keep])}个测试用例")
+
+    def select_shard(self, shard_index, shard_count, weights=None):
+        """
+        只保留属于当前分片的测试用例，前置测试用例依赖链总是在同一个分片中
+        :param weights: 测试用例权重(历史执行时间)，为None时按照测试用例数量均衡
+        """
+        tests = list()
+        self.__flatten_case_tree(self.case_tree, tests)
+        groups = get_case_groups(tests, lambda test: self.__get_case_attr(test, "pre_tests", []))
+        shards = assign_shards(groups, shard_count, weights)
+        selected = set()
+        for group, shard in zip(groups, shards):
+            if shard == shard_index:
+                selected.update(id(test) for test in group)
+        self.__prune_case_tree(self.case_tree, lambda test: id(test) in selected)
+        self.logger.info(f"分片{shard_index}/{shard_count}，需要执行{len(selected)}个测试用例")
+
+    def __prune_case_tree(self, testlist, predicate):
+        """
+        删除测试用例树中不满足条件的测试用例
+        """
+        testlist['test_cases'] = [test for test in testlist['test_cases'] if predicate(test)]
+        for sub_list in testlist['sub_list']:
+            self.__prune_case_tree(sub_list, predicate)
+
+    def start(self, checkpoint_file=None):
         """
         测试引擎开始执行
+        :param checkpoint_file: 断点记录文件，指定时从断点恢复执行，跳过已经执行完毕的测试用例
         """
         if self.status == RunningStatus.Running:
             return
@@ -134,24 +453,75 @@ class CaseRunner():
             raise TestEngineNotReadyError("测试引擎未准备就绪，测试列表未装载")
         self.status = RunningStatus.Running
         self.case_log_folder = os.path.join(CaseRunnerSetting.case_log, get_time_stamp())
-        self.running_thread = threading.Thread(target=self.__main_test_thread)
+        if checkpoint_file:
+            self.checkpoint = CheckpointJournal(checkpoint_file)
+            self.checkpoint.load()
+            self.case_result.update(self.checkpoint.get_case_result())
+            self.logger.info(f"从断点恢复执行，已经执行完毕{len(self.checkpoint.records)}个测试用例")
+        else:
+            self.checkpoint = CheckpointJournal(
+                os.path.join(self.case_log_folder, "checkpoint.journal"))
+        self.logger.info(f"断点记录文件: {self.checkpoint.filename}")
+        self.__init_history()
+        self.__init_progress()
+        if CaseRunnerSetting.worker_count > 1:
+            self.running_thread = threading.Thread(target=self.__parallel_test_thread)
+        else:
+            self.running_thread = threading.Thread(target=self.__main_test_thread)
         self.running_thread.start()
 
     def wait_for_test_done(self):
         self.running_thread.join()
 
-    def run_case_lcm(self, test: TestCaseBase):
+    def get_progress(self):
+        """
+        获取执行进度以及预计剩余时间，剩余时间根据历史执行时间估算，
+        没有历史记录的测试用例使用所有测试用例的平均执行时间
+        """
+        now = time.time()
+        with self.progress_lock:
+            finished = set(self.progress_finished)
+            running = dict(self.progress_running)
+        tests = list()
+        self.__flatten_case_tree(self.case_tree, tests)
+        remaining = 0
+        if self.history is not None:
+            mean_duration = self.history.get_mean_duration()
+            for test in tests:
+                if test['case_id'] in finished:
+                    continue
+                duration = self.history.get_duration(test['case_name'], mean_duration)
+                if test['case_id'] in running:
+                    duration = max(duration - (now - running[test['case_id']]), 0)
+                remaining += duration
+            remaining /= max(min(CaseRunnerSetting.worker_count, len(tests) - len(finished)), 1)
+        elapsed = now - self.start_time if self.start_time is not None else 0
+        return {
+            "status": self.status.name,
+            "total": self.progress_total,
+            "finished": len(finished),
+            "running": len(running),
+            "elapsed": elapsed,
+            "remaining": remaining,
+            "eta": now + remaining if self.status == RunningStatus.Running else None
+        }
+
+    def run_case_lcm(self, test: TestCaseBase, reporter=None, defer=False):
         """
         执行测试用例生命周期管理
         这个方法应该在子线程被运行
+        :param reporter: 测试结果报告，并行执行时每个测试用例使用自己的结果报告
+        :param defer: 为真时，如果测试资源被其他测试用例占用则抛出CaseDeferred
         """
-        self.__init_precondition(test)
-        if not self.__pre_check(test):
+        reporter = self.result_report if reporter is None else reporter
+        if not self.__pre_check(test, self.__init_precondition(test), reporter):
             return
         self.module_manager.run_module(ModuleType.PRE)
         self.module_manager.run_module(ModuleType.PARALLEL)
-        self.__run_case(test)
-        self.module_manager.stop_module()
+        try:
+            self.__run_case(test, reporter, defer)
+        finally:
+            self.module_manager.stop_module()
         self.module_manager.run_module(ModuleType.POST)
 
     def _import_list_case(self, case_tree_node, test_list, log_path=None):
@@ -163,6 +533,8 @@ class CaseRunner():
             case_log_path = log_path + "/" + case_log_path
         case_tree_node["list_name"] = test_list.test_list_name
         case_tree_node["test_cases"] = list()
+        # 同一个列表中出现多次的测试用例，用序号区分断点记录
+        case_count = dict()
         for testcase in test_list.test_cases:
             if testcase.strip() == "":
                 continue
@@ -172,24 +544,30 @@ class CaseRunner():
             case_setting_file = ""
             if len(case_entry) > 1:
                 case_setting_file = case_entry[1]
-            try:
-                # 导入测试用例
-                case_descriptor['case'] = self.load_test(case_name)
-                case_descriptor['case_name'] = case_name.split(".")[-1]
-                case_descriptor['log_path'] = case_log_path
-                case_descriptor['setting_file'] = case_setting_file
-                # 设置测试用例配置文件路径
-                if test_list.setting.case_setting_path:
-                    case_descriptor['setting_path'] = test_list.setting.case_setting_path
-                else:
-                    case_descriptor['setting_path'] = CaseRunnerSetting.default_case_setting_path
-                case_priority = getattr(case_descriptor['case'], "priority", 999)
-                if case_priority not in self.priority_list:
-                    self.priority_list.append(case_priority)
-            except CaseImportError as cie:
-                # 测试用例导入失败
-                self.logger.error(f"不能导入测试用例{case_name}")
-                self.logger.exception(cie)
+            case_descriptor['case_path'] = case_name
+            case_descriptor['case_name'] = case_name.split(".")[-1]
+            case_descriptor['log_path'] = case_log_path
+            case_descriptor['case_id'] = f"{case_log_path}/{case_name}"
+            if case_name in case_count:
+                case_descriptor['case_id'] += f"#{case_count[case_name]}"
+            case_count[case_name] = case_count.get(case_name, 0) + 1
+            case_descriptor['setting_file'] = case_setting_file
+            # 设置测试用例配置文件路径
+            if test_list.setting.case_setting_path:
+                case_descriptor['setting_path'] = test_list.setting.case_setting_path
+            else:
+                case_descriptor['setting_path'] = CaseRunnerSetting.default_case_setting_path
+            if not CaseRunnerSetting.lazy_import:
+                try:
+                    # 导入测试用例
+                    case_descriptor['case'] = self.load_test(case_name)
+                    case_priority = getattr(case_descriptor['case'], "priority", 999)
+                    if case_priority not in self.priority_list:
+                        self.priority_list.append(case_priority)
+                except CaseImportError as cie:
+                    # 测试用例导入失败
+                    self.logger.error(f"不能导入测试用例{case_name}")
+                    self.logger.exception(cie)
             case_tree_node['test_cases'].append(case_descriptor)
         case_tree_node['sub_list'] = list()
         for sub_list in test_list.sub_list:
@@ -198,102 +576,534 @@ class CaseRunner():
             self._import_list_case(sub_list_dict, sub_list, log_path=case_log_path)
 
     def __init_precondition(self, test: TestCaseBase):
-        self.pre_conditions.clear()
-        self.pre_conditions.append(IsTestCaseType(self.test_list.setting.run_type))
+        # 并行执行时其他线程会更新执行结果，前置条件使用结果的快照判断
+        with self.case_result_lock:
+            case_result = dict(self.case_result)
+        pre_conditions = list()
+        pre_conditions.append(IsTestCaseType(self.test_list.setting.run_type))
         if any(self.test_list.setting.priority_to_run):
-            self.pre_conditions.append(IsTestCasePriority(self.test_list.setting.priority_to_run))
+            pre_conditions.append(IsTestCasePriority(self.test_list.setting.priority_to_run))
         if any(test.pre_tests):
-            self.pre_conditions.append(IsPreCasePassed(self.case_result))
-        self.pre_conditions.append(IsHigherPriorityPassed(test.priority, self.case_result))
+            pre_conditions.append(IsPreCasePassed(case_result))
+        pre_conditions.append(IsHigherPriorityPassed(test.priority, case_result))
+        return pre_conditions
 
-    def __pre_check(self, test:TestCaseBase):
-        for condition in self.pre_conditions:
-            if not condition.is_meet(test, self.result_report):
-                self.result_report.add(StepResult.INFO, f"{test.__class__.__name__}不能执行！")
+    def __pre_check(self, test: TestCaseBase, pre_conditions, reporter):
+        for condition in pre_conditions:
+            if not condition.is_meet(test, reporter):
+                reporter.add(StepResult.INFO, f"{test.__class__.__name__}不能执行！")
                 return False
         return True
 
-    def __get_case_log(self, path, case_name):
-        log_path = os.path.join(self.case_log_folder, path, f"{case_name}.log")
-        return logger.register(case_name, filename=log_path, is_test=True)
+    def __get_case_log(self, test):
+        """
+        注册测试用例的logger，名称包含测试用例描述的id，并行执行或者同名的测试用例使用不同的logger
+        """
+        log_path = os.path.join(self.case_log_folder, test['log_path'], f"{test['case_name']}.log")
+        with self.case_log_lock:
+            return logger.register(f"{test['case_name']}-{id(test)}", filename=log_path, is_test=True)
 
+    def __release_case_log(self, test):
+        with self.case_log_lock:
+            logger.unregister(f"{test['case_name']}-{id(test)}")
+
+    def __prepare_case(self, test, reporter):
+        """
+        测试用例执行前实例化测试用例，导入失败时在结果报告中记录异常
+        """
+        if "case" in test:
+            return True
+        try:
+            test['case'] = self.load_test(test['case_path'], reporter)
+            return True
+        except CaseImportError as cie:
+            self.logger.error(f"不能导入测试用例{test['case_path']}")
+            self.logger.exception(cie)
+            reporter.add_test(test['case_name'])
+            reporter.add(StepResult.EXCEPTION, "测试用例导入失败", str(cie.inner_ex))
+            reporter.end_test()
+            return False
+
+    def __release_case(self, test):
+        """
+        延迟导入模式下，测试用例执行完毕后释放测试用例实例
+        """
+        if CaseRunnerSetting.lazy_import:
+            test.pop("case", None)
+
+    def __get_case_attr(self, test, name, default):
+        """
+        获取测试用例类的属性，延迟导入模式下不需要实例化测试用例
+        """
+        try:
+            return getattr(self.get_case_class(test['case_path']), name, default)
+        except CaseImportError:
+            return default
+
+    def __record_checkpoint(self, test, nodes):
+        """
+        测试用例执行完毕后写入断点记录
+        """
+        with self.case_result_lock:
+            case_result = self.case_result.get(test['case_name'], {"priority": 999, "result": False})
+            priority = case_result['priority']
+            result = case_result['result']
+        try:
+            self.checkpoint.record(test['case_id'], test['case_name'], priority, result, nodes)
+        except Exception as ex:
+            self.logger.exception(ex)
+
+    def __init_history(self):
+        """
+        读取执行时间的历史记录，设置了longest_first时按照历史执行时间排序测试列表
+        """
+        self.history = DurationHistory(CaseRunnerSetting.history_file)
+        try:
+            self.history.load()
+        except Exception as ex:
+            self.logger.error(f"不能读取执行时间历史记录{CaseRunnerSetting.history_file}")
+            self.logger.exception(ex)
+        if CaseRunnerSetting.longest_first:
+            self.__sort_longest_first(self.case_tree)
+
+    def __save_history(self):
+        try:
+            self.history.save()
+        except Exception as ex:
+            self.logger.exception(ex)
+
+    def __sort_longest_first(self, testlist):
+        """
+        同一个列表中，同一优先级的测试用例按照历史执行时间从长到短排序，
+        没有历史记录的测试用例排在最后，前置测试用例总是排在依赖它的测试用例之前
+        """
+        def sort_key(test):
+            return (self.__get_case_attr(test, "priority", 999),
+                    -self.history.get_duration(test['case_name'], 0))
+        tests = sorted(testlist['test_cases'], key=sort_key)
+        ordered = list()
+        placed = set()
+        while any(tests):
+            for test in tests:
+                names = set(item['case_name'] for item in tests if item is not test)
+                if not any(pre_test in names - placed
+                           for pre_test in self.__get_case_attr(test, "pre_tests", [])):
+                    break
+            else:
+                # 循环依赖，保持当前顺序
+                test = tests[0]
+            tests.remove(test)
+            ordered.append(test)
+            placed.add(test['case_name'])
+        testlist['test_cases'] = ordered
+        for sub_list in testlist['sub_list']:
+            self.__sort_longest_first(sub_list)
+
+    def __init_progress(self):
+        tests = list()
+        self.__flatten_case_tree(self.case_tree, tests)
+        with self.progress_lock:
+            self.start_time = time.time()
+            self.progress_total = len(tests)
+            self.progress_finished = set(test['case_id'] for test in tests
+                                         if self.checkpoint.is_done(test['case_id']))
+            self.progress_running.clear()
+
+    def __start_progress(self, test):
+        with self.progress_lock:
+            self.progress_running[test['case_id']] = time.time()
+
+    def __finish_progress(self, test):
+        with self.progress_lock:
+            self.progress_running.pop(test['case_id'], None)
+            self.progress_finished.add(test['case_id'])
+
+    def __init_case_result(self, test: TestCaseBase):
+        with self.case_result_lock:
+            self.case_result[test.__class__.__name__] = dict()
+            self.case_result[test.__class__.__name__]['priority'] = test.priority
+            self.case_result[test.__class__.__name__]['result'] = False
+
+
+    def __start_backend(self):
+        if CaseRunnerSetting.backend == "process":
+            self.process_manager = multiprocessing.Manager()
+            self.process_executor = ProcessPoolExecutor(max_workers=CaseRunnerSetting.worker_count)
+
+    def __stop_backend(self):
+        if self.process_executor is not None:
+            self.process_executor.shutdown()
+            self.process_manager.shutdown()
+            self.process_executor = None
+            self.process_manager = None
+
+    def __start_resource_service(self):
+        """
+        启动会话保活，以及自动预约设备时的租约心跳
+        """
+        session_pool.start_keepalive()
+        if self.resource_pool.auto_reserve:
+            self.resource_pool.start_heartbeat()
+
+    def __stop_resource_service(self):
+        """
+        停止会话保活并关闭会话，停止续约并且释放本次执行预约的设备
+        """
+        session_pool.stop_keepalive()
+        session_pool.close_all()
+        if self.resource_pool.auto_reserve:
+            self.resource_pool.stop_heartbeat()
+            try:
+                self.resource_pool.release()
+            except Exception as ex:
+                self.logger.exception(ex)
 
     def __main_test_thread(self):
         try:
+            self.__start_backend()
+            self.__start_resource_service()
             self.__run_test_list(self.case_tree)
         finally:
+            self.__close_shared_group()
+            self.__stop_resource_service()
+            self.__stop_backend()
+            self.__save_history()
             self.status = RunningStatus.Idle
 
     def __run_test_list(self, testlist):
         self.result_report.add_list(testlist['list_name'])
         for test in testlist['test_cases']:
-            test["case"].get_setting(test["setting_path"], test["setting_file"])
-            self.result_report.case_logger = self.__get_case_log(test['log_path'], test['case_name'])
-            self.case_result[test["case_name"]] = dict()
-            self.case_result[test["case_name"]]['priority'] = test["case"].priority
-            self.case_result[test["case_name"]]['result'] = False
-            self.run_case_lcm(test['case'])
+            if self.checkpoint.is_done(test['case_id']):
+                # 从断点恢复时，已经执行完毕的测试用例直接还原测试结果
+                for node in self.checkpoint.get_nodes(test['case_id']):
+                    self.result_report.add_result_node(node)
+                continue
+            list_node = self.result_report.recent_node
+            start_index = len(list_node.children)
+            self.__start_progress(test)
+            self.result_report.case_logger = self.__get_case_log(test)
+            if self.__prepare_case(test, self.result_report):
+                test["case"].get_setting(test["setting_path"], test["setting_file"])
+                self.__init_case_result(test['case'])
+                self.run_case_lcm(test['case'])
+                self.__release_case(test)
             self.result_report.case_logger = None
-            logger.unregister(test['case_name'])
+            self.__release_case_log(test)
+            self.__record_checkpoint(test, list_node.children[start_index:])
+            if self.shared_group is not None and self.shared_group['case'] is test['case']:
+                # 清除共享的测试环境的结果记录在分组的最后一个测试用例中，之后需要重新写入断点记录
+                self.shared_group['checkpoint'] = (test, list_node.children[start_index:])
+            self.__finish_progress(test)
         for list in testlist['sub_list']:
             self.__run_test_list(list)
+        self.__close_shared_group()
         self.result_report.end_list()
 
-    def __run_case(self, test: TestCaseBase):
+    def __parallel_test_thread(self):
+        try:
+            self.__start_backend()
+            self.__start_resource_service()
+            self.__run_test_list_parallel(self.case_tree)
+        finally:
+            self.__stop_resource_service()
+            self.__stop_backend()
+            self.__save_history()
+            self.status = RunningStatus.Idle
+
+    def __flatten_case_tree(self, testlist, tests):
+        """
+        按照列表顺序展开测试用例树
+        """
+        for test in testlist['test_cases']:
+            tests.append(test)
+        for sub_list in testlist['sub_list']:
+            self.__flatten_case_tree(sub_list, tests)
+
+    def __get_ready_cases(self, pending, waiting, running):
+        """
+        获取可以开始执行的测试用例：
+        只执行当前最高优先级的测试用例，并且前置测试用例都已经执行完毕
+        :param waiting: 所有还没有执行完毕的测试用例
+        """
+        waiting_names = set(test['case_name'] for test in waiting)
+        highest_priority = min(self.__get_case_attr(test, "priority", 999) for test in waiting)
+        ready = list()
+        for test in pending:
+            if self.__get_case_attr(test, "priority", 999) != highest_priority:
+                continue
+            if any(pre_test in waiting_names for pre_test in self.__get_case_attr(test, "pre_tests", [])):
+                continue
+            ready.append(test)
+        if not any(ready) and not any(running):
+            # 前置条件无法满足(比如循环依赖)，按照列表顺序执行，由前置条件判断给出结果
+            ready.append(pending[0])
+        return ready
+
+    def __run_test_list_parallel(self, case_tree):
+        """
+        并行执行测试列表
+        每个测试用例使用独立的结果报告和日志，执行完毕后按照列表顺序合并到结果报告中
+        """
+        tests = list()
+        self.__flatten_case_tree(case_tree, tests)
+        order = {id(test): index for index, test in enumerate(tests)}
+        # 测试用例的结果节点
+        results = dict()
+        pending = list()
+        for test in tests:
+            if self.checkpoint.is_done(test['case_id']):
+                # 从断点恢复时，已经执行完毕的测试用例直接还原测试结果
+                results[id(test)] = self.checkpoint.get_nodes(test['case_id'])
+            else:
+                pending.append(test)
+        running = dict()
+        # 因为资源被占用而推迟的测试用例，等待其他测试用例执行完毕释放资源后再放回等待队列
+        deferred = list()
+        with ThreadPoolExecutor(max_workers=CaseRunnerSetting.worker_count) as executor:
+            while any(pending) or any(running) or any(deferred):
+                if any(deferred) and not any(running):
+                    pending = sorted(pending + deferred, key=lambda item: order[id(item)])
+                    deferred.clear()
+                waiting = pending + deferred + list(running.values())
+                for test in self.__get_ready_cases(pending, waiting, running) if any(pending) else []:
+                    if len(running) >= CaseRunnerSetting.worker_count:
+                        break
+                    pending.remove(test)
+                    self.__start_progress(test)
+                    running[executor.submit(self.__run_parallel_case, test)] = test
+                done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                released = False
+                for future in done:
+                    test = running.pop(future)
+                    try:
+                        results[id(test)] = list(future.result().root.children)
+                        self.__record_checkpoint(test, results[id(test)])
+                        self.__finish_progress(test)
+                        released = True
+                    except CaseDeferred:
+                        self.logger.info(f"{test['case_name']}的测试资源被占用，等待重新执行")
+                        deferred.append(test)
+                    except Exception as ex:
+                        released = True
+                        self.__finish_progress(test)
+                        self.logger.exception(ex)
+                if released and any(deferred):
+                    pending = sorted(pending + deferred, key=lambda item: order[id(item)])
+                    deferred.clear()
+        self.__merge_parallel_result(case_tree, results)
+
+    def __run_parallel_case(self, test):
+        """
+        在工作线程中执行一个测试用例，返回该测试用例的结果报告
+        """
+        holder = id(test)
+        reporter = ResultReporter(self.logger)
+        reporter.case_logger = self.__get_case_log(test)
+        try:
+            if not self.__prepare_case(test, reporter):
+                return reporter
+            test['case'].reporter = reporter
+            test['case'].logger = reporter.case_logger
+            self.resource_pool.set_holder(holder)
+            test["case"].get_setting(test["setting_path"], test["setting_file"])
+            self.__init_case_result(test['case'])
+            self.run_case_lcm(test['case'], reporter, defer=True)
+            self.__release_case(test)
+        finally:
+            self.resource_pool.release_holder(holder)
+            reporter.case_logger = None
+            self.__release_case_log(test)
+        return reporter
+
+    def __merge_parallel_result(self, testlist, results):
+        self.result_report.add_list(testlist['list_name'])
+        for test in testlist['test_cases']:
+            if id(test) not in results:
+                continue
+            for node in results[id(test)]:
+                self.result_report.add_result_node(node)
+        for sub_list in testlist['sub_list']:
+            self.__merge_parallel_result(sub_list, results)
+        self.result_report.end_list()
+
+    def __run_case(self, test: TestCaseBase, reporter, defer=False):
         """
         测试用例执行线程
         """
-        self.result_report.add_test(test.__class__.__name__)
+        reporter.add_test(test.__class__.__name__)
         _continue = True
+        timings = dict()
+        start_time = time.time()
         try:
-            self.result_report.add_step_group("收集测试资源")
-            test.collect_resource(self.resource_pool)
+            reporter.add_step_group("收集测试资源")
+            group = reporter.recent_node
+            run_with_timeout("collect_resource", get_phase_timeouts(test).get("collect_resource", None),
+                             test.collect_resource, self.resource_pool,
+                             initializer=self.__get_phase_initializer(), on_timeout=abandon_phase(test))
+        except PhaseTimeoutError as pte:
+            _unwind_reporter(reporter, group)
+            reporter.add(StepResult.EXCEPTION, "收集测试资源超时", str(pte))
+            _continue = False
         except ResourceNotMeetConstraintError as rnce:
-            self.result_report.add(StepResult.EXCEPTION, "测试资源不满足条件", str(rnce))
+            self.__check_deferred(defer, rnce)
+            reporter.add(StepResult.EXCEPTION, "测试资源不满足条件", str(rnce))
             _continue = False
         except Exception as e:
-            self.result_report.add(StepResult.EXCEPTION, "捕获异常！", str(e))
+            self.__check_deferred(defer, e)
+            reporter.add(StepResult.EXCEPTION, "捕获异常！", str(e))
             _continue = False
         finally:
-            self.result_report.end_step_group()
+            reporter.end_step_group()
+            timings['collect_resource'] = time.time() - start_time
 
-        if not _continue:
-            self.result_report.end_test()
+        if not _continue or not self.__enter_shared_group(test, reporter):
+            reporter.end_test()
             return
 
         try:
-            self.result_report.add_step_group("SETUP")
-            test.setup()
-            self.result_report.end_step_group()
-        except Exception as e:
-            self.result_report.add(StepResult.EXCEPTION, "捕获异常!", str(e))
-            self.result_report.end_step_group()
-            self.__call_cleanup(test)
-            return
+            if CaseRunnerSetting.backend == "process":
+                timings.update(self.__run_phases_in_process(test, reporter))
+            else:
+                timings.update(run_test_phases(test, reporter, initializer=self.__get_phase_initializer()))
+        finally:
+            with self.case_result_lock:
+                self.case_result[test.__class__.__name__]['result'] = \
+                    reporter.recent_case.status == StepResult.PASS
+            reporter.end_test()
+            self.history.update(test.__class__.__name__, timings)
 
+    def __enter_shared_group(self, test: TestCaseBase, reporter):
+        """
+        资源分组: 测试用例和上一个分组的共享测试环境名称以及资源签名相同时复用共享的测试环境，
+        否则结束上一个分组，执行setup_shared建立新的分组。
+        共享的测试环境只保存在当前进程中，只在串行的线程执行方式下分组
+        :return: 是否继续执行测试用例
+        """
+        fixture = getattr(test, "shared_fixture", None)
+        if not CaseRunnerSetting.group_by_resource or fixture is None:
+            self.__close_shared_group()
+            return True
+        if CaseRunnerSetting.worker_count > 1 or CaseRunnerSetting.backend != "thread":
+            if not self.shared_group_warned:
+                self.shared_group_warned = True
+                self.logger.warning("group_by_resource只在worker_count为1并且backend为thread时生效，"
+                                    "共享的测试环境在每个测试用例中单独建立和清除")
+            return True
+        key = (fixture, get_resource_signature(test))
+        if self.shared_group is not None and self.shared_group['key'] == key:
+            test.shared = self.shared_group['shared']
+            self.shared_group.update(case=test, node=reporter.recent_case)
+            self.shared_group.pop("checkpoint", None)
+            reporter.add(StepResult.INFO, f"复用共享的测试环境{fixture}")
+            return True
+        self.__close_shared_group()
+        test.shared = dict()
+        reporter.add_step_group("共享SETUP")
+        group = reporter.recent_node
         try:
-            self.result_report.add_step_group("TEST")
-            test.test()
-            self.result_report.end_step_group()
-        except Exception as e:
-            self.result_report.add(StepResult.EXCEPTION, "捕获异常!", str(e))
-            self.result_report.end_step_group()
-            self.__call_cleanup(test)
+            run_with_timeout("setup", get_phase_timeouts(test).get("setup", None), test.setup_shared,
+                             initializer=self.__get_phase_initializer(), on_timeout=abandon_phase(test))
+        except Exception as ex:
+            _unwind_reporter(reporter, group)
+            reporter.add(StepResult.EXCEPTION, "建立共享的测试环境失败", str(ex))
+            reporter.end_step_group()
+            self.__cleanup_shared(test, reporter.recent_case)
+            return False
+        reporter.end_step_group()
+        self.shared_group = {"key": key, "shared": test.shared, "case": test, "node": reporter.recent_case}
+        return True
+
+    def __close_shared_group(self):
+        """
+        在分组边界、测试列表结束以及执行结束时清除共享的测试环境，
+        结果记录在分组的最后一个测试用例的结果节点中，并更新该测试用例的断点记录
+        """
+        if self.shared_group is None:
             return
-        self.__call_cleanup(test)
+        group = self.shared_group
+        self.shared_group = None
+        if not self.__cleanup_shared(group['case'], group['node']):
+            with self.case_result_lock:
+                self.case_result[group['case'].__class__.__name__]['result'] = False
+        if "checkpoint" in group:
+            self.__record_checkpoint(*group['checkpoint'])
 
-    def __call_cleanup(self, test: TestCaseBase):
+    def __cleanup_shared(self, test: TestCaseBase, node=None):
         """
-        执行清除操作
+        :param node: 记录结果的测试用例结果节点
+        :return: 是否清除成功
         """
         try:
-            self.result_report.add(StepResult.INFO, "CLEANUP")
-            test.cleanup()
-        except Exception as e:
-            self.result_report.add(StepResult.EXCEPTION, "EXCEPTION!", str(e))
-        finally:
-            self.result_report.pop()
-            self.case_result[test.__class__.__name__]['result'] = \
-                self.result_report.recent_case.status == StepResult.PASS
-            self.result_report.end_test()
+            run_with_timeout("cleanup", get_phase_timeouts(test).get("cleanup", None), test.cleanup_shared,
+                             initializer=self.__get_phase_initializer(), on_timeout=abandon_phase(test))
+            if node is not None:
+                node.add(StepResult.INFO, f"清除共享的测试环境{test.shared_fixture}")
+            return True
+        except Exception as ex:
+            self.logger.exception(ex)
+            if node is not None:
+                node.add(StepResult.EXCEPTION, f"清除共享的测试环境{test.shared_fixture}失败", str(ex))
+            return False
+
+    def __get_phase_initializer(self):
+        """
+        阶段设置了超时时间时在看门狗的工作线程中执行，资源占用者以及测试用例日志的绑定是线程局部的，
+        返回在工作线程中恢复当前线程这些状态的方法
+        """
+        holder = self.resource_pool.get_holder()
+        case_log = logger.get_case()
+
+        def initializer():
+            if holder is not None:
+                self.resource_pool.set_holder(holder)
+            logger.bind_case(case_log)
+        return initializer
+
+    def __check_deferred(self, defer, ex):
+        """
+        收集资源失败时，如果资源正被其他测试用例占用，则推迟执行该测试用例
+        """
+        if defer and self.resource_pool.has_other_holder():
+            raise CaseDeferred() from ex
+
+    def __run_phases_in_process(self, test: TestCaseBase, reporter):
+        """
+        在进程池中执行测试用例，并将子进程发送回来的结果事件重放到结果报告中
+        """
+        selection = dict()
+        for name, value in test.__dict__.items():
+            reference = to_resource_reference(value)
+            if reference is not None:
+                selection[name] = reference
+        setting = None
+        if test.setting is not None:
+            setting = (test.setting.setting_path, test.setting.file_name)
+        context = {
+            "setting_path": static_setting.setting_path,
+            "resource_file": self.resource_pool.file_name,
+            "broker": self.resource_pool.broker,
+            "owner": self.resource_pool.owner
+        }
+        case_class = test.__class__
+        log_file = logger.get_log_file(reporter.case_logger.name) if reporter.case_logger else None
+        queue = self.process_manager.Queue()
+        future = self.process_executor.submit(
+            _run_case_in_process, context,
+            f"{case_class.__module__}.{case_class.__qualname__}",
+            setting, selection, log_file, queue)
+        while True:
+            try:
+                event = queue.get(timeout=0.5)
+            except Empty:
+                if future.done():
+                    break
+                continue
+            if event is None:
+                break
+            reporter.apply_event(event)
+        try:
+            return future.result() or dict()
+        except Exception as ex:
+            reporter.add(StepResult.EXCEPTION, "子进程执行异常!", str(ex))
+            return dict()
 
@@ -0,0 +1,87 @@
+"""
+测试执行的断点记录
+
+每个测试用例执行完毕后，向记录文件中追加一行记录，
+执行器异常退出后，可以通过记录文件恢复测试结果并且跳过已经执行完毕的测试用例
+"""
+import json
+import os
+import threading
+from core.result.reporter import ResultNode
+
+
+class CheckpointJournal:
+    """
+    只追加写入的断点记录文件，每一行是一个测试用例的执行记录
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.records = dict()
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        读取记录文件中已经执行完毕的测试用例
+        """
+        self.records.clear()
+        if not os.path.exists(self.filename):
+            return
+        valid_size = 0
+        with open(self.filename, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    if line.strip():
+                        record = json.loads(line.decode())
+                        self.records[record['case_id']] = record
+                    valid_size += len(line)
+                except ValueError:
+                    break
+        if valid_size < os.path.getsize(self.filename):
+            # 执行器退出时最后一行可能没有写完整，截断之后才能继续追加记录
+            with open(self.filename, "r+b") as file:
+                file.truncate(valid_size)
+
+    def record(self, case_id, case_name, priority, result, nodes):
+        """
+        追加一个测试用例的执行记录
+        :param nodes: 测试用例在结果报告中生成的结果节点
+        """
+        record = {
+            "case_id": case_id,
+            "case_name": case_name,
+            "priority": priority,
+            "result": result,
+            "nodes": [node.to_dict() for node in nodes]
+        }
+        with self.lock:
+            dir_name = os.path.dirname(self.filename)
+            if dir_name and not os.path.exists(dir_name):
+                os.makedirs(dir_name)
+            with open(self.filename, "a") as file:
+                file.write(json.dumps(record) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            self.records[case_id] = record
+
+    def is_done(self, case_id):
+        return case_id in self.records
+
+    def get_nodes(self, case_id):
+        """
+        还原测试用例的结果节点
+        """
+        return [ResultNode.from_dict(node) for node in self.records[case_id]['nodes']]
+
+    def get_case_result(self):
+        """
+        还原执行器的测试用例执行结果，用于前置测试用例和优先级的判断
+        """
+        case_result = dict()
+        for case_id, record in self.records.items():
+            case_result[record['case_name']] = {
+                "priority": record['priority'],
+                "result": record['result']
+            }
+        return case_result
@@ -0,0 +1,78 @@
+"""
+测试用例执行时间的历史记录
+
+记录每个测试用例各个阶段(collect_resource, setup, test, cleanup)的执行时间，
+用于执行顺序的优化、分片的权重以及剩余时间的估算
+"""
+import json
+import os
+import threading
+
+
+class DurationHistory:
+    """
+    测试用例执行时间的历史记录，执行时间使用指数加权平均
+    """
+    def __init__(self, filename, smoothing=0.5):
+        self.filename = filename
+        # 新的执行时间所占的权重
+        self.smoothing = smoothing
+        self.records = dict()
+        self.lock = threading.Lock()
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return
+        with open(self.filename) as file:
+            self.records = json.load(file)
+
+    def save(self):
+        """
+        保存历史记录，先写入临时文件再替换，避免写入过程中退出导致文件损坏
+        """
+        dir_name = os.path.dirname(self.filename)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+        with self.lock:
+            temp_file = self.filename + ".tmp"
+            with open(temp_file, "w") as file:
+                json.dump(self.records, file, indent=4)
+            os.replace(temp_file, self.filename)
+
+    def update(self, case_name, timings):
+        """
+        更新测试用例的执行时间
+        :param timings: 各个阶段的执行时间(秒)，比如{"setup": 1.2, "test": 30.5}
+        """
+        with self.lock:
+            record = self.records.setdefault(case_name, {"count": 0, "duration": 0, "phases": dict()})
+            for phase, duration in timings.items():
+                if phase in record['phases']:
+                    record['phases'][phase] += self.smoothing * (duration - record['phases'][phase])
+                else:
+                    record['phases'][phase] = duration
+            record['duration'] = sum(record['phases'].values())
+            record['count'] += 1
+
+    def get_duration(self, case_name, default=None):
+        """
+        获取测试用例的平均执行时间，没有记录时返回default
+        """
+        record = self.records.get(case_name, None)
+        if record is None:
+            return default
+        return record['duration']
+
+    def get_mean_duration(self, default=0):
+        """
+        所有测试用例的平均执行时间，用于估算没有历史记录的测试用例
+        """
+        if not any(self.records):
+            return default
+        return sum(record['duration'] for record in self.records.values()) / len(self.records)
+
+    def get_weights(self):
+        """
+        以测试用例名称为键的执行时间，可以作为分片的权重
+        """
+        return {case_name: record['duration'] for case_name, record in self.records.items()}
@@ -0,0 +1,146 @@
+"""
+测试列表分片
+
+将测试用例按照前置测试用例的依赖关系分组，同一组的测试用例总是分配到同一个分片，
+分组之后按照历史执行时间(或者测试用例数量)确定性地分配到多个执行节点上。
+"""
+import json
+import os
+from core.result.reporter import ResultNode, NodeType
+
+
+class ShardError(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+def get_case_groups(tests, get_pre_tests):
+    """
+    根据前置测试用例的依赖关系将测试用例分组
+    :param tests: 按照列表顺序展开的测试用例描述
+    :param get_pre_tests: 获取测试用例前置测试用例名称列表的方法
+    :return: 分组列表，组的顺序和组内测试用例的顺序都保持列表顺序
+    """
+    parent = dict()
+
+    def find(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    def union(name1, name2):
+        root1, root2 = find(name1), find(name2)
+        if root1 != root2:
+            parent[root2] = root1
+
+    for test in tests:
+        parent.setdefault(test['case_name'], test['case_name'])
+    for test in tests:
+        for pre_test in get_pre_tests(test):
+            # 不在列表中的前置测试用例不影响分组
+            if pre_test in parent:
+                union(pre_test, test['case_name'])
+
+    groups = dict()
+    for test in tests:
+        groups.setdefault(find(test['case_name']), list()).append(test)
+    return list(groups.values())
+
+
+def load_weights(filename):
+    """
+    读取测试用例权重文件，格式为{"测试用例名称": 执行时间}，
+    也可以直接使用执行时间的历史记录文件
+    """
+    if not os.path.exists(filename):
+        raise ShardError(f"Cannot find weight file {filename}")
+    with open(filename) as file:
+        weights = json.load(file)
+    for case_name, weight in weights.items():
+        if isinstance(weight, dict):
+            weights[case_name] = weight['duration']
+    return weights
+
+
+def assign_shards(groups, shard_count, weights=None):
+    """
+    将测试用例分组分配到分片中，返回每一个分组对应的分片序号
+    没有权重时按照测试用例数量均衡分配，有权重时使用最长处理时间优先的贪心算法
+    """
+    if shard_count < 1:
+        raise ShardError("shard count must be greater than 0")
+    if weights:
+        default_weight = sum(weights.values()) / len(weights)
+        group_weights = [sum(weights.get(test['case_name'], default_weight) for test in group)
+                         for group in groups]
+        order = sorted(range(len(groups)), key=lambda index: (-group_weights[index], index))
+    else:
+        group_weights = [len(group) for group in groups]
+        order = list(range(len(groups)))
+    loads = [0] * shard_count
+    rv = [0] * len(groups)
+    for index in order:
+        shard = min(range(shard_count), key=lambda item: (loads[item], item))
+        rv[index] = shard
+        loads[shard] += group_weights[index]
+    return rv
+
+
+def merge_result_trees(roots, test_list=None):
+    """
+    合并多个分片的测试结果，相同名称的测试列表合并为一个节点
+    :param test_list: 执行的测试列表(TestList)，指定时测试用例和子列表按照测试列表中的顺序排列，
+                      否则按照分片的顺序排列
+    """
+    merged = ResultNode("Root")
+    for root in roots:
+        _merge_children(merged, root)
+    if test_list is not None:
+        for node in merged.children:
+            if node.type == NodeType.TestList and node.header == test_list.test_list_name:
+                _sort_by_test_list(node, test_list)
+    return merged
+
+
+def _merge_children(target, source):
+    for child in list(source.children):
+        if child.type == NodeType.TestList:
+            for node in target.children:
+                if node.type == NodeType.TestList and node.header == child.header:
+                    list_node = node
+                    break
+            else:
+                list_node = target.add_child(child.header, node_type=NodeType.TestList)
+                list_node.timestamp = child.timestamp
+            _merge_children(list_node, child)
+        else:
+            target.append_node(child)
+            # 和执行时的顺序一致，测试用例的结果排在子列表之前
+            for index, node in enumerate(target.children):
+                if node.type == NodeType.TestList:
+                    target.children.insert(index, target.children.pop())
+                    break
+
+
+def _sort_by_test_list(node, test_list):
+    """
+    按照测试列表中的顺序排列合并后的测试用例和子列表，测试用例排在子列表之前，
+    测试列表中没有的节点排在最后
+    """
+    positions = dict()
+    for index, testcase in enumerate(item for item in test_list.test_cases if item.strip() != ""):
+        positions.setdefault(testcase.split(",")[0].split(".")[-1], list()).append(index)
+    sub_lists = {sub_list.test_list_name: (index, sub_list) for index, sub_list in enumerate(test_list.sub_list)}
+    keys = dict()
+    for order, child in enumerate(node.children):
+        if child.type == NodeType.TestList:
+            index, sub_list = sub_lists.get(child.header, (len(sub_lists), None))
+            keys[id(child)] = (1, index, order)
+            if sub_list is not None:
+                _sort_by_test_list(child, sub_list)
+        else:
+            # 同一个测试用例在列表中出现多次时，依次对应每一次出现的位置
+            indexes = positions.get(child.header, list())
+            keys[id(child)] = (0, indexes.pop(0) if indexes else len(test_list.test_cases), order)
+    node.children.sort(key=lambda child: keys[id(child)])
@@ -0,0 +1,104 @@
+"""
+测试用例执行阶段的超时看门狗
+
+每个阶段在独立的工作线程中执行，看门狗在调用线程中等待，
+超过时间预算时先调用on_timeout(例如关闭测试用例的连接，使阻塞在系统调用中的方法返回)，
+再向工作线程注入PhaseTimeoutError，并且不再等待该线程，使得挂起的测试用例不会阻塞整个测试执行
+
+超时是尽力而为的: 注入的异常只能在线程执行Python字节码时抛出，阻塞在C代码中的调用(socket、锁等)
+不会被打断，只有on_timeout使调用返回后线程才会退出，否则线程继续在后台运行直到调用结束。
+调用线程在超时后最多再等待grace_period，因此阶段最长占用timeout + grace_period的时间，
+被放弃的线程仍然可能修改共享的状态，需要由调用者通过on_timeout设置的标志等方式忽略
+"""
+import ctypes
+import threading
+
+
+class PhaseTimeoutError(Exception):
+    """
+    测试用例执行阶段超时
+    """
+    def __init__(self, phase=None, timeout=None):
+        super().__init__(f"{phase} timeout after {timeout} seconds")
+        self.phase = phase
+        self.timeout = timeout
+
+
+def _raise_in_thread(thread, exception_type):
+    """
+    在指定线程中异步抛出异常，线程阻塞在系统调用中时，异常在调用返回后才会被抛出
+    """
+    if thread.ident is None:
+        return
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread.ident),
+                                               ctypes.py_object(exception_type))
+
+
+class Watchdog:
+    """
+    阶段超时看门狗
+    """
+    # 注入异常后等待工作线程退出的时间(秒)
+    grace_period = 2
+
+    def __init__(self, phase, timeout, initializer=None, on_timeout=None, grace_period=None):
+        """
+        :param initializer: 在工作线程中执行阶段方法之前调用，用于传递线程局部的状态
+        :param on_timeout: 超时时在调用线程中调用，参数为被放弃的工作线程
+        :param grace_period: 注入异常后等待工作线程退出的时间(秒)，为None时使用默认值
+        """
+        self.phase = phase
+        self.timeout = timeout
+        self.initializer = initializer
+        self.on_timeout = on_timeout
+        if grace_period is not None:
+            self.grace_period = grace_period
+        self.result = None
+        self.exception = None
+
+    def __call__(self, func, *args, **kwargs):
+        """
+        执行阶段方法，没有设置超时时间时直接在当前线程中执行
+        :raise PhaseTimeoutError: 阶段执行超时
+        """
+        if not self.timeout:
+            return func(*args, **kwargs)
+        worker = threading.Thread(target=self.__run, args=(func, args, kwargs),
+                                  name=f"Watchdog-{self.phase}", daemon=True)
+        worker.start()
+        worker.join(self.timeout)
+        if worker.is_alive():
+            if self.on_timeout is not None:
+                try:
+                    self.on_timeout(worker)
+                except Exception:
+                    pass
+            _raise_in_thread(worker, PhaseTimeoutError)
+            if self.grace_period:
+                worker.join(self.grace_period)
+            raise PhaseTimeoutError(self.phase, self.timeout)
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+    def __run(self, func, args, kwargs):
+        try:
+            if self.initializer is not None:
+                self.initializer()
+            self.result = func(*args, **kwargs)
+        except PhaseTimeoutError:
+            # 看门狗注入的异常，调用线程已经处理超时
+            pass
+        except BaseException as ex:
+            self.exception = ex
+
+
+def run_with_timeout(phase, timeout, func, *args, initializer=None, on_timeout=None, grace_period=None, **kwargs):
+    """
+    在时间预算内执行阶段方法，阻塞在C代码中的调用不能被打断，超时是尽力而为的
+    :param timeout: 超时时间(秒)，为None或者0时不限制
+    :param initializer: 在工作线程中执行阶段方法之前调用
+    :param on_timeout: 超时时调用，参数为被放弃的工作线程
+    :param grace_period: 超时后等待工作线程退出的时间(秒)，为None时使用Watchdog.grace_period
+    """
+    return Watchdog(phase, timeout, initializer, on_timeout, grace_period)(func, *args, **kwargs)
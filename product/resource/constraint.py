@@ -1,7 +1,11 @@
-from core.resource.pool import Constraint, ConnectionConstraint, ResourceDevice, DevicePort, ResourcePool
+import itertools
+from core.resource.pool import Constraint, ConnectionConstraint, ResourceDevice, DevicePort, ResourcePool, \
+    IndexPredicate, ConnectionOption, iter_disjoint_options
+from core.resource.topology import get_links, get_paths
+from core.resource.expression import Expression, Attr, IsDevice
 
 
-class PhoneMustBeAndroidConstraint(Constraint):
+class PhoneMustBeAndroidConstraint(Expression):
     """
     判断手机必须是安卓系统，可以附带版本大小判断
     """
@@ -9,41 +13,24 @@ class PhoneMustBeAndroidConstraint(Constraint):
         super().__init__()
         self.version = version
         self.version_op = version_op
+        self.expression = IsDevice() & (Attr("type") == "Android")
         if self.version_op is not None:
+            # 操作符在构造时检查并编译，is_meet不再逐个比较操作符字符串
+            self.expression &= Attr("version").compare(self.version_op, self.version)
             self.description = \
                 f"Phone Type must be android and version {self.version_op} {self.version}"
         else:
             self.description = "Phone Type must be android"
 
-    def is_meet(self, resource, *args, **kwargs):
+    @property
+    def key(self):
+        return self.expression.key
 
-        # 首先判断资源类型是Resource Device，并且type是Android
-        if isinstance(resource, ResourceDevice) and \
-                resource.type == "Android":
-            if self.version_op:
-                # 判断资源是否有version字段和值
-                device_version = getattr(resource, "version")
-                if device_version is None:
-                    return False
-                if self.version_op == "=":
-                    return device_version == self.version
-                elif self.version_op == ">":
-                    return device_version > self.version
-                elif self.version_op == "<":
-                    return device_version < self.version
-                elif self.version_op == ">=":
-                    return device_version >= self.version
-                elif self.version_op == "<=":
-                    return device_version <= self.version
-                elif self.version_op == "!=":
-                    return device_version != self.version
-                else:
-                    return False
-            else:
-                # 没有版本判断操作符，则资源满足条件
-                return True
-        # 不满足条件
-        return False
+    def compile(self):
+        return self.expression.compile()
+
+    def get_index_predicates(self):
+        return self.expression.get_index_predicates()
 
 
 class DeviceMustHaveTrafficGeneratorConnected(ConnectionConstraint):
@@ -59,30 +46,37 @@ class DeviceMustHaveTrafficGeneratorConnected(ConnectionConstraint):
         if speed_constraint:
             self.description += f", {speed_constraint.description}"
 
+    def get_index_predicates(self):
+        # 测试仪表连接在ETH端口上
+        return [IndexPredicate("type", "=", "ETH", target="port")]
+
     def is_meet(self, resource, *args, **kwargs):
         return any(self.get_connection(resource))
 
     def get_connection(self, resource, *args, **kwargs):
         if not isinstance(resource, ResourceDevice):
             return False
-        meet_ports = list()
-        for port_key, port in resource.ports.items():
-            # 假设测试仪表端口连在ETH端口上，跳过非ETH端口的判断
-            if port.type != "ETH":
-                continue
-            #遍历Remote ports
-            for remote_port in port.remote_ports:
-                if remote_port.parent.type == "TrafficGen":
-                    # 如果有速度限制，则调用该限制实例
-                    if self.speed:
-                        if self.speed.is_meet(remote_port):
-                            meet_ports.append(remote_port)
-                    else:
-                        meet_ports.append(remote_port)
+        meet_ports = self._get_meet_ports(resource)
         if len(meet_ports) >= self.port_count:
             return meet_ports[0: self.port_count]
         return list()
 
+    def _get_meet_ports(self, resource):
+        # 假设测试仪表端口连在ETH端口上，通过拓扑图查找ETH端口连接的测试仪表端口
+        meet_ports = list()
+        for port, remote_port in get_links(resource, "ETH", "TrafficGen"):
+            # 如果有速度限制，则调用该限制实例
+            if not self.speed or self.speed.is_meet(remote_port):
+                meet_ports.append(remote_port)
+        return meet_ports
+
+    def get_options(self, resource):
+        if not isinstance(resource, ResourceDevice):
+            return
+        meet_ports = self._get_meet_ports(resource)
+        for ports in itertools.combinations(meet_ports, self.port_count):
+            yield ConnectionOption(list(ports), ports)
+
 
 class TrafficGeneratorSpeedMustBeGraterThan(Constraint):
     """
@@ -119,17 +113,18 @@ class ApMustHaveStaConnected(ConnectionConstraint):
         for sta_constraint in self.sta_constraints:
             self.description += f"\n{sta_constraint.description}"
 
+    def get_index_predicates(self):
+        return [IndexPredicate("type", "=", "AP"), IndexPredicate("type", "=", "WIFI", target="port")]
+
     def is_meet(self, resource, *args, **kwargs):
         return any(self.get_connection(resource))
 
     def get_connection(self, resource, *args, **kwargs):
         if not isinstance(resource, ResourceDevice) or resource.type != "AP":
             return False
-        for port_key, port in resource.ports.items():
-            if port.type != "WIFI":
-                continue
+        for port, remote_ports in self._get_sta_links(resource).items():
             ret = list()
-            for remote_port in port.remote_ports:
+            for remote_port in remote_ports:
                 if remote_port.parent.type == 'STA':
                     # 用STA Constraint判断远端端口的STA设备是否符合条件
                     meet_all = True
@@ -164,6 +159,45 @@ class ApMustHaveStaConnected(ConnectionConstraint):
                 return ret[0: self.sta_count]
         return list()
 
+    def _get_sta_links(self, resource):
+        """
+        通过拓扑图获取AP每个WIFI端口连接的STA端口，
+        STA需要连接测试仪表时，通过缓存的多跳路径 AP -> STA -> TrafficGen 先排除没有连接测试仪表的STA
+        """
+        reachable = None
+        if any(isinstance(c, DeviceMustHaveTrafficGeneratorConnected) for c in self.sta_conn_constraints):
+            reachable = {path[0] for path in get_paths(resource, (("WIFI", "STA"), ("ETH", "TrafficGen")))}
+        ret = dict()
+        for port, remote_port in get_links(resource, "WIFI", "STA"):
+            if reachable is None or remote_port in reachable:
+                ret.setdefault(port, list()).append(remote_port)
+        return ret
+
+    def get_options(self, resource):
+        if not isinstance(resource, ResourceDevice) or resource.type != "AP":
+            return
+        for port, remote_ports in self._get_sta_links(resource).items():
+            # 每个STA的所有方案，STA设备本身以及它的连接都会被占用
+            candidates = list()
+            for remote_port in remote_ports:
+                sta = remote_port.parent
+                if not all(c.is_meet(sta) for c in self.sta_constraints):
+                    continue
+                conn_options = [list(c.get_options(sta)) for c in self.sta_conn_constraints]
+                sta_options = list()
+                for combination in itertools.product(*conn_options):
+                    conn_remote = list()
+                    used = {sta, remote_port}
+                    for option in combination:
+                        conn_remote.extend(option.value)
+                        used.update(option.used)
+                    sta_options.append(ConnectionOption((remote_port, conn_remote), used))
+                if any(sta_options):
+                    candidates.append(sta_options)
+            for options in iter_disjoint_options(candidates, self.sta_count):
+                yield ConnectionOption([option.value for option in options],
+                                       set().union(*[option.used for option in options]))
+
 
 if __name__ == "__main__":
     ap1 = ResourceDevice(name="ap1", type="AP")
@@ -228,6 +262,7 @@ if __name__ == "__main__":
     rp.topology['sta2'] = sta2
     rp.topology['sta3'] = sta3
     rp.topology['trafficGen'] = traffic_gen
+    rp.rebuild_index()
     rp.save("test.json")
 
     # AP必须有STA的连接
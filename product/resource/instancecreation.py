@@ -3,6 +3,7 @@
 """
 from thirdpart.commandline.telnet import TelnetClient
 from thirdpart.commandline.ssh import SshClient
+from thirdpart.commandline.loopback import LoopbackClient
 from core.resource.pool import register_resource, ResourcePool
 
 
@@ -24,9 +25,17 @@ def create_ssh(resource):
     return SshClient(ip, port, username, password)
 
 
+def create_loopback(resource):
+    responses = getattr(resource, "responses", dict())
+    prompt = getattr(resource, "prompt", "loopback# ")
+
+    return LoopbackClient(responses=responses, prompt=prompt)
+
+
 register_mapping = (
     ("device", "telnet", create_telnet),
     ("device", "ssh", create_ssh),
+    ("device", "loopback", create_loopback),
 )
 
 for mapping in register_mapping:
@@ -0,0 +1,337 @@
+"""
+基于asyncio的命令行客户端
+
+所有会话共享一个后台线程中的事件循环，每个会话只有一个读取数据的协程，
+一个线程可以同时驱动几百个设备会话。
+AsyncTelnetClient提供协程接口，AsyncCommandLine是同步接口，可以替代TelnetClient，
+broadcast在所有会话上同时发送命令并等待结果，总时间接近一次命令的往返时间
+"""
+import asyncio
+import threading
+from .base import CommandLine
+from .expect import compile_patterns, search_patterns
+
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+
+class AsyncTelnetError(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+class EventLoopThread:
+    """
+    在后台线程中运行的事件循环
+    """
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self.thread = threading.Thread(target=self.__run, args=(ready, ), daemon=True)
+            self.thread.start()
+            ready.wait()
+
+    def __run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        """
+        在事件循环中执行协程并等待结果，不能在事件循环的线程中调用
+        """
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return future.result(timeout)
+
+    def stop(self):
+        with self.lock:
+            if self.thread is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
+            self.thread = None
+
+
+_loop_thread = EventLoopThread()
+
+
+def get_loop_thread():
+    return _loop_thread
+
+
+class AsyncTelnetClient:
+    """
+    协程接口的Telnet客户端，拒绝所有的选项协商
+    """
+    def __init__(self, host, port, username, password, **kwargs):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.username_prompt = kwargs.get("user_prompt", "as:")
+        self.password_prompt = kwargs.get("pwd_prompt", "assword:")
+        self.prompt = kwargs.get("prompt", "$")
+        self.login_timeout = kwargs.get("login_timeout", 10)
+        self.reader = None
+        self.writer = None
+        self.buffer = bytearray()
+        self.data_event = None
+        self.read_task = None
+        self.eof = False
+        # 选项协商的状态，协商命令可能被拆分在两次读取中
+        self._pending = bytearray()
+
+    async def connect(self):
+        if self.writer is not None:
+            return
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.buffer.clear()
+        self._pending.clear()
+        self.eof = False
+        self.data_event = asyncio.Event()
+        self.read_task = asyncio.ensure_future(self.__read_loop())
+        if not await self._login():
+            await self.disconnect()
+            raise AsyncTelnetError(f"Login to {self.host}:{self.port} failed")
+
+    async def disconnect(self):
+        if self.writer is None:
+            return
+        writer = self.writer
+        self.writer = None
+        self.reader = None
+        if self.read_task is not None:
+            self.read_task.cancel()
+            self.read_task = None
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+    def is_alive(self):
+        return self.writer is not None and not self.eof and not self.writer.is_closing()
+
+    async def __read_loop(self):
+        try:
+            while True:
+                data = await self.reader.read(4096)
+                if not data:
+                    break
+                self.buffer.extend(self.__process_options(data))
+                self.data_event.set()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.eof = True
+            self.data_event.set()
+
+    def __process_options(self, data):
+        """
+        去掉Telnet选项协商命令，并拒绝对端请求的选项
+        """
+        data = self._pending + data
+        self._pending.clear()
+        ret = bytearray()
+        index = 0
+        while index < len(data):
+            byte = data[index]
+            if byte != IAC:
+                ret.append(byte)
+                index += 1
+                continue
+            if index + 1 >= len(data):
+                self._pending.extend(data[index:])
+                break
+            command = data[index + 1]
+            if command == IAC:
+                ret.append(IAC)
+                index += 2
+            elif command in (DO, DONT, WILL, WONT):
+                if index + 2 >= len(data):
+                    self._pending.extend(data[index:])
+                    break
+                option = data[index + 2]
+                if command == DO:
+                    self.writer.write(bytes([IAC, WONT, option]))
+                elif command == WILL:
+                    self.writer.write(bytes([IAC, DONT, option]))
+                index += 3
+            elif command == SB:
+                end = data.find(bytes([IAC, SE]), index)
+                if end < 0:
+                    self._pending.extend(data[index:])
+                    break
+                index = end + 2
+            else:
+                index += 2
+        return ret
+
+    async def send(self, string):
+        await self.send_binary(string.encode())
+
+    async def send_binary(self, binary):
+        if not self.is_alive():
+            raise AsyncTelnetError(f"Not connected to {self.host}:{self.port}")
+        self.writer.write(binary.replace(bytes([IAC]), bytes([IAC, IAC])))
+        await self.writer.drain()
+
+    async def read_until(self, waitfor, timeout=60):
+        """
+        等待数据中出现waitfor，返回到waitfor为止的数据，超时或者连接断开时返回None
+        """
+        waitfor = waitfor.encode() if isinstance(waitfor, str) else waitfor
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        start = 0
+        while True:
+            index = self.buffer.find(waitfor, min(start, len(self.buffer)))
+            if index >= 0:
+                end = index + len(waitfor)
+                ret = bytes(self.buffer[:end])
+                del self.buffer[:end]
+                return ret
+            # 只在新到达的数据中查找
+            start = max(0, len(self.buffer) - len(waitfor) + 1)
+            remaining = deadline - loop.time()
+            if self.eof or remaining <= 0:
+                return None
+            self.data_event.clear()
+            try:
+                await asyncio.wait_for(self.data_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    async def expect(self, patterns, timeout=60):
+        """
+        等待一个或者多个模式出现，和ExpectEngine.expect相同，等待时不占用事件循环
+        :return: ExpectMatch，超时或者连接断开时返回None，缓冲区中的数据保留
+        """
+        patterns = compile_patterns(patterns)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        scanned = 0
+        while True:
+            if len(self.buffer) > scanned or scanned == 0:
+                result = search_patterns(self.buffer, patterns, scanned)
+                if result is not None:
+                    return result
+                scanned = len(self.buffer)
+            remaining = deadline - loop.time()
+            if self.eof or remaining <= 0:
+                return None
+            self.data_event.clear()
+            try:
+                await asyncio.wait_for(self.data_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    async def send_and_wait(self, string, waitfor, timeout=60, **kwargs):
+        """
+        和TelnetClient.send_and_wait相同，超时返回已经读取的数据
+        """
+        await self.send(string)
+        ret = await self.read_until(waitfor, timeout)
+        if ret is None:
+            ret = await self.receive_binary()
+        return ret.decode(errors="replace")
+
+    async def receive_binary(self):
+        ret = bytes(self.buffer)
+        self.buffer.clear()
+        return ret
+
+    async def receive(self):
+        return (await self.receive_binary()).decode(errors="replace")
+
+    async def _login(self):
+        if not await self.read_until(self.username_prompt, self.login_timeout):
+            return False
+        await self.send(f"{self.username}\n")
+        if not await self.read_until(self.password_prompt, self.login_timeout):
+            return False
+        await self.send(f"{self.password}\n")
+        return await self.read_until(self.prompt, self.login_timeout) is not None
+
+
+class AsyncCommandLine(CommandLine):
+    """
+    异步客户端的同步接口，在共享的事件循环中执行
+    """
+    def __init__(self, host, port, username, password, **kwargs):
+        self.client = AsyncTelnetClient(host, port, username, password, **kwargs)
+        self.loop_thread = get_loop_thread()
+
+    def connect(self):
+        self.loop_thread.run(self.client.connect())
+
+    def disconnect(self):
+        self.loop_thread.run(self.client.disconnect())
+
+    def is_alive(self):
+        return self.client.is_alive()
+
+    def send(self, string):
+        self.loop_thread.run(self.client.send(string))
+
+    def send_and_wait(self, string, waitfor, timeout=60, **kwargs):
+        return self.loop_thread.run(self.client.send_and_wait(string, waitfor, timeout))
+
+    def expect(self, patterns, timeout=60):
+        return self.loop_thread.run(self.client.expect(patterns, timeout))
+
+    def receive(self):
+        return self.loop_thread.run(self.client.receive())
+
+    def send_binary(self, binary):
+        self.loop_thread.run(self.client.send_binary(binary))
+
+    def receive_binary(self):
+        return self.loop_thread.run(self.client.receive_binary())
+
+    def _login(self):
+        return self.loop_thread.run(self.client._login())
+
+
+def _get_async_client(client):
+    return client.client if isinstance(client, AsyncCommandLine) else client
+
+
+def connect_all(clients):
+    """
+    同时连接所有会话
+    :return: 每个会话的异常，连接成功时为None
+    """
+    async def connect():
+        return await asyncio.gather(*[_get_async_client(client).connect() for client in clients],
+                                    return_exceptions=True)
+    return get_loop_thread().run(connect())
+
+
+def broadcast(clients, string, waitfor, timeout=60):
+    """
+    在所有会话上同时发送命令并等待结果
+    :param clients: AsyncCommandLine或者AsyncTelnetClient列表
+    :return: 和clients顺序相同的结果列表，超时为已经读取的数据，发送失败时为异常对象
+    """
+    async def send_all():
+        return await asyncio.gather(
+            *[_get_async_client(client).send_and_wait(string, waitfor, timeout) for client in clients],
+            return_exceptions=True)
+    return get_loop_thread().run(send_all())
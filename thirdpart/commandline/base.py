@@ -1,6 +1,49 @@
+import re
+import time
 from abc import ABCMeta, abstractmethod
 from core.resource.pool import register_resource
 
+
+class CommandResult:
+    """
+    批量执行时一条命令的结果
+    :param output: 命令的输出，不包含命令的回显行和提示符
+    :param duration: 从发送命令(或者上一条命令结束)到出现提示符的时间(秒)
+    :param timed_out: 等待提示符超时
+    :param error: 输出匹配了错误模式
+    """
+    def __init__(self, command, output, duration, timed_out=False, error=False):
+        self.command = command
+        self.output = output
+        self.duration = duration
+        self.timed_out = timed_out
+        self.error = error
+
+    @property
+    def ok(self):
+        return not self.timed_out and not self.error
+
+    def to_dict(self):
+        return {
+            "command": self.command,
+            "output": self.output,
+            "duration": self.duration,
+            "timed_out": self.timed_out,
+            "error": self.error
+        }
+
+
+def _strip_output(command, before):
+    """
+    从提示符之前的数据中去掉命令的回显行，以及输出末尾的换行
+    """
+    text = before.decode(errors="replace")
+    echo, _, rest = text.partition("\n")
+    if echo.strip().endswith(command.strip()):
+        text = rest
+    return text.rstrip("\r\n")
+
+
 class CommandLine(metaclass=ABCMeta):
 
     @abstractmethod
@@ -35,3 +78,69 @@ class CommandLine(metaclass=ABCMeta):
     def _login(self):
         pass
 
+    def expect(self, patterns, timeout=60):
+        """
+        等待一个或者多个模式(字符串或者正则表达式)出现，send_batch和run_script依赖该方法，
+        不是抽象方法，没有实现expect的子类仍然可以实例化
+        :return: ExpectMatch，超时返回None
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support expect, "
+                                  f"send_batch and run_script are not available")
+
+    def send_batch(self, commands, prompt, timeout=60, window=16, error_pattern=None, stop_on_error=False):
+        """
+        流水线批量执行命令：不等待提示符连续发送最多window条命令，
+        再按照提示符的边界把输出分配给每一条命令
+        :param prompt: 提示符，字符串或者正则表达式
+        :param timeout: 每一条命令等待提示符的超时时间
+        :param window: 已发送但还没有收到提示符的最大命令数，避免设备的输入缓冲区溢出
+        :param error_pattern: 输出中表示命令执行失败的正则表达式，只在去掉回显和提示符的输出中查找
+        :param stop_on_error: 命令失败时不再发送后续命令，已经发送的命令仍然会被设备执行
+        :return: CommandResult列表，超时或者失败停止时只包含已经执行的命令
+        """
+        if isinstance(error_pattern, str):
+            error_pattern = re.compile(error_pattern)
+        results = list()
+        sent = 0
+        last_time = time.time()
+        send_times = list()
+        while len(results) < len(commands):
+            while sent < len(commands) and sent - len(results) < window:
+                command = commands[sent]
+                self.send(command if command.endswith("\n") else command + "\n")
+                send_times.append(time.time())
+                sent += 1
+            command = commands[len(results)]
+            match = self.expect(prompt, timeout)
+            now = time.time()
+            start = max(last_time, send_times[len(results)])
+            last_time = now
+            if match is None:
+                results.append(CommandResult(command, None, now - start, timed_out=True))
+                break
+            output = _strip_output(command, match.before)
+            error = error_pattern is not None and error_pattern.search(output) is not None
+            results.append(CommandResult(command, output, now - start, error=error))
+            if error and stop_on_error:
+                # 已经发送的命令仍然需要读取输出，保证后续交互不受影响
+                for _ in range(sent - len(results)):
+                    if self.expect(prompt, timeout) is None:
+                        break
+                break
+        return results
+
+    def run_script(self, script, prompt, timeout=60, **kwargs):
+        """
+        批量执行脚本中的命令，忽略空行以及#开头的注释
+        :param kwargs: send_batch的参数
+        """
+        commands = [line.strip() for line in script.splitlines()]
+        commands = [line for line in commands if line and not line.startswith("#")]
+        return self.send_batch(commands, prompt, timeout, **kwargs)
+
+    def is_alive(self):
+        """
+        连接是否可用，子类根据连接方式判断
+        """
+        return True
+
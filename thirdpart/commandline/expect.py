@@ -0,0 +1,182 @@
+"""
+命令行客户端共享的expect引擎
+
+读取的数据保存在可增长的字节缓冲区中，等待时只在新到达的数据中查找，
+支持字符串和正则表达式以及多个模式同时匹配，没有数据时使用select等待，不需要固定间隔的sleep
+"""
+import re
+import select
+import time
+
+# 没有设置lookback时，正则表达式至少向前重新查找的字节数，匹配可以跨越之前读取的行
+_DEFAULT_LOOKBACK = 4096
+
+
+class ExpectMatch:
+    """
+    匹配结果
+    :param index: 匹配的模式在模式列表中的序号
+    :param match: 正则表达式的匹配对象，字符串模式为None
+    :param data: 到匹配结束位置为止的数据
+    :param before: 匹配之前的数据
+    """
+    def __init__(self, index, match, data, before):
+        self.index = index
+        self.match = match
+        self.data = data
+        self.before = before
+
+    @property
+    def text(self):
+        return self.data.decode(errors="replace")
+
+
+class _Pattern:
+    def __init__(self, pattern, lookback):
+        if isinstance(pattern, str):
+            pattern = pattern.encode()
+        if isinstance(pattern, re.Pattern):
+            if isinstance(pattern.pattern, str):
+                pattern = re.compile(pattern.pattern.encode(), pattern.flags & ~re.UNICODE)
+            self.regex = pattern
+            self.literal = None
+        else:
+            self.regex = None
+            self.literal = bytes(pattern)
+        self.lookback = lookback
+
+    def get_start(self, buffer, scanned):
+        """
+        计算重新查找的起始位置，已经查找过的数据不再查找
+        """
+        if scanned == 0:
+            return 0
+        if self.literal is not None:
+            return max(0, scanned - len(self.literal) + 1)
+        if self.lookback is not None:
+            return max(0, scanned - self.lookback)
+        # 正则表达式从上一次查找结束位置所在的行首和向前_DEFAULT_LOOKBACK字节中靠前的位置开始查找
+        return min(buffer.rfind(b"\n", 0, scanned) + 1, max(0, scanned - _DEFAULT_LOOKBACK))
+
+    def search(self, buffer, start):
+        """
+        :return: (开始位置, 结束位置, 匹配对象)，没有匹配时返回None
+        """
+        if self.literal is not None:
+            index = buffer.find(self.literal, start)
+            if index < 0:
+                return None
+            return index, index + len(self.literal), None
+        match = self.regex.search(buffer, start)
+        if match is None:
+            return None
+        return match.start(), match.end(), match
+
+
+def compile_patterns(patterns, lookback=None):
+    """
+    :param patterns: 字符串、字节串、正则表达式或者它们的列表
+    """
+    if not isinstance(patterns, (list, tuple)):
+        patterns = [patterns]
+    return [_Pattern(pattern, lookback) for pattern in patterns]
+
+
+def search_patterns(buffer, patterns, scanned):
+    """
+    在缓冲区中查找位置最靠前的模式，匹配时从缓冲区中取出到匹配结束位置为止的数据
+    :param patterns: compile_patterns返回的模式列表
+    :param scanned: 上一次查找时缓冲区的长度
+    :return: ExpectMatch，没有匹配时返回None
+    """
+    best = None
+    for index, pattern in enumerate(patterns):
+        found = pattern.search(buffer, pattern.get_start(buffer, scanned))
+        if found is not None and (best is None or found[0] < best[1][0]):
+            best = (index, found)
+    if best is None:
+        return None
+    index, (start, end, match) = best
+    snapshot = bytes(buffer)
+    if match is not None:
+        # 匹配对象引用的缓冲区之后会被修改，在删除之前的完整数据上重新匹配，保留前瞻等依赖后续数据的匹配
+        match = patterns[index].regex.match(snapshot, start)
+    data = snapshot[:end]
+    del buffer[:end]
+    return ExpectMatch(index, match, data, data[:start])
+
+
+class ExpectEngine:
+    """
+    expect引擎
+    :param reader: 数据源，read(size)返回已经到达的数据，没有数据时返回b""，连接关闭时抛出EOFError，
+                   fileno()返回可以用于select的文件描述符
+    :param read_size: 每次读取的最大字节数
+    :param lookback: 正则表达式向前重新查找的字节数，None表示从行首以及向前_DEFAULT_LOOKBACK字节中靠前的位置开始
+    """
+    def __init__(self, reader, read_size=4096, lookback=None):
+        self.reader = reader
+        self.read_size = read_size
+        self.lookback = lookback
+        self.buffer = bytearray()
+        self.eof = False
+
+    def read_available(self):
+        """
+        读取所有已经到达的数据
+        :return: 读取的字节数
+        """
+        count = 0
+        while not self.eof:
+            try:
+                data = self.reader.read(self.read_size)
+            except EOFError:
+                self.eof = True
+                break
+            if not data:
+                break
+            self.buffer.extend(data)
+            count += len(data)
+        return count
+
+    def wait_readable(self, timeout):
+        """
+        使用select等待数据到达
+        """
+        try:
+            readable, _, _ = select.select([self.reader], [], [], max(0, timeout))
+        except (ValueError, OSError):
+            # 连接已经关闭
+            self.eof = True
+            return False
+        return any(readable)
+
+    def expect(self, patterns, timeout=60):
+        """
+        等待一个或者多个模式出现，多个模式同时出现时返回位置最靠前的模式
+        :param patterns: 字符串、字节串、正则表达式或者它们的列表
+        :return: ExpectMatch，超时或者连接关闭时返回None，缓冲区中的数据保留
+        """
+        patterns = compile_patterns(patterns, self.lookback)
+        deadline = time.time() + timeout
+        scanned = 0
+        while True:
+            self.read_available()
+            if len(self.buffer) > scanned or scanned == 0:
+                result = search_patterns(self.buffer, patterns, scanned)
+                if result is not None:
+                    return result
+                scanned = len(self.buffer)
+            remaining = deadline - time.time()
+            if self.eof or remaining <= 0:
+                return None
+            self.wait_readable(remaining)
+
+    def take(self):
+        """
+        取出缓冲区中的所有数据
+        """
+        self.read_available()
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
@@ -0,0 +1,149 @@
+"""
+本地回环的伪设备，用于在没有真实设备时调试测试用例以及命令行客户端
+
+伪设备在后台线程中通过socketpair和客户端通信，回显收到的命令，
+按照响应表或者回调函数输出结果，然后输出提示符
+"""
+import select
+import socket
+import threading
+import time
+from .base import CommandLine
+from .expect import ExpectEngine
+
+
+class LoopbackDevice:
+    """
+    伪设备
+    :param responses: 命令到输出的字典，或者callable(command) -> 输出
+    :param prompt: 提示符
+    :param delay: 每条命令的处理时间(秒)
+    """
+    def __init__(self, responses=None, prompt="loopback# ", delay=0):
+        self.responses = responses if responses is not None else dict()
+        self.prompt = prompt
+        self.delay = delay
+        self.commands = list()
+        self.socket = None
+        self.thread = None
+
+    def start(self):
+        """
+        启动伪设备
+        :return: 客户端使用的socket
+        """
+        self.socket, client_socket = socket.socketpair()
+        self.thread = threading.Thread(target=self.__serve, daemon=True)
+        self.thread.start()
+        return client_socket
+
+    def __get_output(self, command):
+        if callable(self.responses):
+            return self.responses(command)
+        return self.responses.get(command, f"{command.split(' ')[0]}: command not found"
+                                  if command else "")
+
+    def __serve(self):
+        buffer = b""
+        try:
+            self.socket.sendall(self.prompt.encode())
+            while True:
+                data = self.socket.recv(4096)
+                if not data:
+                    break
+                buffer += data
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    command = line.decode(errors="replace").strip()
+                    self.commands.append(command)
+                    if self.delay:
+                        time.sleep(self.delay)
+                    output = self.__get_output(command)
+                    reply = command + "\r\n"
+                    if output:
+                        reply += output.replace("\n", "\r\n") + "\r\n"
+                    self.socket.sendall((reply + self.prompt).encode())
+        except OSError:
+            pass
+        finally:
+            self.socket.close()
+
+
+class _SocketReader:
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.setblocking(False)
+
+    def read(self, size):
+        try:
+            data = self.sock.recv(size)
+        except (BlockingIOError, InterruptedError):
+            return b""
+        if not data:
+            raise EOFError()
+        return data
+
+    def fileno(self):
+        return self.sock.fileno()
+
+
+class LoopbackClient(CommandLine):
+    """
+    连接伪设备的命令行客户端，参数和TelnetClient相同，host、port、username和password被忽略
+    """
+    def __init__(self, host=None, port=None, username=None, password=None, **kwargs):
+        self.device = LoopbackDevice(kwargs.get("responses", None),
+                                     kwargs.get("prompt", "loopback# "),
+                                     kwargs.get("delay", 0))
+        self.read_size = kwargs.get("read_size", 4096)
+        self.socket = None
+        self.expecter = None
+
+    def connect(self):
+        if self.socket is not None:
+            return
+        self.socket = self.device.start()
+        self.expecter = ExpectEngine(_SocketReader(self.socket), self.read_size)
+        if not self._login():
+            self.disconnect()
+
+    def disconnect(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            finally:
+                self.socket = None
+                self.expecter = None
+
+    def is_alive(self):
+        return self.socket is not None and not self.expecter.eof
+
+    def send(self, string):
+        self.send_binary(string.encode())
+
+    def send_and_wait(self, string, waitfor, timeout=60, **kwargs):
+        self.send(string)
+        result = self.expecter.expect(waitfor, timeout)
+        return None if result is None else result.text
+
+    def expect(self, patterns, timeout=60):
+        return self.expecter.expect(patterns, timeout)
+
+    def receive(self):
+        return self.receive_binary().decode(errors="replace")
+
+    def receive_binary(self):
+        return self.expecter.take()
+
+    def send_binary(self, binary):
+        # 非阻塞socket，缓冲区满时先读取设备的输出，避免双方都阻塞在发送上
+        view = memoryview(binary)
+        while len(view):
+            try:
+                view = view[self.socket.send(view):]
+            except BlockingIOError:
+                self.expecter.read_available()
+                select.select([self.socket], [self.socket], [], 1)
+
+    def _login(self):
+        return self.expecter.expect(self.device.prompt, timeout=10) is not None
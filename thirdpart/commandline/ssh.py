@@ -1,16 +1,76 @@
-from .base import CommandLine
+from .base import CommandLine, CommandResult
+from .expect import ExpectEngine
+from concurrent.futures import ThreadPoolExecutor
+import re
+import select
 import time
 import paramiko
 
 
+class SshModeError(Exception):
+    """
+    exec模式下调用了需要交互式shell的方法
+    """
+    def __init__(self, method):
+        super().__init__(f"{method} is not supported in exec mode, use execute or send_and_wait instead")
+
+
+class ExecResult:
+    """
+    exec通道执行命令的结果
+    :param exit_code: 命令的退出码，超时为None
+    """
+    def __init__(self, command, exit_code, stdout, stderr, duration):
+        self.command = command
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return self.exit_code == 0
+
+    @property
+    def timed_out(self):
+        return self.exit_code is None
+
+    def __str__(self):
+        return self.stdout
+
+
+class _ChannelReader:
+    """
+    expect引擎读取SSH通道的适配器
+    """
+    def __init__(self, channel):
+        self.channel = channel
+
+    def read(self, size):
+        if self.channel.recv_ready():
+            return self.channel.recv(size)
+        if self.channel.closed or self.channel.eof_received:
+            raise EOFError()
+        return b""
+
+    def fileno(self):
+        return self.channel.fileno()
+
+
 class SshClient(CommandLine):
     def __init__(self, host, port, username, password, **kwargs):
         self.host = host
         self.port = port
         self.username = username
         self.password = password
+        self.read_size = kwargs.get("read_size", 4096)
+        # shell: 交互式shell，通过提示符判断命令结束; exec: 每个命令使用独立的exec通道，不打开shell
+        self.mode = kwargs.get("mode", "shell")
+        # execute_many的最大并发通道数
+        self.exec_workers = kwargs.get("exec_workers", 8)
         self.ssh = None
         self.session = None
+        self.expecter = None
 
 
     def connect(self):
@@ -19,15 +79,19 @@ class SshClient(CommandLine):
                 self.ssh = paramiko.SSHClient()
                 self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
                 self.ssh.connect(self.host, self.port, self.username, self.password)
+                if self.mode == "exec":
+                    return
                 trans = self.ssh.get_transport()
                 self.session = trans.open_session()
                 self.session.get_pty()
                 self.session.invoke_shell()
+                self.expecter = ExpectEngine(_ChannelReader(self.session), self.read_size)
                 if not self._login():
                     self.disconnect()
             except Exception as ex:
                 self.ssh = None
                 self.session = None
+                self.expecter = None
 
 
     def disconnect(self):
@@ -37,33 +101,114 @@ class SshClient(CommandLine):
             finally:
                 self.ssh = None
                 self.session = None
+                self.expecter = None
+
+    def is_alive(self):
+        if self.ssh is None or (self.session is None and self.mode != "exec"):
+            return False
+        transport = self.ssh.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        return self.mode == "exec" or not self.session.closed
+
+    def _check_shell(self, method):
+        """
+        exec模式下没有打开交互式shell，send、expect、receive等方法不可用
+        """
+        if self.mode == "exec":
+            raise SshModeError(method)
 
     def send(self, string):
+        self._check_shell("send")
         self.session.send(string.encode())
 
     def send_and_wait(self, string, waitfor, timeout=60, **kwargs):
+        if self.mode == "exec":
+            # exec模式下命令结束时通道关闭，不需要等待提示符
+            result = self.execute(string.strip(), timeout)
+            return None if result.timed_out else result.stdout + result.stderr
         self.send(string)
         return self._wait_for(waitfor, timeout=timeout)
 
+    def execute(self, command, timeout=60):
+        """
+        在持久连接上打开新的exec通道执行命令，可以在多个线程中同时调用
+        :return: ExecResult
+        """
+        start_time = time.time()
+        deadline = start_time + timeout
+        channel = self.ssh.get_transport().open_session(timeout=timeout)
+        stdout = bytearray()
+        stderr = bytearray()
+        try:
+            channel.exec_command(command)
+            while True:
+                while channel.recv_ready():
+                    stdout.extend(channel.recv(self.read_size))
+                while channel.recv_stderr_ready():
+                    stderr.extend(channel.recv_stderr(self.read_size))
+                if channel.exit_status_ready() and not channel.recv_ready() \
+                        and not channel.recv_stderr_ready():
+                    exit_code = channel.recv_exit_status()
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    exit_code = None
+                    break
+                # 标准输出到达或者通道关闭时唤醒，标准错误没有通知，最多等待0.5秒读取一次
+                select.select([channel], [], [], min(remaining, 0.5))
+        finally:
+            channel.close()
+        return ExecResult(command, exit_code, stdout.decode(errors="replace"),
+                          stderr.decode(errors="replace"), time.time() - start_time)
+
+    def execute_many(self, commands, timeout=60, max_workers=None):
+        """
+        在同一个连接的多个exec通道上同时执行命令
+        :return: 和commands顺序相同的ExecResult列表
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or self.exec_workers) as executor:
+            return list(executor.map(lambda command: self.execute(command, timeout), commands))
+
+    def send_batch(self, commands, prompt, timeout=60, window=16, error_pattern=None, stop_on_error=False):
+        if self.mode != "exec":
+            return super().send_batch(commands, prompt, timeout, window, error_pattern, stop_on_error)
+        # exec模式下按顺序执行，退出码不为0也表示失败
+        if isinstance(error_pattern, str):
+            error_pattern = re.compile(error_pattern)
+        results = list()
+        for command in commands:
+            result = self.execute(command.strip(), timeout)
+            if result.timed_out:
+                results.append(CommandResult(command, None, result.duration, timed_out=True))
+                break
+            output = result.stdout + result.stderr
+            error = not result.ok or (error_pattern is not None and error_pattern.search(output) is not None)
+            results.append(CommandResult(command, output, result.duration, error=error))
+            if error and stop_on_error:
+                break
+        return results
+
+    def expect(self, patterns, timeout=60):
+        self._check_shell("expect")
+        return self.expecter.expect(patterns, timeout)
+
     def receive(self):
-        return self.session.recv(256).decode()
+        return self.receive_binary().decode(errors="replace")
 
     def receive_binary(self):
-        return self.session.recv(256)
+        self._check_shell("receive")
+        # 先返回expect引擎中已经读取的数据
+        data = self.expecter.take()
+        return data if data else self.session.recv(self.read_size)
 
     def send_binary(self, binary):
+        self._check_shell("send_binary")
         self.session.send(binary.encode())
 
     def _login(self):
         return self._wait_for("$", timeout=10)
 
     def _wait_for(self, string, timeout):
-        rcv = ""
-        recent = time.time()
-        while time.time() - recent < timeout:
-            rcv += self.session.recv(256).decode()
-            if string in rcv:
-                return rcv
-            else:
-                time.sleep(0.1)
-        return None
+        result = self.expecter.expect(string, timeout)
+        return None if result is None else result.text
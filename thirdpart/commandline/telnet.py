@@ -1,7 +1,22 @@
 from .base import CommandLine
+from .expect import ExpectEngine
 from telnetlib import Telnet
 
 
+class _TelnetReader:
+    """
+    expect引擎读取Telnet连接的适配器，telnetlib处理选项协商
+    """
+    def __init__(self, telnet):
+        self.telnet = telnet
+
+    def read(self, size):
+        return self.telnet.read_very_eager()
+
+    def fileno(self):
+        return self.telnet.fileno()
+
+
 class TelnetClient(CommandLine):
     def __init__(self, host, port, username, password, **kwargs):
         super().__init__()
@@ -11,7 +26,9 @@ class TelnetClient(CommandLine):
         self.password = password
         self.username_prompt = kwargs.get("user_prompt", "as:")
         self.password_prompt = kwargs.get("pwd_prompt", "assword:")
+        self.read_size = kwargs.get("read_size", 4096)
         self.telnet = None
+        self.expecter = None
 
     def connect(self):
         if self.telnet:
@@ -19,6 +36,7 @@ class TelnetClient(CommandLine):
         self.telnet = Telnet()
 
         self.telnet.open(self.host, self.port)
+        self.expecter = ExpectEngine(_TelnetReader(self.telnet), self.read_size)
         if not self._login():
             self.disconnect()
 
@@ -28,35 +46,47 @@ class TelnetClient(CommandLine):
                 self.telnet.close()
             finally:
                 self.telnet = None
+                self.expecter = None
+
+    def is_alive(self):
+        return self.telnet is not None and self.telnet.get_socket() is not None
 
     def send(self, string):
         self.telnet.write(string.encode())
 
     def send_and_wait(self, string, waitfor, timeout=60, **kwargs):
         self.telnet.write(string.encode())
-        return self.telnet.read_until(waitfor.encode(), timeout=timeout).decode()
+        return self._read_until(waitfor, timeout).decode(errors="replace")
+
+    def expect(self, patterns, timeout=60):
+        return self.expecter.expect(patterns, timeout)
 
     def receive(self):
-        return self.telnet.read_eager().decode()
+        return self.receive_binary().decode(errors="replace")
 
     def receive_binary(self):
-        return self.telnet.read_eager()
+        return self.expecter.take()
 
     def send_binary(self, binary):
         self.telnet.write(binary)
 
+    def _read_until(self, waitfor, timeout):
+        """
+        和Telnet.read_until相同，超时返回已经读取的数据
+        """
+        result = self.expecter.expect(waitfor, timeout)
+        return self.expecter.take() if result is None else result.data
+
     def _login(self):
-        ret_data = self.telnet.read_until(
-            self.username_prompt.encode(), timeout=10)
+        ret_data = self._read_until(self.username_prompt, timeout=10)
         if not ret_data:
             return False
         self.telnet.write(f"{self.username}\n".encode())
-        ret_data = self.telnet.read_until(
-            self.password_prompt.encode(), timeout=10)
+        ret_data = self._read_until(self.password_prompt, timeout=10)
         if not ret_data:
             return False
         self.telnet.write(f"{self.password}\n".encode())
-        ret_data = self.telnet.read_until("$".encode())
+        ret_data = self._read_until("$", timeout=10)
         if ret_data:
             return True
         else:
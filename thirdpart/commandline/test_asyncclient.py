@@ -0,0 +1,109 @@
+"""
+asyncclient的测试，在共享的事件循环中启动本地的Telnet服务器
+"""
+import asyncio
+import unittest
+from thirdpart.commandline.asyncclient import AsyncCommandLine, AsyncTelnetError, get_loop_thread, \
+    connect_all, broadcast
+
+
+class _LocalServer:
+    """
+    本地的伪Telnet服务器，登录后回显命令并输出提示符，
+    hang命令只输出部分数据，不输出提示符
+    """
+    def __init__(self, password="admin"):
+        self.password = password
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.__handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def __handle(self, reader, writer):
+        try:
+            writer.write(b"login as: ")
+            await reader.readline()
+            writer.write(b"Password: ")
+            password = (await reader.readline()).decode().strip()
+            if password != self.password:
+                writer.write(b"Access denied\r\n")
+                return
+            writer.write(b"device$")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode().strip()
+                if command == "hang":
+                    writer.write(b"hang\r\npartial output")
+                else:
+                    writer.write(f"{command}\r\noutput of {command}\r\ndevice$".encode())
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+
+class TestAsyncClient(unittest.TestCase):
+    def setUp(self):
+        self.loop_thread = get_loop_thread()
+        self.server = _LocalServer()
+        self.loop_thread.run(self.server.start())
+        self.clients = list()
+
+    def tearDown(self):
+        for client in self.clients:
+            client.disconnect()
+        self.loop_thread.run(self.server.stop())
+
+    def create_clients(self, count, password="admin"):
+        clients = [AsyncCommandLine("127.0.0.1", self.server.port, "admin", password, login_timeout=2)
+                   for _ in range(count)]
+        self.clients.extend(clients)
+        return clients
+
+    def test_connect_all(self):
+        clients = self.create_clients(3)
+        self.assertEqual(connect_all(clients), [None, None, None])
+        self.assertTrue(all(client.is_alive() for client in clients))
+
+    def test_broadcast(self):
+        clients = self.create_clients(3)
+        connect_all(clients)
+        results = broadcast(clients, "show version\n", "$", timeout=5)
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertIn("output of show version", result)
+            self.assertTrue(result.endswith("$"))
+
+    def test_broadcast_timeout_returns_partial_data(self):
+        clients = self.create_clients(2)
+        connect_all(clients)
+        results = broadcast(clients, "hang\n", "$", timeout=0.5)
+        self.assertEqual(results, ["hang\r\npartial output"] * 2)
+
+    def test_send_and_wait_timeout_returns_partial_data(self):
+        client = self.create_clients(1)[0]
+        client.connect()
+        self.assertEqual(client.send_and_wait("hang\n", "$", timeout=0.5), "hang\r\npartial output")
+
+    def test_login_failed(self):
+        clients = self.create_clients(2, password="wrong")
+        errors = connect_all(clients)
+        self.assertTrue(all(isinstance(error, AsyncTelnetError) for error in errors))
+        self.assertFalse(clients[0].is_alive())
+        with self.assertRaises(AsyncTelnetError):
+            clients[0].send("show version\n")
+        results = broadcast(clients, "show version\n", "$", timeout=1)
+        self.assertTrue(all(isinstance(result, AsyncTelnetError) for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
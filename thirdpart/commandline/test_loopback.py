@@ -0,0 +1,95 @@
+"""
+LoopbackClient以及send_batch、run_script的测试，使用本地回环的伪设备
+"""
+import unittest
+from thirdpart.commandline.loopback import LoopbackClient
+
+PROMPT = "loopback# "
+
+
+def _responses(command):
+    if command == "show version":
+        return "Version 1.0\nBuild 42"
+    if command == "grep Error log":
+        return "no match"
+    if command.startswith("echo "):
+        return command[len("echo "):]
+    if command.startswith("bad"):
+        return "Error: invalid command"
+    return ""
+
+
+class TestLoopbackClient(unittest.TestCase):
+    def setUp(self):
+        self.client = LoopbackClient(responses=_responses)
+        self.client.connect()
+
+    def tearDown(self):
+        self.client.disconnect()
+
+    def test_connect(self):
+        self.assertTrue(self.client.is_alive())
+        self.client.disconnect()
+        self.assertIsNone(self.client.socket)
+
+    def test_send_and_wait(self):
+        output = self.client.send_and_wait("show version\n", PROMPT, timeout=5)
+        self.assertEqual(output, "show version\r\nVersion 1.0\r\nBuild 42\r\n" + PROMPT)
+        self.assertEqual(self.client.device.commands, ["show version"])
+
+    def test_send_and_wait_timeout(self):
+        self.assertIsNone(self.client.send_and_wait("show version\n", "not a prompt", timeout=0.5))
+
+    def test_send_batch(self):
+        results = self.client.send_batch(["show version", "config", "show version"], PROMPT, timeout=5)
+        self.assertEqual([result.command for result in results], ["show version", "config", "show version"])
+        self.assertEqual([result.output for result in results],
+                         ["Version 1.0\r\nBuild 42", "", "Version 1.0\r\nBuild 42"])
+        self.assertTrue(all(result.ok for result in results))
+
+    def test_send_batch_window(self):
+        commands = [f"echo {index}" for index in range(50)]
+        results = self.client.send_batch(commands, PROMPT, timeout=5, window=4)
+        self.assertEqual([result.output for result in results], [str(index) for index in range(50)])
+        self.assertEqual(self.client.device.commands, commands)
+
+    def test_error_pattern(self):
+        results = self.client.send_batch(["grep Error log", "bad command", "show version"], PROMPT,
+                                         timeout=5, error_pattern="Error")
+        # 命令回显中的Error不算失败
+        self.assertEqual([result.error for result in results], [False, True, False])
+        self.assertEqual(results[1].output, "Error: invalid command")
+
+    def test_stop_on_error(self):
+        results = self.client.send_batch(["bad command", "show version", "show version"], PROMPT,
+                                         timeout=5, window=1, error_pattern="Error", stop_on_error=True)
+        self.assertEqual(len(results), 1)
+        self.assertFalse(results[0].ok)
+        self.assertEqual(self.client.device.commands, ["bad command"])
+
+    def test_send_batch_timeout(self):
+        client = LoopbackClient(responses=_responses, delay=1)
+        client.connect()
+        try:
+            results = client.send_batch(["show version", "show version"], PROMPT, timeout=0.2)
+        finally:
+            client.disconnect()
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].timed_out)
+        self.assertIsNone(results[0].output)
+
+    def test_run_script(self):
+        script = """
+        # 注释和空行被忽略
+        show version
+
+        config
+        """
+        results = self.client.run_script(script, PROMPT, timeout=5)
+        self.assertEqual([result.command for result in results], ["show version", "config"])
+        self.assertEqual(results[0].output, "Version 1.0\r\nBuild 42")
+        self.assertEqual(self.client.device.commands, ["show version", "config"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,603 @@
+"""
+抓包文件的批量解析
+
+通过mmap读取pcap或者pcapng文件，只用Python遍历记录头得到每个报文的位置，
+报文头字段使用NumPy按列一次性提取，过滤和统计都是数组运算，千万级的报文可以在几秒内完成校验：
+
+    table = read_capture("traffic.pcap")
+    udp = table.select(ip_proto=17, dst_port=2000, vlan=100)
+    seq = udp.payload_column(0, 4)
+    stats = udp.stream_stats(seq)
+"""
+import mmap
+import socket
+import struct
+import numpy as np
+from .headers import ETHERTYPE_IPV4, ETHERTYPE_VLAN, ETHERTYPE_QINQ, IP_PROTOCOL_TCP, IP_PROTOCOL_UDP
+
+LINKTYPE_ETHERNET = 1
+
+_PCAP_MAGIC = {
+    # magic: (字节序, 每秒的时间戳单位数)
+    b"\xd4\xc3\xb2\xa1": ("<", 10 ** 6),
+    b"\xa1\xb2\xc3\xd4": (">", 10 ** 6),
+    b"\x4d\x3c\xb2\xa1": ("<", 10 ** 9),
+    b"\xa1\xb2\x3c\x4d": (">", 10 ** 9),
+}
+_PCAPNG_SHB = 0x0A0D0D0A
+_PCAPNG_IDB = 1
+_PCAPNG_SPB = 3
+_PCAPNG_EPB = 6
+_PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+_PCAPNG_OPTION_TSRESOL = 9
+
+STREAM_KEYS = ("src_ip", "dst_ip", "ip_proto", "src_port", "dst_port")
+_IP_COLUMNS = ("src_ip", "dst_ip")
+_MAC_COLUMNS = ("da", "sa")
+
+
+class CaptureError(Exception):
+    pass
+
+
+def mac_to_int(mac):
+    return int(mac.replace(":", "").replace("-", ""), 16)
+
+
+def int_to_mac(value):
+    return int(value).to_bytes(6, "big").hex(":").upper()
+
+
+def ip_to_int(ip):
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack("!I", int(value)))
+
+
+class _Index:
+    """
+    报文在文件中的位置和记录头中的信息，连续的相同长度的记录按数组批量添加
+    """
+    def __init__(self):
+        self.chunks = list()
+        self.offsets = list()
+        self.caplens = list()
+        self.wirelens = list()
+        self.timestamps = list()
+        self.interfaces = list()
+        # 每个接口的(链路类型, 每秒的时间戳单位数)
+        self.interface_info = list()
+
+    def add_run(self, offsets, caplens, wirelens, timestamps, interfaces):
+        self.flush()
+        self.chunks.append((offsets, caplens, wirelens, timestamps, interfaces))
+
+    def flush(self):
+        if self.offsets:
+            self.chunks.append((np.array(self.offsets, dtype=np.int64), np.array(self.caplens, dtype=np.uint32),
+                                np.array(self.wirelens, dtype=np.uint32), np.array(self.timestamps, dtype=np.uint64),
+                                np.array(self.interfaces, dtype=np.uint32)))
+            for values in (self.offsets, self.caplens, self.wirelens, self.timestamps, self.interfaces):
+                values.clear()
+
+    def get_columns(self):
+        """
+        :return: (offsets, caplens, wirelens, timestamps, interfaces)
+        """
+        self.flush()
+        if not self.chunks:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32),
+                    np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint32))
+        return tuple(np.concatenate(column) for column in zip(*self.chunks))
+
+
+class _RunScanner:
+    """
+    查找连续的长度相同的记录，这样的记录在文件中等间隔分布，可以用跨步数组一次读取所有记录头，
+    测试仪产生的流量大部分报文长度相同，记录长度变化频繁时逐渐减少尝试的次数
+    """
+    MIN_WINDOW = 64
+    MAX_WINDOW = 1 << 16
+    MAX_BACKOFF = 64
+
+    def __init__(self, buf, byteorder):
+        self.buf = buf
+        self.dtype = np.dtype(byteorder + "u4")
+        self.window = self.MIN_WINDOW
+        self.backoff = 1
+        self.skip = 0
+
+    def field(self, offset, stride, count):
+        """
+        等间隔分布的count个32位整数
+        """
+        return np.ndarray((count, ), dtype=self.dtype, buffer=self.buf, offset=offset, strides=(stride, ))
+
+    def scan(self, offset, stride, checks):
+        """
+        :param checks: [(字段在记录中的偏移量, 值)]，所有字段都等于给定值的记录属于同一个批次
+        :return: 从offset开始的连续记录数，不值得批量处理时返回0
+        """
+        if self.skip > 0:
+            self.skip -= 1
+            return 0
+        count = min((len(self.buf) - offset) // stride, self.window)
+        run = count
+        for field_offset, value in checks:
+            mismatch = np.flatnonzero(self.field(offset + field_offset, stride, run) != value)
+            if len(mismatch):
+                run = int(mismatch[0])
+        if run < 2:
+            self.skip = self.backoff
+            self.backoff = min(self.backoff * 2, self.MAX_BACKOFF)
+            self.window = self.MIN_WINDOW
+            return 0
+        self.backoff = 1
+        if run == count:
+            self.window = min(self.window * 2, self.MAX_WINDOW)
+        return run
+
+
+def _index_pcap(buf):
+    byteorder, resolution = _PCAP_MAGIC[bytes(buf[0:4])]
+    linktype = struct.unpack_from(byteorder + "I", buf, 20)[0] & 0xFFFF
+    index = _Index()
+    index.interface_info.append((linktype, resolution))
+    record = struct.Struct(byteorder + "IIII")
+    unpack_from = record.unpack_from
+    scanner = _RunScanner(buf, byteorder)
+    offsets, caplens, wirelens, timestamps = index.offsets, index.caplens, index.wirelens, index.timestamps
+    interfaces = index.interfaces
+    size = len(buf)
+    offset = 24
+    while offset + record.size <= size:
+        seconds, fraction, caplen, wirelen = unpack_from(buf, offset)
+        stride = record.size + caplen
+        run = scanner.scan(offset, stride, [(8, caplen)])
+        if run:
+            seconds = scanner.field(offset, stride, run).astype(np.uint64)
+            fraction = scanner.field(offset + 4, stride, run)
+            index.add_run(np.arange(run, dtype=np.int64) * stride + (offset + record.size),
+                          np.full(run, caplen, dtype=np.uint32), scanner.field(offset + 12, stride, run).copy(),
+                          seconds * np.uint64(resolution) + fraction, np.zeros(run, dtype=np.uint32))
+            offset += run * stride
+            continue
+        if offset + stride > size:
+            # 文件末尾被截断的报文
+            break
+        offsets.append(offset + record.size)
+        caplens.append(caplen)
+        wirelens.append(wirelen)
+        timestamps.append(seconds * resolution + fraction)
+        interfaces.append(0)
+        offset += stride
+    return index
+
+
+def _get_tsresol(buf, byteorder, start, end):
+    """
+    从接口描述块的选项中读取时间戳精度
+    """
+    offset = start
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(byteorder + "HH", buf, offset)
+        if code == 0:
+            break
+        if code == _PCAPNG_OPTION_TSRESOL and length >= 1:
+            value = buf[offset + 4]
+            return 2 ** (value & 0x7F) if value & 0x80 else 10 ** value
+        offset += 4 + (length + 3) // 4 * 4
+    return 10 ** 6
+
+
+def _index_pcapng(buf):
+    index = _Index()
+    byteorder = None
+    scanner = None
+    section_base = 0
+    offset = 0
+    size = len(buf)
+    while offset + 12 <= size:
+        if byteorder is None or struct.unpack_from(byteorder + "I", buf, offset)[0] == _PCAPNG_SHB:
+            magic = struct.unpack_from("<I", buf, offset + 8)[0]
+            byteorder = "<" if magic == _PCAPNG_BYTE_ORDER_MAGIC else ">"
+            scanner = _RunScanner(buf, byteorder)
+        block_type, block_length = struct.unpack_from(byteorder + "II", buf, offset)
+        if block_length < 12 or offset + block_length > size:
+            break
+        if block_type == _PCAPNG_EPB:
+            interface, high, low, caplen, wirelen = struct.unpack_from(byteorder + "IIIII", buf, offset + 8)
+            run = scanner.scan(offset, block_length, [(0, _PCAPNG_EPB), (4, block_length), (8, interface),
+                                                      (20, caplen)])
+            if run:
+                high = scanner.field(offset + 12, block_length, run).astype(np.uint64)
+                low = scanner.field(offset + 16, block_length, run)
+                index.add_run(np.arange(run, dtype=np.int64) * block_length + (offset + 28),
+                              np.full(run, caplen, dtype=np.uint32),
+                              scanner.field(offset + 24, block_length, run).copy(), (high << np.uint64(32)) | low,
+                              np.full(run, section_base + interface, dtype=np.uint32))
+                offset += run * block_length
+                continue
+            index.offsets.append(offset + 28)
+            index.caplens.append(caplen)
+            index.wirelens.append(wirelen)
+            index.timestamps.append((high << 32) | low)
+            index.interfaces.append(section_base + interface)
+        elif block_type == _PCAPNG_SHB:
+            # 新的段重新开始接口编号
+            section_base = len(index.interface_info)
+        elif block_type == _PCAPNG_IDB:
+            linktype = struct.unpack_from(byteorder + "H", buf, offset + 8)[0]
+            resolution = _get_tsresol(buf, byteorder, offset + 16, offset + block_length - 4)
+            index.interface_info.append((linktype, resolution))
+        elif block_type == _PCAPNG_SPB:
+            wirelen = struct.unpack_from(byteorder + "I", buf, offset + 8)[0]
+            index.offsets.append(offset + 12)
+            index.caplens.append(min(wirelen, block_length - 16))
+            index.wirelens.append(wirelen)
+            # 简单报文块没有时间戳
+            index.timestamps.append(0)
+            index.interfaces.append(section_base)
+        offset += block_length
+    return index
+
+
+def _read_be(buf, offsets, size, valid):
+    """
+    按大端序读取每个报文指定位置的整数，valid为False的行为0
+    """
+    offsets = np.where(valid, offsets, 0)
+    dtype = _uint_type(size)
+    ret = np.zeros(len(offsets), dtype=dtype)
+    for i in range(size):
+        ret = (ret << dtype(8)) | buf[offsets + i].astype(dtype)
+    ret[~valid] = 0
+    return ret
+
+
+def _uint_type(size):
+    return np.uint64 if size > 4 else np.uint32 if size > 2 else np.uint16 if size > 1 else np.uint8
+
+
+def _field(block, offset, size, valid):
+    """
+    从报文头块中按大端序读取所有报文相同位置的整数
+    """
+    data = block[:, offset: offset + size]
+    dtype = _uint_type(size)
+    ret = data[:, 0].astype(dtype)
+    for i in range(1, size):
+        ret = (ret << dtype(8)) | data[:, i]
+    ret[~valid] = 0
+    return ret
+
+
+def _align(block, offset, width):
+    """
+    把每一行从offset开始的width个字节对齐到新数组的第0列，
+    offset超出报文头块时取最后width个字节，调用者根据报文长度判断字段是否有效
+    """
+    flat = block.reshape(-1)
+    windows = np.lib.stride_tricks.as_strided(flat, shape=(len(flat) - width + 1, width), strides=(1, 1),
+                                              writeable=False)
+    offset = np.minimum(offset, _HEADER_SIZE - width)
+    return windows[np.arange(len(block)) * _HEADER_SIZE + offset]
+
+
+# 一次读取每个报文开头的字节数，足够包含两层VLAN标签、带选项的IPv4报文头和TCP报文头
+_HEADER_SIZE = 128
+_CHUNK_ROWS = 1 << 16
+_COLUMN_TYPES = (("da", np.uint64), ("sa", np.uint64), ("ethertype", np.uint16), ("vlan", np.int32),
+                 ("inner_vlan", np.int32), ("ip_len", np.uint16), ("ttl", np.uint8), ("ip_proto", np.uint8),
+                 ("src_ip", np.uint32), ("dst_ip", np.uint32), ("src_port", np.uint16), ("dst_port", np.uint16),
+                 ("tcp_flags", np.uint16), ("payload_offset", np.uint32))
+
+
+def _get_header_block(buf, windows, start):
+    """
+    每个报文开头的固定长度复制到二维数组中，后续的字段读取都在这个小数组上进行
+    :param windows: buf上的滑动窗口视图，每一行是从该位置开始的_HEADER_SIZE个字节
+    """
+    tail = start >= len(windows)
+    if len(windows):
+        block = windows[np.where(tail, 0, start)]
+    else:
+        # 文件比一个窗口还小
+        block = np.zeros((len(start), _HEADER_SIZE), dtype=np.uint8)
+    if tail.any():
+        # 文件末尾不足一个窗口的报文逐字节读取
+        positions = start[tail, None] + np.arange(_HEADER_SIZE)
+        block[tail] = buf[np.minimum(positions, len(buf) - 1)]
+    return block
+
+
+def _decode_headers(block, length, linktype, columns):
+    """
+    解析一批报文的报文头，写入columns中对应的切片
+    """
+    count = len(block)
+    length = np.minimum(length.astype(np.int64), _HEADER_SIZE)
+
+    # 二层: 目的MAC、源MAC、最多两层VLAN标签
+    valid = (linktype == LINKTYPE_ETHERNET) & (length >= 14)
+    columns["da"][:] = _field(block, 0, 6, valid)
+    columns["sa"][:] = _field(block, 6, 6, valid)
+    ethertype = _field(block, 12, 2, valid)
+    l3 = np.full(count, 14, dtype=np.int64)
+    for name in ("vlan", "inner_vlan"):
+        tagged = valid & ((ethertype == ETHERTYPE_VLAN) | (ethertype == ETHERTYPE_QINQ)) & (length - l3 >= 4)
+        tag = _align(block, l3, 4)
+        columns[name][:] = np.where(tagged, _field(tag, 0, 2, tagged).astype(np.int32) & 0xFFF, -1)
+        ethertype = np.where(tagged, _field(tag, 2, 2, tagged), ethertype)
+        l3 = np.where(tagged, l3 + 4, l3)
+    columns["ethertype"][:] = ethertype
+
+    # 三层: IPv4，先把每个报文的三层报文头对齐到同一列
+    ipv4 = valid & (ethertype == ETHERTYPE_IPV4) & (length - l3 >= 20)
+    ip_block = _align(block, l3, 20)
+    ihl = (_field(ip_block, 0, 1, ipv4) & 0xF).astype(np.int64) * 4
+    columns["ip_len"][:] = _field(ip_block, 2, 2, ipv4)
+    fragment = _field(ip_block, 6, 2, ipv4) & 0x1FFF
+    columns["ttl"][:] = _field(ip_block, 8, 1, ipv4)
+    ip_proto = _field(ip_block, 9, 1, ipv4)
+    columns["ip_proto"][:] = ip_proto
+    columns["src_ip"][:] = _field(ip_block, 12, 4, ipv4)
+    columns["dst_ip"][:] = _field(ip_block, 16, 4, ipv4)
+
+    # 四层: UDP和TCP的端口，分片报文的后续分片没有四层报文头
+    l4 = l3 + ihl
+    udp = ipv4 & (ip_proto == IP_PROTOCOL_UDP) & (fragment == 0) & (length - l4 >= 8)
+    tcp = ipv4 & (ip_proto == IP_PROTOCOL_TCP) & (fragment == 0) & (length - l4 >= 20)
+    has_l4 = udp | tcp
+    l4_block = _align(block, l4, 14)
+    columns["src_port"][:] = _field(l4_block, 0, 2, has_l4)
+    columns["dst_port"][:] = _field(l4_block, 2, 2, has_l4)
+    flags = _field(l4_block, 12, 2, tcp)
+    columns["tcp_flags"][:] = flags & 0x1FF
+    payload = np.where(udp, l4 + 8, np.where(tcp, l4 + (flags >> 12).astype(np.int64) * 4, np.where(ipv4, l4, l3)))
+    columns["payload_offset"][:] = payload
+
+
+def _decode(buf, index):
+    start, caplen, wirelen, raw_ts, interface = index.get_columns()
+    count = len(start)
+    columns = dict()
+    columns["caplen"] = caplen
+    columns["wirelen"] = wirelen
+
+    # 每个接口的时间戳转换为纳秒
+    timestamp = np.zeros(count, dtype=np.int64)
+    linktype = np.zeros(count, dtype=np.uint16)
+    for i, (link, resolution) in enumerate(index.interface_info):
+        mask = interface == i
+        linktype[mask] = link
+        if 10 ** 9 % resolution == 0:
+            timestamp[mask] = raw_ts[mask].astype(np.int64) * (10 ** 9 // resolution)
+        else:
+            timestamp[mask] = (raw_ts[mask].astype(np.float64) * (10 ** 9 / resolution)).astype(np.int64)
+    columns["timestamp"] = timestamp
+    columns["interface"] = interface
+
+    for name, dtype in _COLUMN_TYPES:
+        columns[name] = np.zeros(count, dtype=dtype)
+    size = max(len(buf) - _HEADER_SIZE + 1, 0)
+    windows = np.lib.stride_tricks.as_strided(buf, shape=(size, _HEADER_SIZE), strides=(1, 1), writeable=False)
+    # 分批解析，限制临时数组占用的内存
+    for first in range(0, count, _CHUNK_ROWS):
+        last = min(first + _CHUNK_ROWS, count)
+        _decode_headers(_get_header_block(buf, windows, start[first: last]), caplen[first: last],
+                        linktype[first: last], {name: columns[name][first: last] for name, _ in _COLUMN_TYPES})
+    # 报文长度不足时载荷的位置不超过报文末尾
+    np.minimum(columns["payload_offset"], caplen, out=columns["payload_offset"])
+    return start, columns
+
+
+class CaptureTable:
+    """
+    按列保存的报文头字段，每一列是长度相同的NumPy数组，没有的字段为0，没有VLAN标签时vlan为-1
+    :param buffer: 抓包文件的数据，payload_column从中读取报文内容
+    :param starts: 每个报文在buffer中的起始位置
+    使用结束后调用close释放文件映射，也可以使用with语句，filter得到的表共享同一个映射
+    """
+    def __init__(self, buffer, starts, columns):
+        self.buffer = buffer
+        self.starts = starts
+        self.columns = columns
+
+    def close(self):
+        if self.buffer is not None and hasattr(self.buffer, "close"):
+            self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns", None)
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @property
+    def column_names(self):
+        return list(self.columns.keys())
+
+    def filter(self, mask):
+        """
+        :param mask: 布尔数组或者序号数组
+        :return: 只包含选中报文的新表
+        """
+        return CaptureTable(self.buffer, self.starts[mask],
+                            {name: column[mask] for name, column in self.columns.items()})
+
+    def mask(self, **conditions):
+        """
+        字段等于给定值的布尔数组，值为列表或者元组时匹配其中任意一个，
+        IP地址和MAC地址可以使用字符串
+        """
+        ret = np.ones(len(self), dtype=bool)
+        for name, value in conditions.items():
+            column = self.columns[name]
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            values = [_to_column_value(name, v) for v in values]
+            if len(values) == 1:
+                ret &= column == values[0]
+            else:
+                ret &= np.isin(column, values)
+        return ret
+
+    def select(self, **conditions):
+        return self.filter(self.mask(**conditions))
+
+    def payload_column(self, offset, size=4, byteorder="big"):
+        """
+        读取每个报文载荷中固定位置的整数，例如测试仪写入的序列号，
+        报文长度不足时为0
+        :param offset: 相对于最内层报文头之后的载荷的偏移量
+        """
+        buf = np.frombuffer(self.buffer, dtype=np.uint8)
+        position = self.columns["payload_offset"].astype(np.int64) + offset
+        valid = position + size <= self.columns["caplen"]
+        ret = _read_be(buf, self.starts + position, size, valid)
+        if byteorder == "little":
+            ret = ret.byteswap()
+            if size not in (1, 2, 4, 8):
+                ret >>= (ret.itemsize - size) * 8
+        return ret
+
+    def group(self, keys=STREAM_KEYS):
+        """
+        按照字段分组
+        :return: (每组的键, 每个报文的组序号, 每组的报文数)，键是字段名到数组的字典
+        """
+        if len(self) == 0:
+            return {key: self.columns[key][:0] for key in keys}, np.zeros(0, dtype=np.int64), \
+                np.zeros(0, dtype=np.int64)
+        columns = [self.columns[key] for key in keys]
+        order = np.lexsort(columns[::-1])
+        boundary = np.zeros(len(order), dtype=bool)
+        boundary[0] = True
+        for column in columns:
+            sorted_column = column[order]
+            boundary[1:] |= sorted_column[1:] != sorted_column[:-1]
+        group_sorted = np.cumsum(boundary) - 1
+        inverse = np.empty(len(order), dtype=np.int64)
+        inverse[order] = group_sorted
+        first = order[boundary]
+        counts = np.bincount(group_sorted)
+        return {key: column[first] for key, column in zip(keys, columns)}, inverse, counts
+
+    def stream_counts(self, keys=STREAM_KEYS):
+        """
+        :return: 字段名到数组的字典，包含每个流的键和frames(报文数)
+        """
+        ret, _, counts = self.group(keys)
+        ret["frames"] = counts
+        return ret
+
+    def stream_stats(self, sequence, keys=STREAM_KEYS):
+        """
+        根据序列号统计每个流的丢包、重复和乱序，报文按照抓包顺序处理
+        :param sequence: 每个报文的序列号，通常由payload_column读取
+        :return: 字段名到数组的字典，包含每个流的键以及frames, first_seq, last_seq,
+                 lost(序列号范围内没有收到的个数), duplicated(重复的报文数), reordered(序列号小于之前最大值的报文数)
+        """
+        ret, inverse, counts = self.group(keys)
+        group_count = len(counts)
+        sequence = np.asarray(sequence).astype(np.int64)
+        if group_count == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            ret.update(frames=counts, first_seq=empty, last_seq=empty, lost=empty, duplicated=empty,
+                       reordered=empty)
+            return ret
+        # 同一个流中的报文保持抓包顺序
+        order = np.lexsort((np.arange(len(self)), inverse))
+        group_sorted = inverse[order]
+        seq_sorted = sequence[order]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        # 加上按组递增的偏移量后在整个数组上计算累计最大值，各组之间互不影响
+        span = int(sequence.max() - sequence.min()) + 1 if len(sequence) else 1
+        shifted = (seq_sorted - sequence.min()) + group_sorted * span
+        running_max = np.maximum.accumulate(shifted)
+        reordered = np.zeros(len(order), dtype=bool)
+        reordered[1:] = shifted[1:] < running_max[:-1]
+
+        first_seq = np.minimum.reduceat(seq_sorted, starts)
+        last_seq = np.maximum.reduceat(seq_sorted, starts)
+        by_value = np.lexsort((seq_sorted, group_sorted))
+        value_sorted = seq_sorted[by_value]
+        group_by_value = group_sorted[by_value]
+        distinct = np.ones(len(order), dtype=bool)
+        distinct[1:] = (value_sorted[1:] != value_sorted[:-1]) | (group_by_value[1:] != group_by_value[:-1])
+        unique = np.bincount(group_by_value, weights=distinct, minlength=group_count).astype(np.int64)
+
+        ret["frames"] = counts
+        ret["first_seq"] = first_seq
+        ret["last_seq"] = last_seq
+        ret["lost"] = last_seq - first_seq + 1 - unique
+        ret["duplicated"] = counts - unique
+        ret["reordered"] = np.bincount(group_sorted, weights=reordered, minlength=group_count).astype(np.int64)
+        return ret
+
+
+def _to_column_value(name, value):
+    if isinstance(value, str):
+        if name in _IP_COLUMNS:
+            return ip_to_int(value)
+        if name in _MAC_COLUMNS:
+            return mac_to_int(value)
+    return value
+
+
+def to_records(stats):
+    """
+    把按列的统计结果转换为字典列表，IP地址和MAC地址转换为字符串，用于输出报告
+    """
+    names = list(stats.keys())
+    ret = list()
+    for row in zip(*[stats[name].tolist() for name in names]):
+        record = dict(zip(names, row))
+        for name in _IP_COLUMNS:
+            if name in record:
+                record[name] = int_to_ip(record[name])
+        for name in _MAC_COLUMNS:
+            if name in record:
+                record[name] = int_to_mac(record[name])
+        ret.append(record)
+    return ret
+
+
+def read_capture(filename):
+    """
+    读取pcap或者pcapng文件，只支持以太网链路的报文头解析，其他链路类型的报文只有长度和时间戳
+    :return: CaptureTable
+    """
+    with open(filename, "rb") as file:
+        try:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise CaptureError(f"{filename} is empty")
+    try:
+        magic = bytes(buffer[0:4])
+        if magic in _PCAP_MAGIC:
+            index = _index_pcap(buffer)
+        elif len(buffer) >= 12 and struct.unpack_from("<I", buffer, 0)[0] == _PCAPNG_SHB:
+            index = _index_pcapng(buffer)
+        else:
+            raise CaptureError(f"{filename} is not a pcap or pcapng file")
+        starts, columns = _decode(np.frombuffer(buffer, dtype=np.uint8), index)
+    except Exception:
+        buffer.close()
+        raise
+    return CaptureTable(buffer, starts, columns)
@@ -9,19 +9,28 @@ class MacAddress:
         self.parse(value)
 
     def parse(self, value):
-        if isinstance(value, bytes):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            # memoryview保存为切片，不复制报文数据
             self._mac_bytes = value
         if isinstance(value, str):
-            self._mac_bytes = bytes.fromhex(value.replace(":", ""))
+            self._mac_bytes = bytes.fromhex(value.replace(":", "").replace("-", ""))
 
     def __repr__(self):
         if self._mac_bytes:
-            return ":".join(["%02X" % x for x in self._mac_bytes])
+            return bytes(self._mac_bytes).hex(":").upper()
         else:
             return ""
 
+    def __eq__(self, other):
+        if isinstance(other, MacAddress):
+            return bytes(self._mac_bytes) == bytes(other._mac_bytes)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(bytes(self._mac_bytes))
+
     def to_bytes(self):
-        return self._mac_bytes
+        return bytes(self._mac_bytes)
 
 
 class Ethernet:
@@ -39,6 +48,8 @@ class Ethernet:
     def parse(self, value):
         if isinstance(value, str):
             value = bytes.fromhex(value)
+        # 字段是原始报文的memoryview切片，解析时不复制数据
+        value = memoryview(value)
         self.da = MacAddress(value[0:6])
         self.sa = MacAddress(value[6:12])
         self.protocol = value[12:14]
@@ -46,13 +57,7 @@ class Ethernet:
         self.checksum = value[-4:]
 
     def to_bytes(self):
-        ret = b''
-        ret = ret + self.da.to_bytes()
-        ret = ret + self.sa.to_bytes()
-        ret = ret + self.protocol
-        ret = ret + self.payload
-        ret = ret + self.checksum
-        return ret
+        return b"".join((self.da.to_bytes(), self.sa.to_bytes(), self.protocol, self.payload, self.checksum))
 
 
 
@@ -60,7 +65,7 @@ class SerializableObject(metaclass=ABCMeta):
 
     def __init__(self, value):
         self.raw_data = value
-        self.parse()
+        self.parse(value)
 
     @abstractmethod
     def parse(self, value):
@@ -86,7 +91,7 @@ class TlvType(SerializableObject):
     def to_bytes(self):
         rv = b''
         rv += self.type.to_bytes(length=2, byteorder='big')
-        rv += self.type.to_bytes(length=2, byteorder='big')
+        rv += self.length.to_bytes(length=2, byteorder='big')
         return rv
 
 
@@ -116,15 +121,15 @@ class Properties(TlvType):
 
 
 class PropertiesType10(TlvType):
-    def __int__(self, value):
+    def __init__(self, value):
         super().__init__(value)
 
     def parse(self, value):
         super().parse(value)
         if self.type == 1:
-            self.body = int.from_bytes(value[4: 4 + self.length])
+            self.body = int.from_bytes(value[4: 4 + self.length], byteorder='big')
         elif self.type == 2:
-            self.body = value[4: 4 + self.length].decode()
+            self.body = bytes(value[4: 4 + self.length]).decode()
         else:
             raise Exception(f"Unknown type {self.type}")
 
@@ -0,0 +1,417 @@
+"""
+基于memoryview的零拷贝报文解析和构造
+
+报文头对象只保存缓冲区和偏移量，字段在访问时通过struct从缓冲区中解码，
+可写的缓冲区(bytearray)可以直接修改字段。
+FrameView按需解析以太网、VLAN、IPv4以及UDP/TCP报文头，
+FrameBuilder在预先分配的缓冲区中构造报文，重复使用时不需要分配内存
+"""
+import socket
+import struct
+from .ethernet import MacAddress
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+ETHERTYPE_QINQ = 0x88A8
+IP_PROTOCOL_TCP = 6
+IP_PROTOCOL_UDP = 17
+
+_UINT8 = struct.Struct("!B")
+_UINT16 = struct.Struct("!H")
+_UINT32 = struct.Struct("!I")
+
+
+class _Field:
+    """
+    报文头中的整数字段，可以是某个整数中的若干位
+    """
+    __slots__ = ("struct", "offset", "shift", "mask")
+
+    def __init__(self, fmt, offset, shift=0, mask=None):
+        self.struct = fmt
+        self.offset = offset
+        self.shift = shift
+        self.mask = mask
+
+    def __get__(self, header, owner):
+        if header is None:
+            return self
+        value = self.struct.unpack_from(header._buf, header._offset + self.offset)[0]
+        if self.mask is not None:
+            value = (value >> self.shift) & self.mask
+        return value
+
+    def __set__(self, header, value):
+        offset = header._offset + self.offset
+        if self.mask is not None:
+            current = self.struct.unpack_from(header._buf, offset)[0]
+            value = (current & ~(self.mask << self.shift)) | ((value & self.mask) << self.shift)
+        self.struct.pack_into(header._buf, offset, value)
+
+
+class _MacField:
+    __slots__ = ("offset", )
+
+    def __init__(self, offset):
+        self.offset = offset
+
+    def __get__(self, header, owner):
+        if header is None:
+            return self
+        offset = header._offset + self.offset
+        return MacAddress(header._buf[offset: offset + 6])
+
+    def __set__(self, header, value):
+        if not isinstance(value, MacAddress):
+            value = MacAddress(value)
+        offset = header._offset + self.offset
+        header._buf[offset: offset + 6] = value.to_bytes()
+
+
+class _IPv4Field:
+    __slots__ = ("offset", )
+
+    def __init__(self, offset):
+        self.offset = offset
+
+    def __get__(self, header, owner):
+        if header is None:
+            return self
+        offset = header._offset + self.offset
+        return socket.inet_ntoa(header._buf[offset: offset + 4])
+
+    def __set__(self, header, value):
+        offset = header._offset + self.offset
+        if isinstance(value, int):
+            _UINT32.pack_into(header._buf, offset, value)
+        else:
+            header._buf[offset: offset + 4] = socket.inet_aton(value)
+
+
+def internet_checksum(data, initial=0):
+    """
+    计算16位反码和校验和
+    """
+    if len(data) % 2:
+        data = bytes(data) + b"\x00"
+    total = initial + sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+class Header:
+    """
+    报文头的基类
+    :param buffer: bytes、bytearray或者memoryview，修改字段需要可写的缓冲区
+    :param offset: 报文头在缓冲区中的偏移量
+    """
+    __slots__ = ("_buf", "_offset")
+    length = 0
+
+    def __init__(self, buffer, offset=0):
+        self._buf = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+        self._offset = offset
+
+    @property
+    def offset(self):
+        return self._offset
+
+    @property
+    def header_length(self):
+        return self.length
+
+    @property
+    def end(self):
+        return self._offset + self.header_length
+
+    def to_bytes(self):
+        return bytes(self._buf[self._offset: self.end])
+
+
+class EthernetHeader(Header):
+    __slots__ = ()
+    length = 14
+    da = _MacField(0)
+    sa = _MacField(6)
+    ethertype = _Field(_UINT16, 12)
+
+
+class VlanHeader(Header):
+    """
+    VLAN标签，从TPID之后的TCI开始
+    """
+    __slots__ = ()
+    length = 4
+    tci = _Field(_UINT16, 0)
+    pcp = _Field(_UINT16, 0, 13, 0x7)
+    dei = _Field(_UINT16, 0, 12, 0x1)
+    vid = _Field(_UINT16, 0, 0, 0xFFF)
+    ethertype = _Field(_UINT16, 2)
+
+
+class IPv4Header(Header):
+    __slots__ = ()
+    length = 20
+    version = _Field(_UINT8, 0, 4, 0xF)
+    ihl = _Field(_UINT8, 0, 0, 0xF)
+    tos = _Field(_UINT8, 1)
+    total_length = _Field(_UINT16, 2)
+    identification = _Field(_UINT16, 4)
+    flags = _Field(_UINT16, 6, 13, 0x7)
+    fragment_offset = _Field(_UINT16, 6, 0, 0x1FFF)
+    ttl = _Field(_UINT8, 8)
+    protocol = _Field(_UINT8, 9)
+    checksum = _Field(_UINT16, 10)
+    src = _IPv4Field(12)
+    dst = _IPv4Field(16)
+    src_int = _Field(_UINT32, 12)
+    dst_int = _Field(_UINT32, 16)
+
+    @property
+    def header_length(self):
+        return self.ihl * 4
+
+    def update_checksum(self):
+        self.checksum = 0
+        self.checksum = internet_checksum(self._buf[self._offset: self.end])
+
+
+class UdpHeader(Header):
+    __slots__ = ()
+    length = 8
+    src_port = _Field(_UINT16, 0)
+    dst_port = _Field(_UINT16, 2)
+    udp_length = _Field(_UINT16, 4)
+    checksum = _Field(_UINT16, 6)
+
+
+class TcpHeader(Header):
+    __slots__ = ()
+    length = 20
+    src_port = _Field(_UINT16, 0)
+    dst_port = _Field(_UINT16, 2)
+    seq = _Field(_UINT32, 4)
+    ack = _Field(_UINT32, 8)
+    data_offset = _Field(_UINT8, 12, 4, 0xF)
+    flags = _Field(_UINT16, 12, 0, 0x1FF)
+    window = _Field(_UINT16, 14)
+    checksum = _Field(_UINT16, 16)
+    urgent = _Field(_UINT16, 18)
+
+    @property
+    def header_length(self):
+        return self.data_offset * 4
+
+
+class FrameView:
+    """
+    以太网帧的零拷贝视图，报文头在第一次访问时解析
+    :param has_fcs: 帧的最后4个字节是FCS
+    """
+    __slots__ = ("buffer", "has_fcs", "_ethernet", "_vlans", "_ethertype", "_l3_offset", "_ipv4", "_l4")
+
+    def __init__(self, buffer, has_fcs=False):
+        self.buffer = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+        self.has_fcs = has_fcs
+        self._ethernet = None
+        self._vlans = None
+        self._ethertype = None
+        self._l3_offset = None
+        self._ipv4 = False
+        self._l4 = False
+
+    @property
+    def ethernet(self):
+        if self._ethernet is None:
+            self._ethernet = EthernetHeader(self.buffer)
+        return self._ethernet
+
+    def __decode_l2(self):
+        vlans = list()
+        ethertype = self.ethernet.ethertype
+        offset = EthernetHeader.length
+        while ethertype in (ETHERTYPE_VLAN, ETHERTYPE_QINQ) and offset + VlanHeader.length <= len(self.buffer):
+            vlan = VlanHeader(self.buffer, offset)
+            vlans.append(vlan)
+            ethertype = vlan.ethertype
+            offset = vlan.end
+        self._vlans = vlans
+        self._ethertype = ethertype
+        self._l3_offset = offset
+
+    @property
+    def vlans(self):
+        if self._vlans is None:
+            self.__decode_l2()
+        return self._vlans
+
+    @property
+    def ethertype(self):
+        """
+        VLAN标签之后的协议类型
+        """
+        if self._vlans is None:
+            self.__decode_l2()
+        return self._ethertype
+
+    @property
+    def ipv4(self):
+        if self._ipv4 is False:
+            self._ipv4 = None
+            if self.ethertype == ETHERTYPE_IPV4 and self._l3_offset + IPv4Header.length <= len(self.buffer):
+                self._ipv4 = IPv4Header(self.buffer, self._l3_offset)
+        return self._ipv4
+
+    @property
+    def l4(self):
+        """
+        UDP或者TCP报文头，分片报文的后续分片没有四层报文头
+        """
+        if self._l4 is False:
+            self._l4 = None
+            ip = self.ipv4
+            if ip is not None and ip.fragment_offset == 0:
+                header_class = {IP_PROTOCOL_UDP: UdpHeader, IP_PROTOCOL_TCP: TcpHeader}.get(ip.protocol, None)
+                if header_class is not None and ip.end + header_class.length <= len(self.buffer):
+                    self._l4 = header_class(self.buffer, ip.end)
+        return self._l4
+
+    @property
+    def udp(self):
+        return self.l4 if isinstance(self.l4, UdpHeader) else None
+
+    @property
+    def tcp(self):
+        return self.l4 if isinstance(self.l4, TcpHeader) else None
+
+    @property
+    def payload(self):
+        """
+        最内层报文头之后的数据，IPv4报文按照总长度去掉填充和FCS
+        """
+        end = len(self.buffer) - 4 if self.has_fcs else len(self.buffer)
+        ip = self.ipv4
+        if ip is None:
+            return self.buffer[self._l3_offset: end]
+        end = min(end, ip.offset + ip.total_length)
+        start = self.l4.end if self.l4 is not None else ip.end
+        return self.buffer[start: end]
+
+
+class FrameBuilder:
+    """
+    在预先分配的缓冲区中逐层构造报文，build返回的memoryview在reset之前有效
+
+        builder = FrameBuilder()
+        frame = builder.reset().ethernet(da, sa).vlan(100).ipv4(src, dst).udp(1000, 2000).payload(data).build()
+    """
+    MIN_FRAME_SIZE = 60
+
+    def __init__(self, size=1518):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.length = 0
+        self._ipv4 = None
+        self._l4 = None
+
+    def reset(self):
+        self.length = 0
+        self._ipv4 = None
+        self._l4 = None
+        return self
+
+    def __append(self, length):
+        offset = self.length
+        if offset + length > len(self.buffer):
+            raise ValueError(f"Frame exceeds the buffer size {len(self.buffer)}")
+        self.view[offset: offset + length] = bytes(length)
+        self.length = offset + length
+        return offset
+
+    def __set_ethertype(self, ethertype):
+        # 上一层的协议类型字段总是位于当前末尾之前的2个字节
+        _UINT16.pack_into(self.buffer, self.length - 2, ethertype)
+
+    def ethernet(self, da, sa, ethertype=ETHERTYPE_IPV4):
+        header = EthernetHeader(self.view, self.__append(EthernetHeader.length))
+        header.da = da
+        header.sa = sa
+        header.ethertype = ethertype
+        return self
+
+    def vlan(self, vid, pcp=0, dei=0, tpid=ETHERTYPE_VLAN, ethertype=ETHERTYPE_IPV4):
+        self.__set_ethertype(tpid)
+        header = VlanHeader(self.view, self.__append(VlanHeader.length))
+        header.tci = ((pcp & 0x7) << 13) | ((dei & 0x1) << 12) | (vid & 0xFFF)
+        header.ethertype = ethertype
+        return self
+
+    def ipv4(self, src, dst, ttl=64, tos=0, identification=0, flags=0x2):
+        self.__set_ethertype(ETHERTYPE_IPV4)
+        header = IPv4Header(self.view, self.__append(IPv4Header.length))
+        header.version = 4
+        header.ihl = 5
+        header.tos = tos
+        header.identification = identification
+        header.flags = flags
+        header.ttl = ttl
+        header.src = src
+        header.dst = dst
+        self._ipv4 = header
+        return self
+
+    def udp(self, src_port, dst_port):
+        header = UdpHeader(self.view, self.__append(UdpHeader.length))
+        header.src_port = src_port
+        header.dst_port = dst_port
+        self._ipv4.protocol = IP_PROTOCOL_UDP
+        self._l4 = header
+        return self
+
+    def tcp(self, src_port, dst_port, seq=0, ack=0, flags=0x18, window=65535):
+        header = TcpHeader(self.view, self.__append(TcpHeader.length))
+        header.src_port = src_port
+        header.dst_port = dst_port
+        header.seq = seq
+        header.ack = ack
+        header.data_offset = 5
+        header.flags = flags
+        header.window = window
+        self._ipv4.protocol = IP_PROTOCOL_TCP
+        self._l4 = header
+        return self
+
+    def payload(self, data):
+        offset = self.__append(len(data))
+        self.view[offset: self.length] = data
+        return self
+
+    def build(self, pad=True):
+        """
+        填写长度和校验和
+        :param pad: 不足60字节(不含FCS)时填充0
+        :return: 缓冲区中报文部分的memoryview
+        """
+        ip = self._ipv4
+        if ip is not None:
+            ip.total_length = self.length - ip.offset
+            ip.update_checksum()
+            if self._l4 is not None:
+                l4_length = self.length - self._l4.offset
+                if isinstance(self._l4, UdpHeader):
+                    self._l4.udp_length = l4_length
+                # 伪首部: 源地址、目的地址、协议、四层长度
+                src, dst = ip.src_int, ip.dst_int
+                pseudo = (src >> 16) + (src & 0xFFFF) + (dst >> 16) + (dst & 0xFFFF) + ip.protocol + l4_length
+                self._l4.checksum = 0
+                checksum = internet_checksum(self.view[self._l4.offset: self.length], pseudo)
+                if isinstance(self._l4, UdpHeader) and checksum == 0:
+                    checksum = 0xFFFF
+                self._l4.checksum = checksum
+        if pad and self.length < self.MIN_FRAME_SIZE:
+            self.__append(self.MIN_FRAME_SIZE - self.length)
+        return self.view[:self.length]
+
+    def to_bytes(self, pad=True):
+        return bytes(self.build(pad))
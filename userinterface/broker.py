@@ -0,0 +1,34 @@
+import os
+import sys
+
+package_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(package_path, ".."))
+
+import argparse
+from controller.manager import load_settings
+from core.resource.broker import ResourceBroker
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-s", "--setting", type=str, dest="setting",
+                    help="The Base Test Setting Path", required=False)
+parser.add_argument("-r", "--resource", type=str, dest="resource",
+                    help="Test Resource file", required=True)
+parser.add_argument("-u", "--user", type=str, dest="user",
+                    help="User Name", required=True)
+parser.add_argument("-k", "--socket", type=str, dest="socket",
+                    help="The UNIX socket path of the broker", required=True)
+parser.add_argument("-l", "--lease-time", type=int, dest="lease_time",
+                    help="Lease time of the device reservation in seconds", required=False)
+
+args = parser.parse_args()
+
+
+if __name__ == '__main__':
+    load_settings(args.setting)
+    broker = ResourceBroker(args.resource, args.socket, args.user, args.lease_time)
+    print(f"Resource broker is serving {args.resource} on {args.socket}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,28 @@
+import os
+import sys
+
+package_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(package_path, ".."))
+
+import argparse
+from controller.manager import merge_results
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-i", "--input", type=str, dest="input", nargs="+",
+                    help="The result files of each shard", required=True)
+parser.add_argument("-o", "--output", type=str, dest="output",
+                    help="The merged result file", required=True)
+parser.add_argument("-t", "--testlist", type=str, dest="testlist",
+                    help="The test list of the shards, the merged cases follow its order", required=False)
+
+args = parser.parse_args()
+
+
+if __name__ == '__main__':
+    testlist = os.path.abspath(args.testlist) if args.testlist else None
+    merged = merge_results(args.input, args.output, testlist)
+    print(merged.to_text())
+    tp_stats = merged.get_test_point_stats()
+    print(f"PASS: {tp_stats[0]}, FAIL: {tp_stats[1]}")
+    print(f"ERROR: {tp_stats[2]}, WARNING: {tp_stats[3]}, EXCEPTION: {tp_stats[4]}")
@@ -80,3 +80,11 @@ class TestResourceApi(Resource):
         except Exception as ex:
             return _get_response(False, str(ex), 500)
 
+
+
+@name_space.route("/progress")
+class ProgressApi(Resource):
+
+    @name_space.response(200, "Test Progress")
+    def get(self):
+        return make_response(jsonify(get_progress()), 200)
@@ -14,17 +14,46 @@ parser.add_argument("-s", "--setting", type=str, dest="setting",
 parser.add_argument("-t", "--testlist", type=str, dest="testlist",
                     help="Test list file", required=True)
 parser.add_argument("-r", "--resource", type=str, dest="resource",
-                    help="Test Resource file", required=True)
+                    help="Test Resource file", required=False)
+parser.add_argument("-b", "--broker", type=str, dest="broker",
+                    help="The socket of the resource broker, used instead of the resource file", required=False)
 parser.add_argument("-u", "--user", type=str, dest="user",
                     help="User Name", required=True)
+parser.add_argument("-c", "--checkpoint", type=str, dest="checkpoint",
+                    help="Resume from the checkpoint journal", required=False)
+parser.add_argument("-f", "--rerun-failed", type=str, dest="rerun_failed",
+                    help="Only run the failed cases in the previous result file", required=False)
+parser.add_argument("--shard-index", type=int, dest="shard_index",
+                    help="The shard index to run, start from 0", required=False)
+parser.add_argument("--shard-count", type=int, dest="shard_count",
+                    help="Total shard count", required=False)
+parser.add_argument("--shard-weights", type=str, dest="shard_weights",
+                    help="Case duration file used to balance the shards", required=False)
+parser.add_argument("-o", "--output", type=str, dest="output",
+                    help="Save the test result to file", required=False)
 
 args = parser.parse_args()
+if not args.resource and not args.broker:
+    parser.error("one of the arguments -r/--resource -b/--broker is required")
+if (args.shard_index is None) != (args.shard_count is None):
+    parser.error("the arguments --shard-index and --shard-count must be used together")
+if args.shard_count is not None and not 0 <= args.shard_index < args.shard_count:
+    parser.error("--shard-index must be in the range [0, --shard-count)")
 
 load_settings(args.setting)
 init_engine()
-load_resource(args.resource, args.user)
+load_resource(args.resource, args.user, args.broker)
 load_test_list(args.testlist)
+if args.rerun_failed:
+    filter_failed_test(args.rerun_failed)
+if args.shard_count is not None:
+    select_shard(args.shard_index, args.shard_count, args.shard_weights)
 
 
 if __name__ == '__main__':
-    run_test()
+    if args.checkpoint:
+        resume_test(args.checkpoint)
+    else:
+        run_test()
+    if args.output:
+        save_result(args.output)